@@ -1,9 +1,51 @@
+"""UART → UDP relay.
+
+Reads the sounder's serial stream in large chunks, cuts it into checked frames
+(echo_frame.Deframer) and sends them as UDP datagrams to one or more targets:
+unicast hosts, the broadcast address or a multicast group.
+
+With `--batch N` up to N frames (or whatever arrived within `--batch-delay`)
+go into one datagram, sent with a single scatter-gather `sendmsg` per target.
+The readers in `echo_interface.py` and `web/echo.py` already split datagrams
+that carry several frames. This trades a little latency for far fewer packets
+on busy links.
+
+`--codec` sends every frame compressed (frame_codec.py), e.g. `delta-zlib`
+(lossless) or `4bit-zlib` (lossy, about a quarter of the size). The readers
+recognize compressed frames by their first byte.
+
+`--sequence` puts a sequence number and the send time in front of every
+datagram (udp_link.py). The readers then reorder datagrams that overtook each
+other and show loss, reordering, duplicates and jitter, which tells a bad link
+from a slow reader.
+
+The relay runs on asyncio. On POSIX the serial port is non-blocking and watched
+by the event loop; on Windows the reads run in a worker thread. `--verbose`
+prints frames/s, datagrams/s, throughput, errors and the latency from serial
+read to send once per `--stats-interval`.
+
+    python UART_UDP_relay.py -p /dev/ttyUSB0 --target 192.168.1.10:5005 --target 192.168.1.11:5005
+    python UART_UDP_relay.py -p /dev/ttyUSB0 --multicast 239.255.0.1 --udp-port 5005 --batch 4
+    python UART_UDP_relay.py -p /dev/ttyUSB0 --target 10.0.0.2 --codec delta-zlib --sequence
+"""
+
+import argparse
+import asyncio
+import os
+import socket
+import time
+
+import numpy as np
 import serial
 import serial.tools.list_ports
-import socket
-import argparse
 
-START_BYTE = 0xAA
+from echo_frame import Deframer, payload_size
+from frame_codec import Codec, encode_envelope
+from udp_link import sequence_header
+
+READ_CHUNK_SIZE = 64 * 1024
+MAX_DATAGRAM_SIZE = 65507  # largest UDP payload over IPv4
+DEFAULT_STATS_INTERVAL = 1.0  # seconds
 
 
 def list_uart_ports():
@@ -17,38 +59,187 @@ def list_uart_ports():
         print(f"  {port.device}  - {port.description}")
 
 
-def read_raw_packet(ser, payload_size, verbose=False):
-    """
-    Reads and returns a FULL raw packet:
-    b'\\xAA' + payload + checksum
-    """
+def parse_target(text: str, default_port: int) -> tuple[str, int]:
+    """'host' or 'host:port' -> (host, port)."""
+    host, _, port = text.rpartition(":") if ":" in text else (text, "", "")
+    return host, int(port) if port else default_port
+
+
+class RelayStats:
+    """Counters for the periodic report; latencies are kept for one interval only, and only
+    with `latencies`, as nothing else would empty the list."""
+
+    def __init__(self, latencies: bool = False):
+        self.frames = 0
+        self.datagrams = 0
+        self.bytes = 0
+        self.send_errors = 0
+        self.latencies: list[float] | None = [] if latencies else None
+        self._last = (time.perf_counter(), 0, 0, 0)
+
+    def report(self, deframer: Deframer) -> str:
+        now = time.perf_counter()
+        last_time, last_frames, last_datagrams, last_bytes = self._last
+        elapsed = now - last_time
+        self._last = (now, self.frames, self.datagrams, self.bytes)
+
+        latency = np.array(self.latencies or []) * 1e3
+        if self.latencies is not None:
+            self.latencies = []
+        latency_text = (
+            f"latency p50 {np.percentile(latency, 50):.2f} / p99 {np.percentile(latency, 99):.2f} ms"
+            if len(latency) else "latency -"
+        )
+        return (
+            f"{(self.frames - last_frames) / elapsed:6.1f} frames/s"
+            f"  {(self.datagrams - last_datagrams) / elapsed:6.1f} datagrams/s"
+            f"  {(self.bytes - last_bytes) / elapsed / 1024:7.1f} KiB/s"
+            f"  {latency_text}"
+            f"  checksum errors {deframer.checksum_errors}  send errors {self.send_errors}"
+        )
+
+
+class Relay:
+    """Sends frames to every target, one per datagram or batched."""
+
+    def __init__(
+        self,
+        targets: list[tuple[str, int]],
+        batch: int = 1,
+        batch_delay: float = 0.0,
+        broadcast: bool = False,
+        multicast_ttl: int = 1,
+        multicast_interface: str | None = None,
+        codec: Codec | None = None,
+        sequence: bool = False,
+        latencies: bool = False,
+    ):
+        self.targets = targets
+        self.codec = codec
+        self.sequence = 0 if sequence else None  # next sequence number, None when not sent
+        self.batch = batch
+        self.batch_delay = batch_delay
+        self.stats = RelayStats(latencies)
+
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.setblocking(False)
+        if broadcast:
+            self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
+        # Only used for multicast targets, harmless for the others
+        self.sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, multicast_ttl)
+        if multicast_interface:
+            self.sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_IF, socket.inet_aton(multicast_interface))
+
+        self._pending: list[bytes] = []
+        self._pending_size = 0
+        self._received: list[float] = []
+        self._flush_handle: asyncio.TimerHandle | None = None
+
+    def forward(self, packet, received: float):
+        """Queue one frame; `packet` may be a view that is only valid until the next serial read."""
+        self.stats.frames += 1
+        if self.codec is not None:
+            packet = encode_envelope(packet, self.codec)
+        if self.batch == 1:
+            self._send([packet], [received])
+            return
+
+        if self._pending_size + len(packet) > MAX_DATAGRAM_SIZE:
+            self.flush()
+        self._pending.append(bytes(packet))
+        self._pending_size += len(packet)
+        self._received.append(received)
+        if len(self._pending) >= self.batch:
+            self.flush()
+        elif self._flush_handle is None:
+            self._flush_handle = asyncio.get_running_loop().call_later(self.batch_delay, self.flush)
+
+    def flush(self):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        if self._pending:
+            self._send(self._pending, self._received)
+            self._pending, self._received, self._pending_size = [], [], 0
+
+    def _send(self, frames: list, received: list[float]):
+        if self.sequence is not None:
+            frames = [sequence_header(self.sequence, time.monotonic_ns() // 1000), *frames]
+            self.sequence += 1
+        size = sum(len(frame) for frame in frames)
+        for target in self.targets:
+            try:
+                self.sock.sendmsg(frames, (), 0, target)  # One datagram, no concatenation copy
+                self.stats.datagrams += 1
+                self.stats.bytes += size
+            except OSError:
+                self.stats.send_errors += 1  # Buffer full or network down; UDP may lose frames anyway
+        if self.stats.latencies is not None:
+            now = time.perf_counter()
+            self.stats.latencies.extend(now - r for r in received)
+
+    def close(self):
+        self.flush()
+        self.sock.close()
+
+
+async def read_serial(ser: serial.Serial, deframer: Deframer, relay: Relay):
+    """Feed the serial stream to the deframer and hand every frame to the relay."""
+    loop = asyncio.get_running_loop()
+    if os.name == "posix":
+        readable = asyncio.Event()
+        loop.add_reader(ser.fileno(), readable.set)
+        try:
+            while True:
+                await readable.wait()
+                readable.clear()
+                chunk = ser.read(min(max(ser.in_waiting, 1), READ_CHUNK_SIZE))
+                received = time.perf_counter()
+                deframer.feed(chunk)
+                for packet in deframer:
+                    relay.forward(packet, received)
+        finally:
+            loop.remove_reader(ser.fileno())
+    else:
+        while True:
+            chunk = await asyncio.to_thread(ser.read, max(ser.in_waiting, deframer.missing))
+            received = time.perf_counter()
+            deframer.feed(chunk)
+            for packet in deframer:
+                relay.forward(packet, received)
+
+
+async def report_stats(deframer: Deframer, relay: Relay, interval: float):
     while True:
-        header = ser.read(1)
-        if header != bytes([START_BYTE]):
-            continue
-
-        payload = ser.read(payload_size)
-        checksum = ser.read(1)
-
-        if len(payload) != payload_size or len(checksum) != 1:
-            if verbose:
-                print("⚠️  Incomplete packet")
-            continue
-
-        # Verify checksum (XOR of payload bytes)
-        calc_checksum = 0
-        for b in payload:
-            calc_checksum ^= b
-
-        if calc_checksum != checksum[0]:
-            if verbose:
-                print("⚠️  Checksum mismatch (UART)")
-            continue
-
-        if verbose:
-            print("📦 Packet received (checksum OK)")
-
-        return header + payload + checksum
+        await asyncio.sleep(interval)
+        print(relay.stats.report(deframer))
+
+
+async def run(args, targets: list[tuple[str, int]]):
+    # Non-blocking on POSIX, the event loop tells us when there is data
+    timeout = 0 if os.name == "posix" else 1
+    relay = Relay(
+        targets,
+        batch=args.batch,
+        batch_delay=args.batch_delay / 1000,
+        broadcast=args.broadcast,
+        multicast_ttl=args.multicast_ttl,
+        multicast_interface=args.multicast_interface,
+        codec=Codec.from_option(args.codec) if args.codec else None,
+        sequence=args.sequence,
+        latencies=args.verbose and not args.quiet,  # Only the --verbose report empties them
+    )
+    try:
+        with serial.Serial(args.uart_port, args.baud_rate, timeout=timeout) as ser:
+            if not args.quiet:
+                print("✅ UART connected, relaying packets...\n")
+            deframer = Deframer(args.samples)
+            tasks = [read_serial(ser, deframer, relay)]
+            if args.verbose and not args.quiet:
+                tasks.append(report_stats(deframer, relay, args.stats_interval))
+            await asyncio.gather(*tasks)
+    finally:
+        relay.close()
 
 
 def main():
@@ -78,14 +269,22 @@ def main():
     parser.add_argument(
         "--udp-ip",
         default="127.0.0.1",
-        help="UDP target IP (default: 127.0.0.1)"
+        help="UDP target IP, used when no --target or --multicast is given (default: 127.0.0.1)"
     )
 
     parser.add_argument(
         "--udp-port",
         type=int,
         default=5005,
-        help="UDP target port (default: 5005)"
+        help="UDP target port, also the default for --target and --multicast (default: 5005)"
+    )
+
+    parser.add_argument(
+        "--target",
+        action="append",
+        default=[],
+        metavar="HOST[:PORT]",
+        help="Send to this host; repeat for several targets"
     )
 
     parser.add_argument(
@@ -94,6 +293,59 @@ def main():
         help="Enable UDP broadcast (255.255.255.255)"
     )
 
+    parser.add_argument(
+        "--multicast",
+        action="append",
+        default=[],
+        metavar="GROUP[:PORT]",
+        help="Send to this multicast group (e.g. 239.255.0.1); repeat for several groups"
+    )
+
+    parser.add_argument(
+        "--multicast-ttl",
+        type=int,
+        default=1,
+        help="Router hops for multicast datagrams (default: 1, local network only)"
+    )
+
+    parser.add_argument(
+        "--multicast-interface",
+        help="IP address of the interface to send multicast on (default: chosen by the OS)"
+    )
+
+    parser.add_argument(
+        "--batch",
+        type=int,
+        default=1,
+        help="Frames per datagram (default: 1)"
+    )
+
+    parser.add_argument(
+        "--batch-delay",
+        type=float,
+        default=50.0,
+        help="Longest time in ms a frame waits for its batch to fill (default: 50)"
+    )
+
+    parser.add_argument(
+        "--codec",
+        choices=[codec.option for codec in Codec if codec is not Codec.RAW],
+        help="Send compressed frames (see frame_codec.py); 4bit codecs are lossy (default: raw frames)"
+    )
+
+    parser.add_argument(
+        "--sequence",
+        action="store_true",
+        help="Number and timestamp every datagram so the readers can measure loss and jitter"
+    )
+
+    parser.add_argument(
+        "--stats-interval",
+        type=float,
+        default=DEFAULT_STATS_INTERVAL,
+        help="Seconds between --verbose statistics (default: 1)"
+    )
+
     parser.add_argument(
         "--list-uart",
         action="store_true",
@@ -109,7 +361,7 @@ def main():
     verbosity.add_argument(
         "--verbose",
         action="store_true",
-        help="Enable verbose packet diagnostics"
+        help="Print live frames/s, throughput, latency and error statistics"
     )
 
     args = parser.parse_args()
@@ -125,8 +377,15 @@ def main():
         parser.print_help()
         return
 
-    payload_size = 6 + 2 * args.samples
-    udp_ip = "255.255.255.255" if args.broadcast else args.udp_ip
+    if args.batch < 1:
+        parser.error("--batch must be at least 1")
+
+    targets = [parse_target(t, args.udp_port) for t in args.target]
+    targets += [parse_target(g, args.udp_port) for g in args.multicast]
+    if args.broadcast:
+        targets.append(("255.255.255.255", args.udp_port))
+    if not targets:
+        targets.append((args.udp_ip, args.udp_port))
 
     # ===== Startup banner =====
     if not args.quiet:
@@ -136,38 +395,23 @@ def main():
         print(f" UART port      : {args.uart_port}")
         print(f" Baud rate      : {args.baud_rate}")
         print(f" Samples        : {args.samples}")
-        print(f" Payload size   : {payload_size} bytes")
-        print(f" UDP target IP  : {udp_ip}")
-        print(f" UDP target port: {args.udp_port}")
+        print(f" Payload size   : {payload_size(args.samples)} bytes")
+        print(f" UDP targets    : {', '.join(f'{host}:{port}' for host, port in targets)}")
         print(f" Broadcast mode : {'ON' if args.broadcast else 'OFF'}")
+        print(f" Codec          : {args.codec or 'OFF'}")
+        print(f" Sequence       : {'ON' if args.sequence else 'OFF'}")
+        print(f" Batching       : {f'{args.batch} frames / {args.batch_delay:g} ms' if args.batch > 1 else 'OFF'}")
         print(f" Verbose mode   : {'ON' if args.verbose else 'OFF'}")
         print(f" Quiet mode     : {'ON' if args.quiet else 'OFF'}")
         print("===================================\n")
 
-    udp_sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-    if args.broadcast:
-        udp_sock.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
-
     try:
-        with serial.Serial(args.uart_port, args.baud_rate, timeout=1) as ser:
-            if not args.quiet:
-                print("✅ UART connected, relaying packets...\n")
-
-            while True:
-                packet = read_raw_packet(
-                    ser,
-                    payload_size,
-                    verbose=args.verbose and not args.quiet
-                )
-                udp_sock.sendto(packet, (udp_ip, args.udp_port))
-
-    except serial.SerialException as e:
+        asyncio.run(run(args, targets))
+    except OSError as e:  # SerialException or the port went away
         print(f"❌ UART error: {e}")
     except KeyboardInterrupt:
         if not args.quiet:
             print("\n🛑 Relay stopped by user")
-    finally:
-        udp_sock.close()
 
 
 if __name__ == "__main__":
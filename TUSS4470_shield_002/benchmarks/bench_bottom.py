@@ -0,0 +1,86 @@
+"""Benchmark for the host-side bottom detector in `bottom.py`.
+
+Runs simulated pings with a known bottom through `BottomDetector`, both as one
+batch (replay) and one ping at a time (live), and reports the time per ping
+against the 0.2 ms budget together with the tracking error.
+
+    python benchmarks/bench_bottom.py [--samples 1800] [--pings 2000] [--noise 20] [--profile sine]
+"""
+
+import argparse
+from pathlib import Path
+import sys
+import time
+
+import numpy as np
+
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+from bottom import BottomDetector  # noqa: E402
+from echo_frame import decode_packet  # noqa: E402
+from simulator import PROFILES, EchoSimulator  # noqa: E402
+
+BUDGET_MS = 0.2
+
+
+def simulate(args):
+    simulator = EchoSimulator(
+        num_samples=args.samples,
+        profile=args.profile,
+        depth_range=(3.0, 12.0),
+        period=60.0,
+        noise=args.noise,
+    )
+    pings = np.empty((args.pings, args.samples), dtype=np.uint8)
+    truth = np.empty(args.pings)
+    for i, frame in enumerate(simulator.frames(args.pings)):
+        samples, depth, _, _ = decode_packet(frame, args.samples)
+        pings[i] = samples
+        truth[i] = depth
+    return pings, truth
+
+
+def detector(args):
+    return BottomDetector(args.samples, blind_zone=args.blind_zone)
+
+
+def report(name, seconds, depths, truth):
+    ms = 1e3 * seconds / len(depths)
+    found = ~np.isnan(depths)
+    error = np.abs(depths[found] - truth[found])
+    status = "ok" if ms < BUDGET_MS else "OVER BUDGET"
+    print(
+        f"  {name:<22} {ms:7.4f} ms/ping ({status})"
+        f"  found {100 * found.mean():5.1f}%"
+        f"  error median {np.median(error):5.1f} / p99 {np.percentile(error, 99):5.1f} samples"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bottom detector benchmark")
+    parser.add_argument("-n", "--samples", type=int, default=1800, help="Samples per ping (default: 1800)")
+    parser.add_argument("--pings", type=int, default=2000, help="Simulated pings (default: 2000)")
+    parser.add_argument("--noise", type=float, default=20.0, help="Noise standard deviation (default: 20)")
+    parser.add_argument("--profile", choices=PROFILES, default="sine", help="Depth profile (default: sine)")
+    parser.add_argument("--blind-zone", type=int, default=150, help="Blind zone in samples (default: 150)")
+    args = parser.parse_args()
+
+    pings, truth = simulate(args)
+    print(f"{args.pings} pings x {args.samples} samples, noise σ={args.noise}, budget {BUDGET_MS} ms/ping")
+
+    # Strongest sample after the blind zone, like USE_DEPTH_OVERRIDE in the firmware
+    start = time.perf_counter()
+    firmware = (pings[:, args.blind_zone:].argmax(axis=1) + args.blind_zone).astype(float)
+    report("firmware max override", time.perf_counter() - start, firmware, truth)
+
+    start = time.perf_counter()
+    depths = detector(args).process(pings)
+    report("batch (replay)", time.perf_counter() - start, depths, truth)
+
+    live = detector(args)
+    start = time.perf_counter()
+    depths = np.array([np.nan if (d := live.update(p)) is None else d for p in pings])
+    report("one ping at a time", time.perf_counter() - start, depths, truth)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+"""Benchmark of the compressed UDP frame encodings in `frame_codec.py`.
+
+Encodes simulated pings with every codec and reports, per frame, the size on
+the wire (compression ratio against the raw frame), the encode time on the
+relay, the decode time on the reader and the largest sample error of the lossy
+codecs. Quiet water compresses much better than a noisy trace, so the noise
+level can be varied:
+
+    python benchmarks/bench_codec.py [--samples 1800] [--frames 500] [--noise 2 8 20]
+"""
+
+import argparse
+from pathlib import Path
+import sys
+import time
+
+import numpy as np
+
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+from echo_frame import decode_packet  # noqa: E402
+from frame_codec import Codec, decode_envelope, encode_envelope  # noqa: E402
+from simulator import EchoSimulator  # noqa: E402
+
+
+def bench(frames, codec):
+    start = time.perf_counter()
+    envelopes = [encode_envelope(frame, codec) for frame in frames]
+    encode = time.perf_counter() - start
+
+    start = time.perf_counter()
+    decoded = [decode_envelope(envelope)[0] for envelope in envelopes]
+    decode = time.perf_counter() - start
+
+    error = max(
+        int(np.abs(decode_packet(a)[0].astype(int) - decode_packet(b)[0].astype(int)).max())
+        for a, b in zip(frames, decoded)
+    )
+    size = np.mean([len(envelope) for envelope in envelopes])
+    return size, 1e6 * encode / len(frames), 1e6 * decode / len(frames), error
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Frame codec benchmark")
+    parser.add_argument("-n", "--samples", type=int, default=1800, help="Samples per frame (default: 1800)")
+    parser.add_argument("--frames", type=int, default=500, help="Frames per codec (default: 500)")
+    parser.add_argument("--noise", type=float, nargs="+", default=[2.0, 8.0, 20.0], help="Noise levels (default: 2 8 20)")
+    args = parser.parse_args()
+
+    for noise in args.noise:
+        simulator = EchoSimulator(num_samples=args.samples, noise=noise)
+        frames = list(simulator.frames(args.frames))
+        raw = len(frames[0])
+        print(f"noise σ={noise}: raw frame {raw} bytes")
+        for codec in Codec:
+            if codec is Codec.RAW:
+                continue
+            size, encode_us, decode_us, error = bench(frames, codec)
+            print(
+                f"  {codec.option:<11} {size:7.0f} bytes  ratio {raw / size:5.2f}"
+                f"  encode {encode_us:6.1f} µs  decode {decode_us:6.1f} µs  max error {error:3d}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""Micro-benchmark for frame decoding.
+
+Compares the original per-byte Python loop + `struct` decoding that used to live in
+`echo_interface.py`, `web/echo.py` and `UART_UDP_relay.py` against the shared
+NumPy implementation in `echo_frame.py`.
+
+    python benchmarks/bench_frame.py [--samples 1800] [--seconds 1.0]
+"""
+
+import argparse
+from pathlib import Path
+import struct
+import sys
+import time
+
+import numpy as np
+
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+from echo_frame import (  # noqa: E402
+    checksum_ok,
+    decode_packet,
+    decode_payload,
+    encode_packet,
+)
+
+
+def legacy_checksum_ok(payload, checksum):
+    calc_checksum = 0
+    for byte in payload:
+        calc_checksum ^= byte
+    return calc_checksum == checksum
+
+
+def legacy_decode(packet, num_samples):
+    payload = packet[1:-1]
+    if not legacy_checksum_ok(payload, packet[-1]):
+        raise ValueError("Checksum mismatch")
+    depth, temp_scaled, vDrv_scaled = struct.unpack("<HhH", payload[:6])
+    values = np.frombuffer(payload[6:], dtype=np.uint8, count=num_samples)
+    return values, min(depth, num_samples), temp_scaled / 100.0, vDrv_scaled / 100.0
+
+
+def frames_per_second(func, seconds):
+    """Call `func` repeatedly for about `seconds` and return calls per second."""
+    calls = 0
+    batch = 100
+    start = time.perf_counter()
+    while True:
+        for _ in range(batch):
+            func()
+        calls += batch
+        elapsed = time.perf_counter() - start
+        if elapsed >= seconds:
+            return calls / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Frame decoding micro-benchmark")
+    parser.add_argument("-n", "--samples", type=int, default=1800, help="Samples per frame (default: 1800)")
+    parser.add_argument("--seconds", type=float, default=1.0, help="Run time per case (default: 1.0)")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    packet = encode_packet(rng.integers(0, 256, args.samples), 512, 21.5, 12.0)
+    payload = packet[1:-1]
+    checksum = packet[-1]
+
+    cases = {
+        "checksum: python loop": lambda: legacy_checksum_ok(payload, checksum),
+        "checksum: numpy": lambda: checksum_ok(payload, checksum),
+        "header: struct": lambda: struct.unpack("<HhH", payload[:6]),
+        "header: decode_payload": lambda: decode_payload(payload, args.samples),
+        "frame: python loop + struct": lambda: legacy_decode(packet, args.samples),
+        "frame: echo_frame.decode_packet": lambda: decode_packet(packet, args.samples),
+    }
+
+    print(f"Frame size: {len(packet)} bytes ({args.samples} samples)")
+    for name, func in cases.items():
+        rate = frames_per_second(func, args.seconds)
+        print(f"  {name:<34} {rate:>12,.0f} frames/s  {1e6 / rate:>8.2f} µs/frame")
+
+
+if __name__ == "__main__":
+    main()
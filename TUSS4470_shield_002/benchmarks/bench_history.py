@@ -0,0 +1,85 @@
+"""Benchmark of the ping history and its overview pyramid (web/history.py).
+
+Fills a `PingHistory` with simulated pings at 10 pings/s and reports the cost
+of keeping it up to date (µs per ping), its memory, and the time of a
+`/history` request of a fixed pixel size for windows from one minute to the
+whole history. Thanks to the pyramid the request time should not grow with the
+length of the window. For comparison, `naive` pools the same windows straight
+from the level 0 ring:
+
+    python benchmarks/bench_history.py [--samples 1800] [--pings 36000] [--width 1000] [--height 800]
+"""
+
+import argparse
+import math
+from pathlib import Path
+import sys
+import time
+
+import numpy as np
+
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+sys.path.append(str(Path(__file__).resolve().parent.parent / "web"))
+from echo import Ping  # noqa: E402
+from history import PingHistory, pool_depth  # noqa: E402
+from protocol import encode_history  # noqa: E402
+from simulator import EchoSimulator  # noqa: E402
+
+PING_RATE = 10.0  # pings per second
+REPEATS = 5
+
+
+def naive_window(history: PingHistory, start: float, end: float, columns: int, samples: int, height: int):
+    base = history.levels[0]
+    indices = np.arange(base.search(start), base.search(end)) % base.rows
+    column = ((base.timestamps[indices] - start) * (columns / (end - start))).astype(np.int64)
+    result = np.zeros((columns, samples), dtype=np.uint8)
+    np.maximum.at(result, np.clip(column, 0, columns - 1), base.data[indices, :samples])
+    return pool_depth(result, math.ceil(samples / height))
+
+
+def timed(func) -> float:
+    start = time.perf_counter()
+    for _ in range(REPEATS):
+        func()
+    return 1e3 * (time.perf_counter() - start) / REPEATS
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Ping history benchmark")
+    parser.add_argument("-n", "--samples", type=int, default=1800, help="Samples per ping (default: 1800)")
+    parser.add_argument("--pings", type=int, default=36000, help="Pings kept, an hour at 10 pings/s (default: 36000)")
+    parser.add_argument("--width", type=int, default=1000, help="Columns per request (default: 1000)")
+    parser.add_argument("--height", type=int, default=800, help="Rows per request (default: 800)")
+    args = parser.parse_args()
+
+    simulator = EchoSimulator(num_samples=args.samples, noise=8.0)
+    traces = [simulator.samples(200 + i % 400) for i in range(1000)]
+    history = PingHistory(args.pings)
+
+    start = time.perf_counter()
+    for i in range(args.pings):
+        ping = Ping(traces[i % len(traces)], 10.0, 20.0, 12.0, 0.99, i)
+        history.append(ping, timestamp=i / PING_RATE)
+    append_us = 1e6 * (time.perf_counter() - start) / args.pings
+    memory = sum(level.data.nbytes + level.timestamps.nbytes + level.depths.nbytes for level in history.levels)
+    print(
+        f"{args.pings} pings of {args.samples} samples: {append_us:.1f} µs per ping, "
+        f"{len(history.levels)} levels, {memory / 1e6:.1f} MB"
+    )
+
+    end = args.pings / PING_RATE
+    print(f"requests of {args.width} x {args.height} pixels:")
+    for minutes in (1, 5, 15, 60):
+        seconds = min(60 * minutes, end)
+        window = history.window(end - seconds, end, args.width, args.samples, args.height)
+        pyramid = timed(lambda: encode_history(history.window(end - seconds, end, args.width, args.samples, args.height)))
+        naive = timed(lambda: naive_window(history, end - seconds, end, args.width, args.samples, args.height))
+        print(
+            f"  {seconds / 60:5.1f} min  level {window.level}  {len(encode_history(window)) / 1024:6.0f} KiB"
+            f"  pyramid {pyramid:7.2f} ms  naive {naive:8.2f} ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
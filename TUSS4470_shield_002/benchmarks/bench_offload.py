@@ -0,0 +1,154 @@
+"""Benchmark of `offload_enable`: decoding and processing in a worker process.
+
+Runs the web backend's `EchoReader` with the host bottom detector and a heavy
+processing chain (TVG, smoothing, running stack) twice, once in the event loop
+process and once offloaded to the worker process (web/offload.py), and reports
+for each:
+
+  pings/s      pings that reached the data callback
+  dropped      pings lost in the reader, the queues or the offload rings
+  loop lag     how late a 1 ms heartbeat task on the event loop wakes up;
+               this is what the WebSocket clients and depth outputs feel
+  main CPU     CPU time of the event loop process per delivered ping
+
+With `--rate 0` (default) frames are handed out as fast as the reader is
+asked for them, which measures the maximum throughput. A fixed `--rate` shows
+the loop lag at a realistic ping rate:
+
+    python benchmarks/bench_offload.py [--samples 1800] [--seconds 5] [--rate 0] [--smoothing 31]
+
+Offloading pays off on multi-core boards like the Raspberry Pi 4/5, where the
+worker gets a core of its own; on a single core it only adds copying.
+"""
+
+import argparse
+import asyncio
+import os
+from pathlib import Path
+import platform
+import sys
+import time
+from types import SimpleNamespace
+
+import numpy as np
+
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+sys.path.append(str(Path(__file__).resolve().parent.parent / "web"))
+from echo import EchoReader, Reader  # noqa: E402
+from simulator import EchoSimulator  # noqa: E402
+
+HEARTBEAT = 0.001  # seconds
+
+
+def dropped(echo_reader: EchoReader) -> int:
+    stats = echo_reader.stats()
+    return stats["reader_dropped"] + (stats["offload_dropped"] or 0) + stats["queues"]["broadcast"]["dropped"]
+
+
+async def run(frames, settings, seconds: float, rate: float) -> dict:
+    class SimulatedReader(Reader):
+        """Hands out the pre-generated frames in a loop, paced to `rate` pings per second."""
+
+        async def open(self):
+            self._next = 0
+            self._due = time.perf_counter()
+
+        async def close(self):
+            pass
+
+        async def read(self):
+            if rate > 0:
+                self._due += 1 / rate
+                await asyncio.sleep(max(self._due - time.perf_counter(), 0))
+            else:
+                await asyncio.sleep(0)  # A real reader waits for I/O here
+            frame = frames[self._next % len(frames)]
+            self._next += 1
+            self.received = time.perf_counter()
+            return self.unpack(frame, verify=False)
+
+    delivered = 0
+    lateness = []
+
+    async def data_callback(ping):
+        nonlocal delivered
+        delivered += 1
+
+    async def heartbeat():
+        while True:
+            due = time.perf_counter() + HEARTBEAT
+            await asyncio.sleep(HEARTBEAT)
+            lateness.append(time.perf_counter() - due)
+
+    settings = SimpleNamespace(
+        **vars(settings),
+        connection_type=SimpleNamespace(name="SIMULATED", value=SimulatedReader),
+    )
+    echo_reader = EchoReader(data_callback, lambda depth, received: None, settings)
+    with echo_reader:
+        await asyncio.sleep(1.0)  # Let the worker process start
+        beat = asyncio.create_task(heartbeat())
+        start_delivered, start_dropped = delivered, dropped(echo_reader)
+        start_cpu, start = time.process_time(), time.perf_counter()
+        await asyncio.sleep(seconds)
+        wall, cpu = time.perf_counter() - start, time.process_time() - start_cpu
+        pings = delivered - start_delivered
+        lost = dropped(echo_reader) - start_dropped
+        beat.cancel()
+
+    lag = np.array(lateness) * 1e3
+    return {
+        "pings_per_s": pings / wall,
+        "dropped": lost,
+        "lag_p50_ms": float(np.percentile(lag, 50)),
+        "lag_p99_ms": float(np.percentile(lag, 99)),
+        "lag_max_ms": float(lag.max()),
+        "cpu_us_per_ping": 1e6 * cpu / max(pings, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offload benchmark")
+    parser.add_argument("-n", "--samples", type=int, default=1800, help="Samples per frame (default: 1800)")
+    parser.add_argument("--seconds", type=float, default=5.0, help="Duration of each run (default: 5)")
+    parser.add_argument("--rate", type=float, default=0.0, help="Pings per second, 0 = flat out (default: 0)")
+    parser.add_argument("--smoothing", type=int, default=31, help="Smoothing window in samples (default: 31)")
+    parser.add_argument("--stack", type=int, default=8, help="Running stack in pings (default: 8)")
+    args = parser.parse_args()
+
+    simulator = EchoSimulator(num_samples=args.samples, noise=20.0)
+    frames = list(simulator.frames(500))
+    print(
+        f"{platform.platform()} {platform.machine()}, {os.cpu_count()} CPUs, Python {platform.python_version()}, "
+        f"NumPy {np.__version__}"
+    )
+    print(
+        f"{args.samples} samples, host bottom detector, TVG, smoothing {args.smoothing}, stack {args.stack}, "
+        f"rate {args.rate or 'flat out'}"
+    )
+
+    for name, offload in (("single process", False), ("offloaded", True)):
+        settings = SimpleNamespace(
+            num_samples=args.samples,
+            resolution=1.0,
+            recording_enable=False,
+            depth_source="host",
+            blind_zone=150,
+            processing_tvg_spreading=20.0,
+            processing_tvg_absorption=0.01,
+            processing_smoothing=args.smoothing,
+            processing_stack=args.stack,
+            processing_stack_mode="running",
+            processing_decimation=1,
+            offload_enable=offload,
+        )
+        result = asyncio.run(run(frames, settings, args.seconds, args.rate))
+        print(
+            f"  {name:<15} {result['pings_per_s']:8.0f} pings/s  dropped {result['dropped']:6d}"
+            f"  loop lag p50 {result['lag_p50_ms']:6.2f} / p99 {result['lag_p99_ms']:6.2f}"
+            f" / max {result['lag_max_ms']:6.2f} ms  main CPU {result['cpu_us_per_ping']:6.1f} µs/ping"
+        )
+
+
+if __name__ == "__main__":
+    main()
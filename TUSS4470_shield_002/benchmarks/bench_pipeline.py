@@ -0,0 +1,376 @@
+"""End-to-end throughput benchmark for the acquisition pipeline.
+
+Feeds frames from the in-process `EchoSimulator` through every stage and reports
+frames/s, per-call latency percentiles and CPU use:
+
+  read_packet         Qt interface: deframe + decode from a serial-like stream
+  Reader.unpack       web backend: decode one complete frame
+  ProcessingChain     web backend: TVG, smoothing, stacking and decimation by 2
+  UDPReader           web backend: datagram_received + queue, one frame per datagram
+  EchoReader          web backend: read -> queue -> data callback
+  broadcast_json      ConnectionManager.broadcast to JSON clients (the old JSON path)
+  broadcast_binary    ConnectionManager.broadcast to binary clients
+  broadcast_view      ConnectionManager.broadcast to binary clients subscribed to a
+                      10 m view on phone-sized canvases (cropped and max-pooled)
+
+Each stage runs `--repeat` times and the fastest run is reported. Results are
+written as JSON so runs from different releases can be compared:
+
+    python benchmarks/bench_pipeline.py --output before.json
+    python benchmarks/bench_pipeline.py --compare before.json [--tolerance 10]
+
+With `--compare`, the script exits with status 1 if any stage got slower than
+the tolerance (in percent of frames/s).
+"""
+
+import argparse
+import asyncio
+import io
+import json
+from pathlib import Path
+import platform
+import subprocess
+import sys
+import time
+from types import SimpleNamespace
+
+import numpy as np
+
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+sys.path.append(str(Path(__file__).resolve().parent.parent / "web"))
+from connections import ConnectionManager  # noqa: E402
+from echo import EchoReader, Ping, Reader, SerialReader, UDPReader  # noqa: E402
+from echo_frame import Deframer  # noqa: E402
+from processing import ProcessingChain  # noqa: E402
+from protocol import MessageFormat  # noqa: E402
+from simulator import EchoSimulator  # noqa: E402
+
+
+class StageTimer:
+    """Collects per-call durations, wall and CPU time of one stage."""
+
+    def __init__(self):
+        self.durations = []
+        self.frames = 0
+
+    def __enter__(self):
+        self._wall = time.perf_counter()
+        self._cpu = time.process_time()
+        return self
+
+    def __exit__(self, *exc):
+        self.wall = time.perf_counter() - self._wall
+        self.cpu = time.process_time() - self._cpu
+
+    def result(self) -> dict:
+        latency = np.array(self.durations) * 1e6
+        return {
+            "frames": self.frames,
+            "seconds": round(self.wall, 4),
+            "frames_per_s": round(self.frames / self.wall, 1),
+            "latency_us": {
+                "mean": round(float(latency.mean()), 2),
+                "p50": round(float(np.percentile(latency, 50)), 2),
+                "p90": round(float(np.percentile(latency, 90)), 2),
+                "p99": round(float(np.percentile(latency, 99)), 2),
+                "max": round(float(latency.max()), 2),
+            },
+            "cpu_percent": round(100 * self.cpu / self.wall, 1),
+        }
+
+
+class StreamSerial:
+    """Serial-port stand-in that hands out a byte stream in UART-sized chunks."""
+
+    def __init__(self, data: bytes, chunk: int = 4096):
+        self._stream = io.BytesIO(data)
+        self._size = len(data)
+        self.chunk = chunk
+
+    @property
+    def in_waiting(self):
+        return min(self.chunk, self._size - self._stream.tell())
+
+    def read(self, n):
+        data = self._stream.read(n)
+        if len(data) < n:  # Wrap around so the stream never runs dry
+            self._stream.seek(0)
+            data += self._stream.read(n - len(data))
+        return data
+
+
+class NullWebSocket:
+    """WebSocket stand-in whose sends complete immediately."""
+
+    client = "benchmark"
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, text):
+        pass
+
+    async def send_bytes(self, data):
+        pass
+
+    async def close(self, code=None):
+        pass
+
+
+def bench_read_packet(frames, num_samples):
+    try:
+        from echo_interface import read_packet
+    except ImportError as e:
+        return {"skipped": f"Qt interface not importable: {e}"}
+
+    ser = StreamSerial(b"".join(frames))
+    deframer = Deframer(num_samples)
+    timer = StageTimer()
+    with timer:
+        for _ in range(len(frames)):
+            t0 = time.perf_counter()
+            read_packet(ser, deframer)
+            timer.durations.append(time.perf_counter() - t0)
+            timer.frames += 1
+    return timer.result()
+
+
+def bench_unpack(frames, settings):
+    reader = SerialReader(settings)
+    timer = StageTimer()
+    with timer:
+        for frame in frames:
+            t0 = time.perf_counter()
+            reader.unpack(frame)
+            timer.durations.append(time.perf_counter() - t0)
+            timer.frames += 1
+    return timer.result()
+
+
+def bench_processing(frames, settings):
+    reader = SerialReader(settings)
+    pings = [reader.unpack(frame).samples for frame in frames]
+    chain = ProcessingChain(
+        settings.num_samples, settings.resolution, tvg_spreading=20, tvg_absorption=0.01, smoothing=5, stack=4, decimation=2
+    )
+    timer = StageTimer()
+    with timer:
+        for samples in pings:
+            t0 = time.perf_counter()
+            chain.process(samples)
+            timer.durations.append(time.perf_counter() - t0)
+            timer.frames += 1
+    return timer.result()
+
+
+async def bench_udp_reader(frames, settings):
+    reader = UDPReader(settings)
+    protocol = UDPReader._PacketProtocol(reader)
+    timer = StageTimer()
+    with timer:
+        for frame in frames:
+            t0 = time.perf_counter()
+            protocol.datagram_received(frame, ("127.0.0.1", 0))
+            await reader.read()
+            timer.durations.append(time.perf_counter() - t0)
+            timer.frames += 1
+    return timer.result()
+
+
+async def bench_echo_reader(frames, settings):
+    read_times = []
+
+    class SimulatedReader(Reader):
+        """Hands out the pre-generated frames as fast as EchoReader asks for them."""
+
+        async def open(self):
+            self._frames = iter(frames)
+
+        async def close(self):
+            pass
+
+        async def read(self):
+            await asyncio.sleep(0)  # A real reader waits for I/O here
+            frame = next(self._frames, None)
+            if frame is None:
+                await asyncio.Event().wait()  # Out of frames, idle like a silent sounder
+            frame = self.unpack(frame)
+            read_times.append(time.perf_counter())
+            return frame
+
+    timer = StageTimer()
+    done = asyncio.Event()
+
+    async def data_callback(ping):
+        timer.durations.append(time.perf_counter() - read_times[ping.sequence - 1])
+        timer.frames += 1
+        if ping.sequence == len(frames):
+            done.set()
+
+    settings = SimpleNamespace(
+        **vars(settings),
+        connection_type=SimpleNamespace(name="SIMULATED", value=SimulatedReader),
+    )
+    echo_reader = EchoReader(data_callback, lambda depth, received: None, settings)
+    with timer:
+        with echo_reader:
+            try:
+                await asyncio.wait_for(done.wait(), timeout=60)
+            except asyncio.TimeoutError:
+                pass  # The last pings were dropped by a full queue, report what arrived
+    result = timer.result()
+    result["dropped"] = echo_reader.stats()["queues"]["broadcast"]["dropped"]
+    return result
+
+
+async def bench_broadcast(frames, settings, message_format, clients, subscription=None):
+    manager = ConnectionManager()
+    for i in range(clients):
+        websocket = NullWebSocket()
+        await manager.connect(websocket, message_format)
+        if subscription:
+            manager.configure(websocket, json.dumps(subscription(i)))
+
+    reader = SerialReader(settings)
+    pings = []
+    for sequence, frame in enumerate(frames, 1):
+        samples, depth, temperature, drive_voltage = reader.unpack(frame)
+        pings.append(Ping(samples, depth * settings.resolution / 100, temperature, drive_voltage, settings.resolution, sequence))
+
+    sent = {"bytes": 0, "messages": 0}
+
+    async def count_bytes(data):
+        sent["bytes"] += len(data)
+        sent["messages"] += 1
+
+    for websocket in manager.clients:
+        websocket.send_bytes = websocket.send_text = count_bytes
+
+    timer = StageTimer()
+    with timer:
+        for ping in pings:
+            t0 = time.perf_counter()
+            await manager.broadcast(ping)
+            timer.durations.append(time.perf_counter() - t0)
+            timer.frames += 1
+            await asyncio.sleep(0)  # Let the client tasks send, counted in CPU but not latency
+
+    for websocket in list(manager.clients):
+        await manager.disconnect(websocket)
+    result = timer.result()
+    result["clients"] = clients
+    result["bytes_per_message"] = round(sent["bytes"] / max(1, sent["messages"]))
+    return result
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ["git", "describe", "--always", "--dirty"],
+            capture_output=True, text=True, check=True, cwd=Path(__file__).parent,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(args) -> dict:
+    simulator = EchoSimulator(num_samples=args.samples, profile="sine", seed=0)
+    frames = list(simulator.frames(args.frames))
+    settings = SimpleNamespace(num_samples=args.samples, resolution=simulator.resolution, recording_enable=False)
+
+    stages = {
+        "read_packet": lambda: bench_read_packet(frames, args.samples),
+        "Reader.unpack": lambda: bench_unpack(frames, settings),
+        "ProcessingChain": lambda: bench_processing(frames, settings),
+        "UDPReader": lambda: asyncio.run(bench_udp_reader(frames, settings)),
+        "EchoReader": lambda: asyncio.run(bench_echo_reader(frames, settings)),
+        "broadcast_json": lambda: asyncio.run(bench_broadcast(frames, settings, MessageFormat.JSON, args.clients)),
+        "broadcast_binary": lambda: asyncio.run(bench_broadcast(frames, settings, MessageFormat.BINARY, args.clients)),
+        "broadcast_view": lambda: asyncio.run(
+            bench_broadcast(
+                frames, settings, MessageFormat.BINARY, args.clients,
+                subscription=lambda i: {"view": {"range": 10, "height": (640, 720, 800)[i % 3]}},
+            )
+        ),
+    }
+
+    results = {}
+    for name, stage in stages.items():
+        # Keep the fastest of a few runs, the others mostly measure scheduler noise
+        runs = [stage() for _ in range(args.repeat)]
+        results[name] = max(runs, key=lambda result: result.get("frames_per_s", 0))
+        print_stage(name, results[name])
+
+    return {
+        "meta": {
+            "date": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "revision": git_revision(),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "machine": platform.machine(),
+            "samples": args.samples,
+            "frames": args.frames,
+            "clients": args.clients,
+            "repeat": args.repeat,
+        },
+        "results": results,
+    }
+
+
+def print_stage(name, result):
+    if "skipped" in result:
+        print(f"  {name:<18} skipped: {result['skipped']}")
+        return
+    latency = result["latency_us"]
+    print(
+        f"  {name:<18} {result['frames_per_s']:>12,.0f} frames/s"
+        f"  p50 {latency['p50']:>8.1f} µs  p99 {latency['p99']:>8.1f} µs"
+        f"  CPU {result['cpu_percent']:>5.1f}%"
+        + (f"  {result['bytes_per_message']:>6,} B/message" if "bytes_per_message" in result else "")
+    )
+
+
+def compare(baseline: dict, current: dict, tolerance: float) -> bool:
+    """Print the change in frames/s per stage; return False if a stage regressed."""
+    ok = True
+    print(f"\nCompared to {baseline['meta'].get('revision')} ({baseline['meta'].get('date')}):")
+    for name, result in current["results"].items():
+        before = baseline["results"].get(name, {})
+        if "frames_per_s" not in result or "frames_per_s" not in before:
+            continue
+        change = 100 * (result["frames_per_s"] / before["frames_per_s"] - 1)
+        regressed = change < -tolerance
+        ok &= not regressed
+        print(f"  {name:<18} {change:>+7.1f}% frames/s{'  ⚠️ regression' if regressed else ''}")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Acquisition pipeline benchmark")
+    parser.add_argument("-n", "--samples", type=int, default=1800, help="Samples per frame (default: 1800)")
+    parser.add_argument("--frames", type=int, default=2000, help="Frames per stage (default: 2000)")
+    parser.add_argument("--clients", type=int, default=10, help="WebSocket clients for the broadcast stages (default: 10)")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per stage, the fastest is reported (default: 3)")
+    parser.add_argument("-o", "--output", help="Write the results to this JSON file")
+    parser.add_argument("--compare", help="Baseline JSON file to compare against")
+    parser.add_argument("--tolerance", type=float, default=10.0, help="Allowed frames/s loss in percent (default: 10)")
+    args = parser.parse_args()
+
+    print(f"{args.frames} frames x {args.samples} samples")
+    report = run(args)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nResults written to {args.output}")
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        if not compare(baseline, report, args.tolerance):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
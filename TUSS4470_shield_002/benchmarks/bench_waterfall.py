@@ -0,0 +1,86 @@
+"""Benchmark for the Qt waterfall history update.
+
+Compares the previous `np.roll` of a float64 history and full `np.std`/`np.mean`
+auto levels against the uint8 ring buffer and streaming level estimator in
+`waterfall.py`, for 300 and 3000 rows of history.
+
+    python benchmarks/bench_waterfall.py [--samples 1800] [--pings 500]
+"""
+
+import argparse
+from pathlib import Path
+import sys
+import time
+
+import numpy as np
+
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+from waterfall import WaterfallHistory  # noqa: E402
+
+
+class RollHistory:
+    """The previous implementation: shift the whole float64 history for every ping."""
+
+    def __init__(self, rows, num_samples):
+        self.data = np.zeros((rows, num_samples))
+
+    def append(self, samples):
+        self.data = np.roll(self.data, -1, axis=0)
+        self.data[-1, :] = samples
+
+    def image(self):
+        return self.data.T
+
+    def auto_levels(self):
+        sigma = np.std(self.data)
+        mean = np.mean(self.data)
+        return mean - 2 * sigma, mean + 2 * sigma
+
+
+class RingHistory(WaterfallHistory):
+    def image(self):
+        older, newer = self.tiles()
+        return older.T, newer.T
+
+    def auto_levels(self):
+        return self.levels.sigma_levels(2)
+
+
+class RingHistoryPercentile(RingHistory):
+    def auto_levels(self):
+        return self.levels.percentile_levels(2, 98)
+
+
+def ms_per_ping(history, pings, levels):
+    start = time.perf_counter()
+    for samples in pings:
+        history.append(samples)
+        history.image()
+        if levels:
+            history.auto_levels()
+    return 1e3 * (time.perf_counter() - start) / len(pings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Waterfall history benchmark")
+    parser.add_argument("-n", "--samples", type=int, default=1800, help="Samples per ping (default: 1800)")
+    parser.add_argument("--pings", type=int, default=500, help="Pings per case (default: 500)")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    pings = rng.integers(0, 256, (args.pings, args.samples), dtype=np.uint8)
+
+    for rows in (300, 3000):
+        print(f"{rows} rows x {args.samples} samples")
+        for name, cls, levels in (
+            ("np.roll (float64)", RollHistory, False),
+            ("ring buffer (uint8)", RingHistory, False),
+            ("np.roll + np.std/np.mean levels", RollHistory, True),
+            ("ring + streaming mean ± 2σ", RingHistory, True),
+            ("ring + streaming percentiles", RingHistoryPercentile, True),
+        ):
+            print(f"  {name:<34} {ms_per_ping(cls(rows, args.samples), pings, levels):8.3f} ms/ping")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+"""UDP stress test for the web backend's `UDPReader`.
+
+A separate process replays datagrams at a fixed rate (10k/s by default) to a local
+socket while the web `UDPReader` receives them on an asyncio loop. At the end the
+script reports how many frames arrived and how much of the loop's time was spent
+inside `datagram_received`.
+
+    python benchmarks/stress_udp.py [--rate 10000] [--seconds 5] [--mode aligned|multi|split|mixed]
+
+Modes:
+  aligned  one frame per datagram (the relay's normal output)
+  multi    three frames per datagram
+  split    every frame split over two datagrams
+  mixed    a repeating mix of the above plus garbage bytes between frames
+"""
+
+import argparse
+import asyncio
+import multiprocessing
+from pathlib import Path
+import socket
+import sys
+import time
+from types import SimpleNamespace
+
+import numpy as np
+
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+sys.path.append(str(Path(__file__).resolve().parent.parent / "web"))
+from echo import UDPReader  # noqa: E402
+from echo_frame import encode_packet  # noqa: E402
+
+
+def build_datagrams(mode, num_samples, count=64):
+    """Prepare a cycle of datagrams and the number of frames it contains."""
+    rng = np.random.default_rng(0)
+    packets = [
+        encode_packet(rng.integers(0, 256, num_samples), i, 20.0, 12.0)
+        for i in range(count)
+    ]
+
+    if mode == "aligned":
+        return packets, len(packets)
+    if mode == "multi":
+        return [b"".join(packets[i:i + 3]) for i in range(0, count - 2, 3)], (count // 3) * 3
+    if mode == "split":
+        half = len(packets[0]) // 2
+        return [part for p in packets for part in (p[:half], p[half:])], len(packets)
+
+    datagrams = []
+    frames = 0
+    for i in range(0, count - 3, 4):
+        datagrams.append(packets[i])
+        datagrams.append(packets[i + 1] + packets[i + 2][:700])
+        datagrams.append(packets[i + 2][700:] + b"\x00\xaa\x13" + packets[i + 3])
+        frames += 4
+    return datagrams, frames
+
+
+def sender(port, rate, seconds, mode, num_samples, result):
+    datagrams, frames_per_cycle = build_datagrams(mode, num_samples)
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    interval = 1.0 / rate
+    sent = 0
+    start = time.perf_counter()
+    end = start + seconds
+    while (now := time.perf_counter()) < end:
+        # Catch up in bursts if we fell behind, like a relay draining a serial buffer
+        due = int((now - start) / interval) + 1
+        while sent < due:
+            sock.sendto(datagrams[sent % len(datagrams)], ("127.0.0.1", port))
+            sent += 1
+        time.sleep(interval / 2)
+    sock.close()
+
+    full_cycles, rest = divmod(sent, len(datagrams))
+    result["datagrams"] = sent
+    # Approximate for a partial cycle in the split/mixed modes
+    result["frames"] = full_cycles * frames_per_cycle + rest * frames_per_cycle // len(datagrams)
+    result["elapsed"] = time.perf_counter() - start
+
+
+async def receive(args):
+    settings = SimpleNamespace(num_samples=args.samples, udp_host="127.0.0.1", udp_port=args.port)
+    reader = UDPReader(settings)
+
+    handler_time = 0.0
+    original = UDPReader._PacketProtocol.datagram_received
+
+    def timed(self, data, addr):
+        nonlocal handler_time
+        t0 = time.perf_counter()
+        original(self, data, addr)
+        handler_time += time.perf_counter() - t0
+
+    UDPReader._PacketProtocol.datagram_received = timed
+    await reader.open()
+    reader._transport.get_extra_info("socket").setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4 * 1024 * 1024)
+
+    manager = multiprocessing.Manager()
+    result = manager.dict()
+    proc = multiprocessing.Process(
+        target=sender, args=(args.port, args.rate, args.seconds, args.mode, args.samples, result)
+    )
+
+    received = 0
+    t0 = time.perf_counter()
+    cpu0 = time.process_time()
+    proc.start()
+    deadline = t0 + args.seconds + 1.0
+    while time.perf_counter() < deadline:
+        try:
+            await asyncio.wait_for(reader.read(), timeout=0.2)
+            received += 1
+        except asyncio.TimeoutError:
+            if not proc.is_alive():
+                break
+    wall = time.perf_counter() - t0
+    cpu = time.process_time() - cpu0
+    proc.join()
+    await reader.close()
+    UDPReader._PacketProtocol.datagram_received = original
+
+    print(f"Mode            : {args.mode}")
+    print(f"Datagrams sent  : {result['datagrams']} ({result['datagrams'] / result['elapsed']:,.0f}/s)")
+    print(f"Frames sent     : ~{result['frames']}")
+    print(f"Frames received : {received} ({received / result['elapsed']:,.0f}/s)")
+    print(f"Checksum errors : {reader._deframer.checksum_errors}")
+    print(f"Handler time    : {handler_time:.3f} s ({100 * handler_time / wall:.1f}% of wall time)")
+    print(f"Receiver CPU    : {cpu:.3f} s ({100 * cpu / wall:.1f}% of one core)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="UDPReader stress test")
+    parser.add_argument("--rate", type=int, default=10000, help="Datagrams per second (default: 10000)")
+    parser.add_argument("--seconds", type=float, default=5.0, help="Test duration (default: 5)")
+    parser.add_argument("--mode", choices=["aligned", "multi", "split", "mixed"], default="aligned")
+    parser.add_argument("--port", type=int, default=19999, help="Local UDP port (default: 19999)")
+    parser.add_argument("-n", "--samples", type=int, default=1800, help="Samples per frame (default: 1800)")
+    args = parser.parse_args()
+
+    asyncio.run(receive(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+"""Host-side bottom detection and tracking.
+
+The firmware reports the first threshold crossing after its blind zone (or the
+strongest sample with `USE_DEPTH_OVERRIDE`), which jumps to fish, weed and noise
+spikes. `BottomDetector` works on the samples instead:
+
+1. A moving-average matched filter the length of the transmit pulse suppresses
+   single-sample spikes. The echo is then located inside the filter window with
+   a short 5-sample average.
+2. The noise floor of each ping is estimated from the median and MAD of the
+   filtered samples past the blind zone. A peak counts as bottom only if it is
+   `min_snr` robust standard deviations above that floor.
+3. While locked, only a window around the predicted bottom is searched. After
+   `max_misses` pings without a detection the whole ping is searched again.
+4. An alpha-beta tracker smooths the detections and coasts over short dropouts.
+
+Filtering and noise estimation are vectorized over a batch of pings (`process()`),
+so a replay of hours of data is processed in large blocks. Live data goes through
+`update()` one ping at a time with the same state.
+
+This module is shared by the Qt interface and the web backend and only depends on NumPy.
+"""
+
+import numpy as np
+
+DEFAULT_BLIND_ZONE = 450  # samples, same as BLINDZONE_SAMPLE_END in the firmware settings.h
+DEFAULT_PULSE_SAMPLES = 30  # about 16 cycles at 40 kHz sampled every 13.2 µs
+DEFAULT_WINDOW = 60  # samples searched on each side of the predicted bottom
+DEFAULT_MIN_SNR = 6.0
+REFINE_KERNEL = np.ones(5, dtype=np.float32)  # short smoothing to find the echo inside the filter window
+
+
+class BottomDetector:
+    def __init__(
+        self,
+        num_samples: int,
+        blind_zone: int = DEFAULT_BLIND_ZONE,
+        pulse_samples: int = DEFAULT_PULSE_SAMPLES,
+        window: int = DEFAULT_WINDOW,
+        min_snr: float = DEFAULT_MIN_SNR,
+        alpha: float = 0.5,
+        beta: float = 0.1,
+        max_misses: int = 5,
+    ):
+        if not 0 <= blind_zone < num_samples - pulse_samples:
+            raise ValueError(f"Blind zone {blind_zone} leaves nothing to search in {num_samples} samples")
+        self.num_samples = num_samples
+        self.blind_zone = blind_zone
+        self.pulse_samples = pulse_samples
+        self.window = window
+        self.min_snr = min_snr
+        self.alpha = alpha
+        self.beta = beta
+        self.max_misses = max_misses
+        self.reset()
+
+    def reset(self):
+        self.position: float | None = None  # tracked bottom in samples
+        self.velocity = 0.0  # samples per ping
+        self.misses = 0
+
+    @property
+    def locked(self) -> bool:
+        return self.position is not None and self.misses <= self.max_misses
+
+    def filter(self, pings: np.ndarray) -> np.ndarray:
+        """Mean over the next `pulse_samples` samples, for every sample past the blind zone.
+
+        Column `k` of the result belongs to sample `blind_zone + k`.
+        """
+        segment = pings[:, self.blind_zone:]
+        cumulative = np.zeros((len(pings), segment.shape[1] + 1), dtype=np.float32)
+        np.cumsum(segment, axis=1, dtype=np.float32, out=cumulative[:, 1:])
+        w = self.pulse_samples
+        return (cumulative[:, w:] - cumulative[:, :-w]) * (1.0 / w)
+
+    def process(self, pings) -> np.ndarray:
+        """Bottom index (float samples) for each ping of a (n, num_samples) batch, NaN if none."""
+        pings = np.atleast_2d(np.asarray(pings))
+        filtered = self.filter(pings)
+
+        floor = np.median(filtered, axis=1)
+        spread = 1.4826 * np.median(np.abs(filtered - floor[:, None]), axis=1) + 1e-3
+        threshold = floor + self.min_snr * spread
+        strongest = filtered.argmax(axis=1)
+
+        depths = np.full(len(pings), np.nan)
+        width = filtered.shape[1]
+        for i in range(len(pings)):
+            if self.locked:
+                predicted = self.position + self.velocity - self.blind_zone
+                lo = max(int(predicted) - self.window, 0)
+                hi = min(int(predicted) + self.window + 1, width)
+                peak = lo + int(filtered[i, lo:hi].argmax()) if lo < hi else -1
+            else:
+                peak = int(strongest[i])
+            if peak >= 0 and filtered[i, peak] >= threshold[i]:
+                # The filter peaks up to a pulse length early, the echo itself is inside its window
+                start = peak + self.blind_zone
+                echo = np.convolve(pings[i, start:start + self.pulse_samples + 4], REFINE_KERNEL, "valid")
+                depths[i] = self._track(start + 2 + int(echo.argmax()))
+            else:
+                depths[i] = self._track(None)
+        return depths
+
+    def update(self, samples) -> float | None:
+        """Track one ping; returns the bottom index or None if there is no bottom yet."""
+        depth = self.process(samples)[0]
+        return None if np.isnan(depth) else float(depth)
+
+    def _track(self, measured: int | None) -> float:
+        if not self.locked:
+            if measured is None:
+                return np.nan
+            self.position, self.velocity, self.misses = float(measured), 0.0, 0
+            return self.position
+
+        predicted = self.position + self.velocity
+        if measured is None:
+            # Coast on the prediction until the bottom comes back or we give up
+            self.misses += 1
+            self.position = predicted
+            return predicted if self.locked else np.nan
+
+        residual = measured - predicted
+        self.position = predicted + self.alpha * residual
+        self.velocity += self.beta * residual
+        self.misses = 0
+        return self.position
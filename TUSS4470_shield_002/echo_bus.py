@@ -0,0 +1,282 @@
+"""Local frame bus: one process reads the sounder, any number of programs use the pings.
+
+Only one program can open a serial port at a time. `python echo_bus.py serve`
+reads the sounder once and publishes every checked frame into a shared-memory
+ring (shm_ring.py) named `openecho`. Each entry is the raw frame exactly as the
+firmware sent it (see echo_frame.py), stamped with its UNIX receive time and a
+sequence number.
+
+Consumers attach read-only with `BusSubscriber` and get views straight into
+the ring. `BusSubscriber.frame()` decodes a view without copying the samples.
+Nobody parses the serial stream or checks a checksum again. A view stays valid
+until the daemon wraps around (`slots` pings later, `BusSubscriber.valid()`),
+so a consumer that keeps samples longer, or records them, reads with
+`copy=True`: the copy is checked and frames overwritten during it are skipped.
+
+The Qt interface and the web backend have a "Shared memory" connection. This
+module also has two small consumers of its own:
+
+    python echo_bus.py serve -p /dev/ttyUSB0 [-b 250000] [-n 1800] [--slots 256]
+    python echo_bus.py serve --udp-port 5005
+    python echo_bus.py record [--directory recordings]
+    python echo_bus.py nmea [--port 10110] [--resolution 0.98]
+    python echo_bus.py status
+
+Readers that fall more than `slots` pings behind skip ahead and count the pings
+they lost; the daemon never waits for them.
+
+This module is shared by the Qt interface and the web backend and only depends
+on NumPy; `serve` also needs pyserial for serial ports.
+"""
+
+import argparse
+from multiprocessing import shared_memory
+import socket
+import time
+
+import numpy as np
+
+from echo_frame import DEFAULT_NUM_SAMPLES, Deframer, Frame, decode_packet, packet_size
+from frame_codec import datagram_frames
+from shm_ring import RingReader, SharedRing
+
+DEFAULT_BUS = "openecho"
+DEFAULT_SLOTS = 256  # about 25 seconds at 10 pings/s
+DEFAULT_RESOLUTION = 1480 * 13.2e-6 * 100 / 2  # cm per sample in water at 13.2 µs per sample
+UDP_RECV_SIZE = 65535
+
+
+class BusPublisher:
+    """Creates the bus and writes frames into it; only one per bus name."""
+
+    def __init__(self, num_samples: int = DEFAULT_NUM_SAMPLES, name: str = DEFAULT_BUS, slots: int = DEFAULT_SLOTS):
+        self.num_samples = num_samples
+        self.ring = SharedRing.create(slots, packet_size(num_samples), name=name)
+
+    @property
+    def name(self) -> str:
+        return self.ring.name
+
+    def publish(self, packet, timestamp: float | None = None) -> int:
+        """Write one complete, checked frame and return its sequence number."""
+        return self.ring.write(packet, time.time() if timestamp is None else timestamp)
+
+    def close(self):
+        self.ring.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class BusSubscriber:
+    """Read-only view of a bus, starting after its newest frame by default."""
+
+    def __init__(self, name: str = DEFAULT_BUS, start: int | None = None):
+        self.ring = SharedRing.attach(name)
+        self.num_samples = self.ring.slot_size - packet_size(0)
+        self.reader = RingReader(self.ring, start)
+
+    @property
+    def lost(self) -> int:
+        """Frames overwritten before this subscriber got to them or while it copied them."""
+        return self.reader.lost
+
+    @property
+    def closed(self) -> bool:
+        """True once the daemon has stopped and everything it wrote was read."""
+        return self.ring.closed and self.reader.pending() <= 0
+
+    def read(self, copy: bool = False) -> tuple[int, float, np.ndarray] | None:
+        """Next (sequence, UNIX timestamp, frame view), None if there is nothing new.
+
+        With `copy` the frame is a copy that was checked to be complete; frames
+        overwritten during the copy are skipped and counted in `lost`.
+        """
+        return self.reader.read(copy=copy)
+
+    def wait(self, timeout: float | None = None) -> bool:
+        return self.reader.wait(timeout)
+
+    def valid(self, sequence: int) -> bool:
+        """True while the frame of `sequence` has not been overwritten."""
+        return self.ring.valid(sequence)
+
+    def frame(self, packet) -> Frame:
+        """Decode a frame view; the samples are a view as well."""
+        return decode_packet(packet, self.num_samples, verify=False)  # Checked by the daemon
+
+    def close(self):
+        self.reader = None
+        self.ring.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def serial_frames(port: str, baud_rate: int, num_samples: int):
+    import serial
+
+    deframer = Deframer(num_samples)
+    with serial.Serial(port, baud_rate, timeout=1) as ser:
+        print(f"🔌 Reading {port} at {baud_rate} baud")
+        while True:
+            packet = deframer.next_frame()
+            if packet is not None:
+                yield packet
+                continue
+            deframer.feed(ser.read(max(ser.in_waiting, deframer.missing)))
+
+
+def udp_frames(port: int, num_samples: int):
+    deframer = Deframer(num_samples)
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        sock.bind(("", port))
+        print(f"📡 Reading UDP port {port}")
+        while True:
+            datagram, _addr = sock.recvfrom(UDP_RECV_SIZE)
+            yield from datagram_frames(deframer, datagram)
+
+
+def serve(args):
+    if args.force:
+        try:
+            stale = shared_memory.SharedMemory(args.bus)  # Left behind by a daemon that was killed
+            stale.close()
+            stale.unlink()
+        except FileNotFoundError:
+            pass
+    if args.udp_port:
+        frames = udp_frames(args.udp_port, args.samples)
+    elif args.uart_port:
+        frames = serial_frames(args.uart_port, args.baud_rate, args.samples)
+    else:
+        raise SystemExit("Either --uart-port or --udp-port is required")
+
+    try:
+        publisher = BusPublisher(args.samples, args.bus, args.slots)
+    except FileExistsError:
+        raise SystemExit(f"Bus {args.bus} exists already. Is another daemon running? If not, use --force.")
+    print(f"🚌 Publishing {args.samples} samples per ping on bus {publisher.name} ({args.slots} slots)")
+    with publisher:
+        try:
+            for count, packet in enumerate(frames, 1):
+                publisher.publish(packet)
+                if args.verbose and count % 100 == 0:
+                    print(f"{count} frames published")
+        except OSError as e:
+            print(f"❌ {e}")  # Serial port unplugged; the subscribers see the bus closed
+
+
+def record(args):
+    from recording import Recorder
+
+    with BusSubscriber(args.bus) as bus:
+        with Recorder(args.directory, bus.num_samples) as recorder:
+            print(f"⏺️ Recording bus {args.bus} to {recorder.directory}")
+            while bus.wait() or not bus.closed:
+                while (entry := bus.read(copy=True)) is not None:  # No torn frames in the recording
+                    _, timestamp, packet = entry
+                    recorder.write(packet, timestamp)
+            print(f"⏹️ Daemon stopped. {recorder.recorded} pings recorded, {bus.lost} lost")
+
+
+def dbt_sentence(depth_m: float) -> bytes:
+    body = f"SDDBT,{depth_m * 3.28084:.1f},f,{depth_m:.1f},M,{depth_m * 0.546807:.1f},F"
+    checksum = 0
+    for char in body:
+        checksum ^= ord(char)
+    return f"${body}*{checksum:02X}\r\n".encode("ascii")
+
+
+def nmea(args):
+    server = socket.create_server(("", args.port))
+    server.setblocking(False)
+    clients: list[socket.socket] = []
+    print(f"📡 Serving NMEA0183 DBT on TCP port {args.port}")
+
+    with BusSubscriber(args.bus) as bus, server:
+        last_sent = 0.0
+        while bus.wait(timeout=1.0) or not bus.closed:
+            try:
+                client, address = server.accept()
+                client.setblocking(False)
+                clients.append(client)
+                print(f"✅ NMEA client {address[0]} connected")
+            except BlockingIOError:
+                pass
+
+            latest = None
+            while (entry := bus.read()) is not None:
+                latest = entry
+            if latest is None or latest[1] - last_sent < 1 / args.max_rate:
+                continue
+            sequence, last_sent, packet = latest
+            depth = bus.frame(packet).depth
+            if not bus.valid(sequence):
+                continue
+            sentence = dbt_sentence(depth * args.resolution / 100)
+            for client in list(clients):
+                try:
+                    client.send(sentence)
+                except (BlockingIOError, OSError):
+                    clients.remove(client)  # Gone or not reading, it can reconnect
+                    client.close()
+        for client in clients:
+            client.close()
+
+
+def status(args):
+    with BusSubscriber(args.bus) as bus:
+        head = bus.ring.head
+        entry = bus.ring.view(head) if head >= 0 else None
+        age = f"{time.time() - entry[0]:.1f} s ago" if entry else "never"
+        state = "closed" if bus.ring.closed else "open"
+        print(
+            f"Bus {args.bus}: {state}, {bus.num_samples} samples per ping, {bus.ring.slots} slots, "
+            f"{head + 1} frames published, last {age}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Open Echo shared-memory frame bus")
+    parser.add_argument("--bus", default=DEFAULT_BUS, help=f"Bus name (default: {DEFAULT_BUS})")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    serve_parser = commands.add_parser("serve", help="Read the sounder and publish its frames")
+    serve_parser.add_argument("-p", "--uart-port", help="UART device (e.g. COM3 or /dev/ttyUSB0)")
+    serve_parser.add_argument("-b", "--baud-rate", type=int, default=250000, help="UART baud rate (default: 250000)")
+    serve_parser.add_argument("--udp-port", type=int, help="Read frames from this UDP port instead, e.g. from the relay")
+    serve_parser.add_argument("-n", "--samples", type=int, default=DEFAULT_NUM_SAMPLES, help="Samples per ping (default: 1800)")
+    serve_parser.add_argument("--slots", type=int, default=DEFAULT_SLOTS, help=f"Pings kept in the bus (default: {DEFAULT_SLOTS})")
+    serve_parser.add_argument("--force", action="store_true", help="Remove a bus left behind by a daemon that was killed")
+    serve_parser.add_argument("-v", "--verbose", action="store_true", help="Print progress")
+
+    record_parser = commands.add_parser("record", help="Record every ping on the bus")
+    record_parser.add_argument("--directory", default="recordings", help="Recording directory (default: recordings)")
+
+    nmea_parser = commands.add_parser("nmea", help="Serve the firmware depth as NMEA0183 DBT over TCP")
+    nmea_parser.add_argument("--port", type=int, default=10110, help="TCP port (default: 10110)")
+    nmea_parser.add_argument("--resolution", type=float, default=DEFAULT_RESOLUTION, help="cm per sample (default: water at 13.2 µs)")
+    nmea_parser.add_argument("--max-rate", type=float, default=1.0, help="Sentences per second (default: 1)")
+
+    commands.add_parser("status", help="Show the state of the bus")
+
+    args = parser.parse_args()
+    try:
+        {"serve": serve, "record": record, "nmea": nmea, "status": status}[args.command](args)
+    except FileNotFoundError as e:
+        if args.command == "serve":
+            raise
+        raise SystemExit(f"Bus {args.bus} not found, start it with: python echo_bus.py serve ({e})")
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
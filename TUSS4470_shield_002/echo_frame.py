@@ -0,0 +1,249 @@
+"""Shared decoding of the Open Echo serial frame.
+
+The firmware (`sendData` in the Arduino sketches) writes one packed frame per ping:
+
+    0xAA | depth:uint16 | temp:int16 (x100) | vDrv:uint16 (x100) | NUM_SAMPLES x uint8 | checksum
+
+All multi-byte fields are little-endian and the checksum is the XOR of every byte
+between the start byte and the checksum itself.
+
+This module is used by the Qt interface, the web backend and the UART -> UDP relay,
+so it only depends on NumPy.
+"""
+
+from functools import lru_cache
+from typing import NamedTuple
+
+import numpy as np
+
+START_BYTE = 0xAA
+HEADER_SIZE = 6  # depth, temperature, drive voltage
+DEFAULT_NUM_SAMPLES = 1800
+
+HEADER_DTYPE = np.dtype(
+    [
+        ("depth", "<u2"),
+        ("temperature", "<i2"),
+        ("drive_voltage", "<u2"),
+    ]
+)
+
+
+class FrameError(ValueError):
+    """Raised when a buffer does not contain a well-formed frame."""
+
+
+class ChecksumError(FrameError):
+    """Raised when the frame checksum does not match its payload."""
+
+
+class Frame(NamedTuple):
+    samples: np.ndarray
+    depth: int
+    temperature: float
+    drive_voltage: float
+
+
+def payload_size(num_samples: int = DEFAULT_NUM_SAMPLES) -> int:
+    """Bytes between the start byte and the checksum."""
+    return HEADER_SIZE + num_samples
+
+
+def packet_size(num_samples: int = DEFAULT_NUM_SAMPLES) -> int:
+    """Bytes of a complete frame including start byte and checksum."""
+    return 1 + payload_size(num_samples) + 1
+
+
+@lru_cache(maxsize=None)
+def frame_dtype(num_samples: int = DEFAULT_NUM_SAMPLES) -> np.dtype:
+    """Structured dtype describing a complete frame, compiled once per sample count."""
+    return np.dtype(
+        [
+            ("start", "u1"),
+            ("depth", "<u2"),
+            ("temperature", "<i2"),
+            ("drive_voltage", "<u2"),
+            ("samples", "u1", (num_samples,)),
+            ("checksum", "u1"),
+        ]
+    )
+
+
+def xor_checksum(payload) -> int:
+    """XOR of all bytes in `payload` (any buffer-protocol object)."""
+    return int(np.bitwise_xor.reduce(np.frombuffer(payload, dtype=np.uint8)))
+
+
+def checksum_ok(payload, checksum: int) -> bool:
+    return xor_checksum(payload) == checksum
+
+
+def decode_payload(payload, num_samples: int = DEFAULT_NUM_SAMPLES) -> Frame:
+    """Decode the header fields and samples of a payload (without start byte and checksum).
+
+    The returned samples are a read-only view on `payload`; copy them if the
+    underlying buffer is going to be reused.
+    """
+    if len(payload) != payload_size(num_samples):
+        raise FrameError("Invalid payload length")
+
+    header = np.frombuffer(payload, dtype=HEADER_DTYPE, count=1)
+    samples = np.frombuffer(payload, dtype=np.uint8, count=num_samples, offset=HEADER_SIZE)
+
+    return Frame(
+        samples,
+        min(int(header["depth"][0]), num_samples),
+        int(header["temperature"][0]) / 100.0,
+        int(header["drive_voltage"][0]) / 100.0,
+    )
+
+
+def decode_packet(packet, num_samples: int = DEFAULT_NUM_SAMPLES, verify: bool = True) -> Frame:
+    """Decode a complete frame (start byte, payload and checksum).
+
+    Raises `FrameError` for a malformed buffer and `ChecksumError` if `verify`
+    is set and the checksum does not match.
+    """
+    if len(packet) != packet_size(num_samples):
+        raise FrameError("Invalid packet length")
+
+    raw = np.frombuffer(packet, dtype=np.uint8)
+    if raw[0] != START_BYTE:
+        raise FrameError("Missing start byte")
+
+    if verify and np.bitwise_xor.reduce(raw[1:-1]) != raw[-1]:
+        raise ChecksumError("Checksum mismatch")
+
+    record = np.frombuffer(packet, dtype=frame_dtype(num_samples), count=1)
+    return Frame(
+        record["samples"][0],
+        min(int(record["depth"][0]), num_samples),
+        int(record["temperature"][0]) / 100.0,
+        int(record["drive_voltage"][0]) / 100.0,
+    )
+
+
+def encode_packet(
+    samples,
+    depth: int = 0,
+    temperature: float = 0.0,
+    drive_voltage: float = 0.0,
+) -> bytes:
+    """Build a frame the same way the firmware's `sendData` does."""
+    samples = np.asarray(samples, dtype=np.uint8)
+    num_samples = samples.shape[0]
+
+    record = np.zeros(1, dtype=frame_dtype(num_samples))
+    record["start"] = START_BYTE
+    record["depth"] = depth
+    record["temperature"] = round(temperature * 100)
+    record["drive_voltage"] = round(drive_voltage * 100)
+    record["samples"] = samples
+
+    packet = bytearray(record.tobytes())
+    packet[-1] = xor_checksum(memoryview(packet)[1:-1])
+    return bytes(packet)
+
+
+class Deframer:
+    """Incremental frame extractor for a raw byte stream (serial port or UDP).
+
+    Data is appended in large chunks with `feed()`; complete frames are taken out
+    with `next_frame()` or by iterating. Candidate start bytes are located with
+    `bytearray.find` and confirmed by the checksum. If a candidate turns out to be
+    a sample byte that happens to be 0xAA, the search resumes at the next byte so
+    a real frame starting inside the false one is not lost.
+
+    Frames are returned as memoryviews into the internal buffer. They are only
+    valid until the next call to `feed()`, so copy anything that has to outlive it.
+    """
+
+    def __init__(self, num_samples: int = DEFAULT_NUM_SAMPLES, capacity: int | None = None):
+        self.num_samples = num_samples
+        self.packet_size = packet_size(num_samples)
+
+        self._buf = bytearray(capacity or 4 * self.packet_size)
+        self._view = memoryview(self._buf)
+        self._start = 0  # first byte not consumed yet
+        self._end = 0  # end of buffered data
+
+        self.frames = 0
+        self.checksum_errors = 0
+        self.skipped_bytes = 0
+
+    def __len__(self):
+        return self._end - self._start
+
+    def __iter__(self):
+        while (frame := self.next_frame()) is not None:
+            yield frame
+
+    @property
+    def missing(self) -> int:
+        """Minimum number of bytes needed before another frame can complete."""
+        return max(1, self.packet_size - len(self))
+
+    def feed(self, data) -> None:
+        """Append a chunk of received bytes."""
+        size = len(data)
+        if self._end + size > len(self._buf):
+            self._make_room(size)
+        self._buf[self._end:self._end + size] = data
+        self._end += size
+
+    def _make_room(self, size: int):
+        pending = self._end - self._start
+        if pending + size > len(self._buf):
+            # Allocate a new buffer; views handed out earlier keep the old one alive.
+            new_buf = bytearray(max(2 * len(self._buf), pending + size))
+            new_buf[:pending] = self._view[self._start:self._end]
+            self._buf = new_buf
+            self._view = memoryview(new_buf)
+        else:
+            self._buf[:pending] = self._view[self._start:self._end]
+        self._start = 0
+        self._end = pending
+
+    def datagram_frames(self, data):
+        """Yield the frames completed by one UDP datagram.
+
+        The common case of exactly one aligned frame per datagram is validated in
+        place and yielded as a view on `data` itself, without going through the
+        buffer. Anything else (several frames, partial frames, garbage) is fed to
+        the buffer and sliced out in bulk.
+        """
+        if self._end == self._start and len(data) == self.packet_size and data[0] == START_BYTE:
+            raw = np.frombuffer(data, dtype=np.uint8)
+            if np.bitwise_xor.reduce(raw[1:-1]) == raw[-1]:
+                self.frames += 1
+                yield memoryview(data)
+                return
+
+        self.feed(data)
+        yield from self
+
+    def next_frame(self) -> memoryview | None:
+        """Return the next frame with a valid checksum, or None if more data is needed."""
+        size = self.packet_size
+        while self._end - self._start >= size:
+            pos = self._buf.find(START_BYTE, self._start, self._end)
+            if pos < 0:
+                self.skipped_bytes += self._end - self._start
+                self._start = self._end
+                return None
+
+            self.skipped_bytes += pos - self._start
+            self._start = pos
+            if self._end - pos < size:
+                return None
+
+            raw = np.frombuffer(self._buf, dtype=np.uint8, count=size, offset=pos)
+            if np.bitwise_xor.reduce(raw[1:-1]) == raw[-1]:
+                self._start = pos + size
+                self.frames += 1
+                return self._view[pos:pos + size]
+
+            # False start byte: resync from the byte right after it
+            self.checksum_errors += 1
+            self._start = pos + 1
+        return None
@@ -2,7 +2,6 @@ import sys
 import numpy as np
 import serial
 import serial.tools.list_ports
-import struct
 import time
 import socket
 from PyQt5.QtWidgets import (
@@ -26,6 +25,14 @@ from PyQt5.QtGui import QPalette, QColor
 from PyQt5.QtWidgets import QVBoxLayout, QLabel, QCheckBox, QLineEdit
 from PyQt5.QtWidgets import QApplication
 
+from bottom import BottomDetector
+from echo_bus import DEFAULT_BUS, BusSubscriber
+from echo_frame import Deframer, decode_packet, packet_size
+from frame_codec import datagram_frames
+from recording import Recorder
+from udp_link import LinkTracker
+from waterfall import WaterfallHistory
+
 # Serial Configuration
 BAUD_RATE = 250000
 NUM_SAMPLES = 1800 # (X-axis)
@@ -47,44 +54,41 @@ SAMPLE_TIME = 13.2e-6     # 13.2 microseconds on Atmega328 max sample speed with
 # SAMPLE_TIME = 1.290e-6     # 13.2 microseconds on RP2040 max sample speed without additional delay
 
 DEFAULT_LEVELS = (0, 256)  # Expected data range
+AUTO_LEVELS = "sigma"  # Auto gain: "sigma" (mean ± 2σ of the history) or "percentile"
+AUTO_LEVELS_PERCENTILES = (2, 98)  # Low/high percentiles used by the "percentile" auto gain
+
+RECORDING_DIRECTORY = "recordings"  # Where the "Record" button stores raw pings (see recording.py)
+RECORDING_MAX_MEGABYTES = 256  # Start a new recording file after this size ...
+RECORDING_MAX_MINUTES = 60  # ... or after this many minutes
+
+DEPTH_SOURCE = "firmware"  # "firmware" (depth index sent by the sounder) or "host" (bottom tracking in bottom.py)
+BLIND_ZONE = 450  # Samples ignored by the host bottom tracking, same as BLINDZONE_SAMPLE_END in the firmware
+UDP_MULTICAST_GROUP = None  # e.g. "239.255.0.1" to receive from `UART_UDP_relay.py --multicast 239.255.0.1`
+LINK_REPORT_INTERVAL = 1.0  # Seconds between updates of the UDP link statistics
 
 SAMPLE_RESOLUTION = (SPEED_OF_SOUND * SAMPLE_TIME * 100) / 2  # cm per row (0.99 cm per row)
-PACKET_SIZE = 1 + 6 + NUM_SAMPLES + 1  # header + payload + checksum
+PACKET_SIZE = packet_size(NUM_SAMPLES)  # header + payload + checksum
 MAX_DEPTH = NUM_SAMPLES * SAMPLE_RESOLUTION  # Total depth in cm
 depth_labels = {int(i / SAMPLE_RESOLUTION): f"{i / 100}" for i in range(0, int(MAX_DEPTH), Y_LABEL_DISTANCE)}
 
 
-def read_packet(ser):
+def read_packet(ser, deframer, recorder=None):
+    """Return the next valid packet from `ser`, reading whole chunks into `deframer`."""
     while True:
-        header = ser.read(1)
-        if header != b"\xaa":
-            continue  # Wait for the start byte
-
-        payload = ser.read(6 + NUM_SAMPLES)
-        checksum = ser.read(1)
-
-        if len(payload) != 6 + NUM_SAMPLES or len(checksum) != 1:
-            continue  # Incomplete packet
-
-        # Verify checksum
-        calc_checksum = 0
-        for byte in payload:
-            calc_checksum ^= byte
-        if calc_checksum != checksum[0]:
-            print("⚠️ Checksum mismatch: {} != {}".format(calc_checksum, checksum[0]))
-            continue
+        checksum_errors = deframer.checksum_errors
+        packet = deframer.next_frame()
+        if deframer.checksum_errors != checksum_errors:
+            print("⚠️ Checksum mismatch, resynchronizing")
 
-        # Unpack payload (firmware sends little-endian raw struct bytes)
-        depth, temp_scaled, vDrv_scaled = struct.unpack("<HhH", payload[:6])
-        depth = min(depth, NUM_SAMPLES)
+        if packet is not None:
+            if recorder is not None:
+                recorder.write(packet)
+            # Unpack payload (firmware sends little-endian raw struct bytes)
+            values, depth, temperature, drive_voltage = decode_packet(packet, NUM_SAMPLES, verify=False)
+            return values.copy(), depth, temperature, drive_voltage
 
-        sample_bytes = payload[6:6+NUM_SAMPLES]
-        values = np.frombuffer(sample_bytes, dtype=np.uint8, count=NUM_SAMPLES)
-
-        temperature = temp_scaled / 100.0
-        drive_voltage = vDrv_scaled / 100.0
-
-        return values, depth, temperature, drive_voltage
+        # Block until at least the rest of the current frame arrived, but take everything buffered
+        deframer.feed(ser.read(max(ser.in_waiting, deframer.missing)))
 
 
 def generate_dbt_sentence(depth_cm):
@@ -132,14 +136,16 @@ class SerialReader(QThread):
         self.port = port
         self.baud_rate = baud_rate
         self.running = True
+        self.recorder = None  # set while recording, frames are handed over without blocking
 
     def run(self):
         """Continuously read serial data and emit processed arrays."""
         try:
             with serial.Serial(self.port, BAUD_RATE, timeout=1) as ser:
                 print("connected")
+                deframer = Deframer(NUM_SAMPLES)
                 while self.running:
-                    result = read_packet(ser)
+                    result = read_packet(ser, deframer, self.recorder)
                     if result:
                         values, depth, temperature, drive_voltage = result
                         print(f"Depth: {depth}, Temp: {temperature}°C, Vdrv: {drive_voltage}V")
@@ -161,9 +167,10 @@ class UDPReader(QThread):
     """Thread for reading sonar packets over UDP.
 
     Expected packet format (single datagram per packet or stream inside datagram):
-    0xAA | 6 bytes header payload (depth:uint16_be, temp:int16_be (scaled x100), vDrv:uint16_be (scaled x100)) | NUM_SAMPLES bytes | checksum (xor of payload bytes)
+    0xAA | 6 bytes header payload (depth:uint16_le, temp:int16_le (scaled x100), vDrv:uint16_le (scaled x100)) | NUM_SAMPLES bytes | checksum (xor of payload bytes)
     """
     data_received = pyqtSignal(np.ndarray, float, float, float)
+    link_stats = pyqtSignal(str)
 
     def __init__(self, port: int, timeout: float = 1.0):
         super().__init__()
@@ -171,6 +178,8 @@ class UDPReader(QThread):
         self.port = port
         self.timeout = timeout
         self.running = True
+        self.recorder = None  # set while recording, frames are handed over without blocking
+        self.link = LinkTracker()  # loss, reordering and jitter with UART_UDP_relay.py --sequence
         self._sock = None
 
     def run(self):
@@ -178,68 +187,45 @@ class UDPReader(QThread):
             import socket as _socket
             self._sock = _socket.socket(_socket.AF_INET, _socket.SOCK_DGRAM)
             self._sock.settimeout(self.timeout)
+            if UDP_MULTICAST_GROUP:
+                # Like the web backend, so both can join the group on one host
+                self._sock.setsockopt(_socket.SOL_SOCKET, getattr(_socket, "SO_REUSEPORT", _socket.SO_REUSEADDR), 1)
             self._sock.bind((self.host, self.port))
             print(f"📡 UDP listener bound to {self.host}:{self.port}")
-            RECV_SIZE = PACKET_SIZE  # we only need at least a packet, can be tuned
-            packet_buf = bytearray()
-            packets_ok = 0
-            checksum_errors = 0
+            if UDP_MULTICAST_GROUP:
+                membership = _socket.inet_aton(UDP_MULTICAST_GROUP) + _socket.inet_aton("0.0.0.0")
+                self._sock.setsockopt(_socket.IPPROTO_IP, _socket.IP_ADD_MEMBERSHIP, membership)
+                print(f"📡 Joined multicast group {UDP_MULTICAST_GROUP}")
+            RECV_SIZE = 65535  # a datagram may carry several packets
+            deframer = Deframer(NUM_SAMPLES)
+            last_report = time.monotonic()
 
             while self.running:
+                deadline = self.link.deadline  # datagrams held back for reordering
+                timeout = self.timeout if deadline is None else max(deadline - time.perf_counter(), 0.001)
+                self._sock.settimeout(min(timeout, self.timeout))
                 try:
                     datagram, _addr = self._sock.recvfrom(RECV_SIZE)
+                    due = self.link.receive(datagram, time.perf_counter())
                 except _socket.timeout:
-                    continue
-
-                # Iterate each byte to simulate single-byte reads
-                for byte in datagram:
-                    if not packet_buf:
-                        # Waiting for start byte
-                        if byte == 0xAA:
-                            packet_buf.append(byte)
-                        else:
-                            continue
-                    else:
-                        packet_buf.append(byte)
-
-                    # Once we have a full packet length, process it
-                    if len(packet_buf) == PACKET_SIZE:
-                        # Structure: [0xAA][payload...][checksum]
-                        payload = packet_buf[1:1 + 6 + NUM_SAMPLES]
-                        checksum = packet_buf[-1]
-                        calc = 0
-                        for b in payload:
-                            calc ^= b
-                        if calc == checksum:
-                            try:
-                                depth, temp_scaled, vDrv_scaled = struct.unpack("<HhH", payload[:6])
-                                depth = min(depth, NUM_SAMPLES)
-                                sample_bytes = payload[6:6+NUM_SAMPLES]
-                                if len(sample_bytes) != NUM_SAMPLES:
-                                    # Corrupt packet length inside payload
-                                    checksum_errors += 1
-                                else:
-                                    values = np.frombuffer(sample_bytes, dtype=np.uint8, count=NUM_SAMPLES)
-                                    temperature = temp_scaled / 100.0
-                                    drive_voltage = vDrv_scaled / 100.0
-                                    self.data_received.emit(values, depth, temperature, drive_voltage)
-                                    packets_ok += 1
-                                    # Skip the old emit below by continuing
-                            except struct.error:
-                                # Parsing error; treat as checksum failure for stats
-                                checksum_errors += 1
-                        else:
-                            checksum_errors += 1
-
-                        # Reset for next packet. If the last byte (checksum) is also a header (0xAA), start new packet immediately.
-                        last_byte = packet_buf[-1]
-                        packet_buf.clear()
-                        if last_byte == 0xAA:
-                            packet_buf.append(last_byte)
-
-                # Optional: could log stats every N packets
-                if (packets_ok + checksum_errors) and (packets_ok + checksum_errors) % 200 == 0:
-                    print(f"UDP stats: ok={packets_ok} bad={checksum_errors}")
+                    due = self.link.poll(time.perf_counter())
+
+                for payload, _received in due:
+                    for packet in datagram_frames(deframer, payload):  # Raw or compressed (frame_codec.py)
+                        recorder = self.recorder
+                        if recorder is not None:
+                            recorder.write(packet)
+                        values, depth, temperature, drive_voltage = decode_packet(packet, NUM_SAMPLES, verify=False)
+                        if values.flags.writeable:
+                            values = values.copy()  # view on the deframer buffer, which gets reused
+                        self.data_received.emit(values, depth, temperature, drive_voltage)
+
+                if time.monotonic() - last_report >= LINK_REPORT_INTERVAL:
+                    last_report = time.monotonic()
+                    text = f"ok={deframer.frames} bad={deframer.checksum_errors}"
+                    if self.link.received:  # The relay sends sequence numbers
+                        text += f"  {self.link.summary()}"
+                    self.link_stats.emit(text)
         except Exception as e:
             print(f"❌ UDP Reader error: {e}")
         finally:
@@ -263,12 +249,59 @@ class UDPReader(QThread):
         self.wait()
 
 
+class BusReader(QThread):
+    """Thread for reading pings from the shared memory bus of `echo_bus.py serve`.
+
+    The daemon owns the serial port, so the web interface or a recorder can use
+    the same sounder at the same time.
+    """
+    data_received = pyqtSignal(np.ndarray, float, float, float)
+
+    def __init__(self, name: str = DEFAULT_BUS, timeout: float = 1.0):
+        super().__init__()
+        self.name = name
+        self.timeout = timeout
+        self.running = True
+        self.recorder = None  # set while recording, frames are handed over without blocking
+
+    def run(self):
+        try:
+            with BusSubscriber(self.name) as bus:
+                if bus.num_samples != NUM_SAMPLES:
+                    print(f"❌ Bus {self.name} carries {bus.num_samples} samples, NUM_SAMPLES is {NUM_SAMPLES}")
+                    return
+                print(f"🚌 Reading pings from shared memory bus {self.name}")
+                while self.running:
+                    if not bus.wait(self.timeout):
+                        if bus.closed:
+                            print(f"⏹️ Acquisition daemon of bus {self.name} stopped")
+                            break
+                        continue
+                    # Copied out of the ring, the signal is delivered later and the slot gets reused
+                    while (entry := bus.read(copy=True)) is not None:
+                        _, timestamp, packet = entry
+                        recorder = self.recorder
+                        if recorder is not None:
+                            recorder.write(packet, timestamp)
+                        values, depth, temperature, drive_voltage = bus.frame(packet)
+                        self.data_received.emit(values, depth, temperature, drive_voltage)
+                if bus.lost:
+                    print(f"⚠️ {bus.lost} pings lost on bus {self.name}")
+        except FileNotFoundError:
+            print(f"❌ Bus {self.name} not found, start it with: python echo_bus.py serve")
+
+    def stop(self):
+        self.running = False
+        self.quit()
+        self.wait()
+
+
 class SettingsDialog(QWidget):
     def __init__(self, parent=None, current_gradient='cyclic', current_speed=343, nmea_enabled=False, nmea_port=10110,
-                 nmea_address="127.0.0.1"):
+                 nmea_address="127.0.0.1", current_auto_levels=AUTO_LEVELS):
         super().__init__(parent)
         self.setWindowTitle("Chart Settings")
-        self.setFixedSize(320, 550)
+        self.setFixedSize(320, 610)
 
         self.main_app = parent
 
@@ -311,6 +344,13 @@ class SettingsDialog(QWidget):
         self.speed_dropdown.setCurrentIndex(1 if current_speed == 1440 else 0)
         card_layout.addWidget(self.speed_dropdown)
 
+        # --- Auto Gain ---
+        card_layout.addWidget(QLabel("Auto Gain:"))
+        self.auto_levels_dropdown = QComboBox()
+        self.auto_levels_dropdown.addItems(["Mean ± 2σ", "Percentile"])
+        self.auto_levels_dropdown.setCurrentIndex(1 if current_auto_levels == "percentile" else 0)
+        card_layout.addWidget(self.auto_levels_dropdown)
+
         # --- NMEA Output Section ---
         nmea_section = QVBoxLayout()
         nmea_section.setSpacing(8)
@@ -436,6 +476,7 @@ class SettingsDialog(QWidget):
     def apply_settings(self):
         selected_gradient = self.gradient_dropdown.currentText()
         selected_speed = 343 if self.speed_dropdown.currentIndex() == 0 else 1440
+        selected_auto_levels = "percentile" if self.auto_levels_dropdown.currentIndex() == 1 else "sigma"
         nmea_enabled = self.nmea_enable_checkbox.isChecked()
         nmea_port = (
             int(self.port_input.text()) if self.port_input.text().isdigit() else 10110
@@ -444,6 +485,7 @@ class SettingsDialog(QWidget):
         if self.main_app:
             self.main_app.set_gradient(selected_gradient)
             self.main_app.set_sound_speed(selected_speed)
+            self.main_app.set_auto_levels(selected_auto_levels)
             self.main_app.configure_nmea_output(enabled=nmea_enabled, port=nmea_port)
             self.main_app.set_large_depth_display(self.large_depth_checkbox.isChecked())
 
@@ -454,6 +496,7 @@ class WaterfallApp(QMainWindow):
     def __init__(self):
         super().__init__()
         self.serial_thread = None  # ✅ Define it early to avoid AttributeError
+        self.recorder = None
 
         self.nmea_enabled = False
         self.nmea_port = 10110
@@ -462,11 +505,13 @@ class WaterfallApp(QMainWindow):
 
         self.current_gradient = 'cyclic'  # default color scheme
         self.current_speed = SPEED_OF_SOUND  # default sound speed (343)
+        self.auto_levels = AUTO_LEVELS
 
         self.setWindowTitle("Open Echo Interface")
         self.setGeometry(0, 0, 480, 800)  # Portrait mode for Raspberry Pi screen
 
-        self.data = np.zeros((MAX_ROWS, NUM_SAMPLES))
+        self.history = WaterfallHistory(MAX_ROWS, NUM_SAMPLES)
+        self.bottom_detector = BottomDetector(NUM_SAMPLES, BLIND_ZONE) if DEPTH_SOURCE == "host" else None
 
         # Disable window translucency
         self.setAttribute(Qt.WA_TranslucentBackground, False)
@@ -488,9 +533,13 @@ class WaterfallApp(QMainWindow):
         central_widget.setLayout(main_layout)
 
         # === Waterfall Plot ===
+        # The ring buffer history is drawn as two tiles: the older rows on the left
+        # and the rows written since the ring last wrapped on the right.
         self.waterfall = pg.PlotWidget()
         self.imageitem = pg.ImageItem(axisOrder="row-major")
+        self.imageitem_new = pg.ImageItem(axisOrder="row-major")
         self.waterfall.addItem(self.imageitem)
+        self.waterfall.addItem(self.imageitem_new)
         self.waterfall.setMouseEnabled(x=False, y=False)
         self.waterfall.setMinimumHeight(400)  # Slightly more vertical space
         self.waterfall.invertY(True)
@@ -520,9 +569,12 @@ class WaterfallApp(QMainWindow):
         # === Colorbar BELOW the plot to save width ===
         self.colorbar = pg.HistogramLUTWidget()
         self.colorbar.setImageItem(self.imageitem)
+        self.colorbar.item.sigLookupTableChanged.connect(self.sync_lookup_table)
         self.colorbar.item.gradient.loadPreset("cyclic")
         # self.colorbar.setMaximumHeight(80)
         self.imageitem.setLevels(DEFAULT_LEVELS)
+        self.imageitem_new.setLevels(DEFAULT_LEVELS)
+        self.update_waterfall_image()
 
         # main_layout.addWidget(self.colorbar)
 
@@ -547,6 +599,26 @@ class WaterfallApp(QMainWindow):
 
         controls_layout.addLayout(udp_row)
 
+        # Frames, loss and jitter of the UDP link (loss and jitter need UART_UDP_relay.py --sequence)
+        self.link_label = QLabel("")
+        self.link_label.setWordWrap(True)
+        controls_layout.addWidget(self.link_label)
+
+        # === Shared Memory Bus Row ===
+        bus_row = QHBoxLayout()
+
+        bus_row.addWidget(QLabel("Bus:"))
+        self.bus_name_input = QLineEdit()
+        self.bus_name_input.setText(DEFAULT_BUS)
+        self.bus_name_input.setMaximumWidth(100)
+        bus_row.addWidget(self.bus_name_input)
+
+        self.bus_connect_button = QPushButton("Connect Bus")
+        self.bus_connect_button.clicked.connect(self.toggle_bus_connection)
+        bus_row.addWidget(self.bus_connect_button)
+
+        controls_layout.addLayout(bus_row)
+
         # === Large Depth Display ===
         self.large_depth_label = QLabel("--- m")
         self.large_depth_label.setAlignment(Qt.AlignCenter)
@@ -599,6 +671,12 @@ class WaterfallApp(QMainWindow):
         self.send_button.clicked.connect(self.send_hex_value)
         hex_row.addWidget(self.send_button)
 
+        # ⏺ Record button
+        self.record_button = QPushButton("Record")
+        self.record_button.setCheckable(True)
+        self.record_button.toggled.connect(self.set_recording)
+        hex_row.addWidget(self.record_button)
+
         # ➕ Settings button
         self.settings_button = QPushButton("Settings")
         self.settings_button.clicked.connect(self.open_settings)
@@ -623,7 +701,11 @@ class WaterfallApp(QMainWindow):
         try:
             udp_port = int(self.udp_port_input.text())
             self.udp_thread = UDPReader(port=udp_port)
+            self.udp_thread.recorder = self.recorder
+            if self.bottom_detector:
+                self.bottom_detector.reset()
             self.udp_thread.data_received.connect(self.waterfall_plot_callback)
+            self.udp_thread.link_stats.connect(self.link_label.setText)
             self.udp_thread.start()
             print(f"✅ UDP listener started on port {udp_port}")
         except Exception as e:
@@ -633,6 +715,7 @@ class WaterfallApp(QMainWindow):
         if hasattr(self, 'udp_thread') and self.udp_thread:
             self.udp_thread.stop()
             self.udp_thread = None
+            self.link_label.setText("")
             print("🔌 UDP listener stopped")
 
     def toggle_udp_connection(self):
@@ -644,6 +727,30 @@ class WaterfallApp(QMainWindow):
             if hasattr(self, 'udp_thread') and self.udp_thread.isRunning():
                 self.udp_connect_button.setText("Disconnect UDP")
 
+    def connect_bus(self):
+        self.disconnect_bus()
+        self.bus_thread = BusReader(self.bus_name_input.text().strip() or DEFAULT_BUS)
+        self.bus_thread.recorder = self.recorder
+        if self.bottom_detector:
+            self.bottom_detector.reset()
+        self.bus_thread.data_received.connect(self.waterfall_plot_callback)
+        self.bus_thread.finished.connect(lambda: self.bus_connect_button.setText("Connect Bus"))
+        self.bus_thread.start()
+
+    def disconnect_bus(self):
+        if getattr(self, 'bus_thread', None):
+            self.bus_thread.stop()
+            self.bus_thread = None
+            print("🔌 Bus reader stopped")
+
+    def toggle_bus_connection(self):
+        if getattr(self, 'bus_thread', None) and self.bus_thread.isRunning():
+            self.disconnect_bus()
+            self.bus_connect_button.setText("Connect Bus")
+        else:
+            self.connect_bus()
+            self.bus_connect_button.setText("Disconnect Bus")
+
     def set_large_depth_display(self, enabled: bool):
         self.large_depth_visible = enabled
         self.large_depth_label.setVisible(enabled)
@@ -702,6 +809,9 @@ class WaterfallApp(QMainWindow):
         self.current_gradient = gradient_name
         self.colorbar.item.gradient.loadPreset(gradient_name)
 
+    def set_auto_levels(self, mode):
+        self.auto_levels = mode
+
     def set_sound_speed(self, speed):
         global SPEED_OF_SOUND, SAMPLE_RESOLUTION, MAX_DEPTH, depth_labels
 
@@ -739,6 +849,9 @@ class WaterfallApp(QMainWindow):
         selected_port = self.serial_dropdown.currentText()
         try:
             self.serial_thread = SerialReader(selected_port, BAUD_RATE)
+            self.serial_thread.recorder = self.recorder
+            if self.bottom_detector:
+                self.bottom_detector.reset()
             print(f"🚀 Using Serial reader on {selected_port}")
 
             self.serial_thread.data_received.connect(self.waterfall_plot_callback)
@@ -768,16 +881,63 @@ class WaterfallApp(QMainWindow):
         else:
             print("⚠️ No active serial connection to disconnect")
 
+    def reader_threads(self):
+        return [
+            t for t in (self.serial_thread, getattr(self, 'udp_thread', None), getattr(self, 'bus_thread', None)) if t
+        ]
+
+    def set_recording(self, enabled: bool):
+        """Start or stop writing raw pings to RECORDING_DIRECTORY."""
+        if enabled and self.recorder is None:
+            self.recorder = Recorder(
+                RECORDING_DIRECTORY,
+                NUM_SAMPLES,
+                max_bytes=RECORDING_MAX_MEGABYTES * 1024 * 1024,
+                max_seconds=RECORDING_MAX_MINUTES * 60,
+            )
+            self.recorder.start()
+            print(f"⏺️ Recording to {self.recorder.directory}")
+        elif not enabled and self.recorder is not None:
+            recorder, self.recorder = self.recorder, None
+            for thread in self.reader_threads():
+                thread.recorder = None
+            recorder.stop()
+            print(f"⏹️ Recording stopped, {recorder.recorded} pings written")
+
+        for thread in self.reader_threads():
+            thread.recorder = self.recorder
+        self.record_button.setText("Stop Rec" if self.recorder else "Record")
+
+    def sync_lookup_table(self):
+        """Apply the colorbar's lookup table to the second waterfall tile as well."""
+        self.imageitem_new.setLookupTable(self.imageitem.lut)
+
+    def update_waterfall_image(self):
+        older, newer = self.history.tiles()
+        self.imageitem.setImage(older.T, autoLevels=False)
+        if len(newer):
+            self.imageitem_new.setImage(newer.T, autoLevels=False)
+            self.imageitem_new.setPos(len(older), 0)
+        else:
+            self.imageitem_new.clear()
+
     def waterfall_plot_callback(
         self, spectrogram, depth_index, temperature, drive_voltage
     ):
-        self.data = np.roll(self.data, -1, axis=0)
-        self.data[-1, :] = spectrogram
-        self.imageitem.setImage(self.data.T, autoLevels=False)
+        self.history.append(spectrogram)
+        self.update_waterfall_image()
+
+        if self.auto_levels == "percentile":
+            levels = self.history.levels.percentile_levels(*AUTO_LEVELS_PERCENTILES)
+        else:
+            levels = self.history.levels.sigma_levels(2)
+        self.imageitem.setLevels(levels)
+        self.imageitem_new.setLevels(levels)
 
-        sigma = np.std(self.data)
-        mean = np.mean(self.data)
-        self.imageitem.setLevels((mean - 2 * sigma, mean + 2 * sigma))
+        if self.bottom_detector:
+            tracked = self.bottom_detector.update(spectrogram)
+            if tracked is not None:  # Keep the firmware depth until the bottom is found
+                depth_index = tracked
 
         depth_cm = depth_index * SAMPLE_RESOLUTION
         self.depth_label.setText(f"Depth: {depth_cm:.1f} cm | Index: {depth_index:.0f}")
@@ -847,6 +1007,8 @@ class WaterfallApp(QMainWindow):
             self.serial_thread.stop()
         if hasattr(self, 'udp_thread') and self.udp_thread:
             self.udp_thread.stop()
+        self.disconnect_bus()
+        self.set_recording(False)
 
         event.accept()
 
@@ -860,6 +1022,7 @@ class WaterfallApp(QMainWindow):
             nmea_enabled=self.nmea_output_enabled,
             nmea_port=self.nmea_port,
             nmea_address=device_ip,
+            current_auto_levels=self.auto_levels,
         )
         self.settings_dialog.show()
 
@@ -0,0 +1,206 @@
+"""Compact encodings of Open Echo frames for the UDP link.
+
+A raw frame (see echo_frame.py) is 1808 bytes at 1800 samples, even though
+most of the trace past the bottom is close to zero. `UART_UDP_relay.py --codec`
+sends every frame in an envelope instead:
+
+    0xEC | codec:uint8 | num_samples:uint16 | body length:uint16
+    | depth:uint16 | temp:int16 (x100) | vDrv:uint16 (x100) | frame checksum:uint8 | body
+
+All multi-byte fields are little-endian. The envelope starts with 0xEC, never
+0xAA, so readers can tell it from a raw frame by its first byte. A datagram may
+carry several envelopes back to back (`--batch`). Codecs:
+
+    rle          lossless, (value, run length) byte pairs
+    delta-zlib   lossless, zlib over the differences between neighbouring samples
+    4bit         lossy, the top 4 bits of each sample, two samples per byte
+    4bit-zlib    lossy, 4bit followed by zlib
+
+Frames that a lossless codec would make bigger (RLE on a noisy trace) are sent
+with codec 0, the samples unchanged.
+
+`decode_envelope()` rebuilds a normal frame, so everything after the reader
+stays the same. Lossless codecs restore the exact bytes and keep the firmware's
+checksum. Lossy codecs get a new checksum that matches the quantized samples
+(each sample becomes the middle of its 16-step bucket).
+
+`python benchmarks/bench_codec.py` compares size and encode/decode time.
+
+This module is shared by the relay, the Qt interface and the web backend and
+only depends on NumPy (and zlib from the standard library).
+"""
+
+from enum import IntEnum
+import struct
+import zlib
+
+import numpy as np
+
+from echo_frame import HEADER_SIZE, START_BYTE, Deframer, FrameError, packet_size
+from udp_link import strip_header
+
+ENVELOPE_BYTE = 0xEC
+ENVELOPE_HEADER = struct.Struct("<BBHH6sB")  # start, codec, samples, body length, frame header, checksum
+ZLIB_LEVEL = 6
+MAX_RUN = 255
+
+
+class Codec(IntEnum):
+    RAW = 0  # samples unchanged, the fallback of the lossless codecs
+    RLE = 1
+    DELTA_ZLIB = 2
+    NIBBLE = 3  # 4bit
+    NIBBLE_ZLIB = 4  # 4bit-zlib
+
+    @property
+    def option(self) -> str:
+        """Name used on the command line and in the settings."""
+        return {0: "raw", 1: "rle", 2: "delta-zlib", 3: "4bit", 4: "4bit-zlib"}[self.value]
+
+    @classmethod
+    def from_option(cls, name: str) -> "Codec":
+        for codec in cls:
+            if codec.option == name:
+                return codec
+        raise ValueError(f"Unknown codec {name!r}, use one of {', '.join(c.option for c in cls)}")
+
+    @property
+    def lossless(self) -> bool:
+        return self in (Codec.RAW, Codec.RLE, Codec.DELTA_ZLIB)
+
+
+def _rle_encode(samples: np.ndarray) -> bytes:
+    starts = np.flatnonzero(np.concatenate(([True], samples[1:] != samples[:-1])))
+    lengths = np.diff(np.append(starts, len(samples)))
+    # Runs longer than MAX_RUN become several pairs
+    pieces = (lengths + MAX_RUN - 1) // MAX_RUN
+    values = np.repeat(samples[starts], pieces)
+    counts = np.full(len(values), MAX_RUN, dtype=np.int64)
+    counts[np.cumsum(pieces) - 1] = lengths - MAX_RUN * (pieces - 1)
+    return np.column_stack((values, counts)).astype(np.uint8).tobytes()
+
+
+def _rle_decode(body) -> np.ndarray:
+    pairs = np.frombuffer(body, dtype=np.uint8).reshape(-1, 2)
+    return np.repeat(pairs[:, 0], pairs[:, 1])
+
+
+def _nibble_encode(samples: np.ndarray) -> bytes:
+    quantized = samples >> 4
+    if len(quantized) % 2:
+        quantized = np.append(quantized, 0)
+    return ((quantized[0::2] << 4) | quantized[1::2]).astype(np.uint8).tobytes()
+
+
+def _nibble_decode(body, num_samples: int) -> np.ndarray:
+    packed = np.frombuffer(body, dtype=np.uint8)
+    samples = np.empty(2 * len(packed), dtype=np.uint8)
+    samples[0::2] = packed >> 4
+    samples[1::2] = packed & 0x0F
+    return samples[:num_samples] * 16 + 8
+
+
+def _inflate(body, size: int) -> bytes:
+    """Decompress at most `size` bytes; a body that inflates to more is rejected
+    before it can take up memory (the length field comes from the network)."""
+    inflated = zlib.decompressobj().decompress(body, size + 1)
+    if len(inflated) > size:
+        raise ValueError(f"inflates to more than {size} bytes")
+    return inflated
+
+
+def encode_envelope(packet, codec: Codec) -> bytes:
+    """Envelope for one complete, checked frame."""
+    raw = np.frombuffer(packet, dtype=np.uint8)
+    num_samples = len(raw) - packet_size(0)
+    samples = raw[1 + HEADER_SIZE : -1]
+
+    if codec is Codec.RAW:
+        body = samples.tobytes()
+    elif codec is Codec.RLE:
+        body = _rle_encode(samples)
+    elif codec is Codec.DELTA_ZLIB:
+        body = zlib.compress(np.diff(samples, prepend=np.uint8(0)).tobytes(), ZLIB_LEVEL)
+    elif codec is Codec.NIBBLE:
+        body = _nibble_encode(samples)
+    else:
+        body = zlib.compress(_nibble_encode(samples), ZLIB_LEVEL)
+    if codec.lossless and len(body) >= num_samples:
+        codec, body = Codec.RAW, samples.tobytes()
+
+    header = ENVELOPE_HEADER.pack(
+        ENVELOPE_BYTE, codec, num_samples, len(body), raw[1 : 1 + HEADER_SIZE].tobytes(), int(raw[-1])
+    )
+    return header + body
+
+
+def decode_envelope(data, offset: int = 0) -> tuple[bytes, int]:
+    """Rebuild the frame of the envelope at `offset`; returns (frame, offset after the envelope).
+
+    Raises FrameError if the envelope is truncated, uses an unknown codec or does
+    not decode to its frame.
+    """
+    try:
+        start, codec, num_samples, length, header, checksum = ENVELOPE_HEADER.unpack_from(data, offset)
+        codec = Codec(codec)
+    except (struct.error, ValueError) as e:
+        raise FrameError(f"Invalid frame envelope: {e}")
+    body_start = offset + ENVELOPE_HEADER.size
+    body = memoryview(data)[body_start : body_start + length]
+    if start != ENVELOPE_BYTE or len(body) != length:
+        raise FrameError("Invalid or truncated frame envelope")
+
+    try:
+        if codec is Codec.RAW:
+            samples = np.frombuffer(body, dtype=np.uint8)
+        elif codec is Codec.RLE:
+            samples = _rle_decode(body)
+        elif codec is Codec.DELTA_ZLIB:
+            samples = np.cumsum(np.frombuffer(_inflate(body, num_samples), dtype=np.uint8), dtype=np.uint8)
+        elif codec is Codec.NIBBLE:
+            samples = _nibble_decode(body, num_samples)
+        else:
+            samples = _nibble_decode(_inflate(body, (num_samples + 1) // 2), num_samples)
+    except (zlib.error, ValueError) as e:
+        raise FrameError(f"Corrupt {codec.option} frame envelope: {e}")
+    if len(samples) != num_samples:
+        raise FrameError(f"{codec.option} envelope decoded to {len(samples)} samples instead of {num_samples}")
+
+    frame = np.empty(packet_size(num_samples), dtype=np.uint8)
+    frame[0] = START_BYTE
+    frame[1 : 1 + HEADER_SIZE] = np.frombuffer(header, dtype=np.uint8)
+    frame[1 + HEADER_SIZE : -1] = samples
+    if codec.lossless:
+        frame[-1] = checksum
+        if np.bitwise_xor.reduce(frame[1:-1]) != checksum:
+            raise FrameError(f"{codec.option} envelope does not match its checksum")
+    else:
+        frame[-1] = np.bitwise_xor.reduce(frame[1:-1])
+    return frame.tobytes(), body_start + length
+
+
+def datagram_frames(deframer: Deframer, data):
+    """Like `Deframer.datagram_frames()`, but also takes datagrams of envelopes.
+
+    Envelopes that can't be decoded are counted as checksum errors of `deframer`,
+    and the rest of that datagram is dropped. A sequence header (udp_link.py) is
+    skipped; readers that track the link pass the datagram through their
+    `LinkTracker` first.
+    """
+    data = strip_header(data)
+    if not data or data[0] != ENVELOPE_BYTE:
+        yield from deframer.datagram_frames(data)
+        return
+
+    offset = 0
+    while offset < len(data):
+        try:
+            frame, offset = decode_envelope(data, offset)
+        except FrameError:
+            deframer.checksum_errors += 1
+            return
+        if len(frame) != deframer.packet_size:
+            deframer.checksum_errors += 1  # Sent with another sample count
+            continue
+        deframer.frames += 1
+        yield frame
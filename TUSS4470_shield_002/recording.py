@@ -0,0 +1,305 @@
+"""Append-only recording of raw Open Echo frames.
+
+A recording is a directory of fixed-size record files plus an index:
+
+    recordings/
+        20260101-120000.pings
+        20260101-130000.pings
+        index.json
+
+Every `.pings` file starts with a 64 byte header followed by records of
+
+    timestamp:float64 (UNIX seconds, little-endian) | raw frame (see echo_frame.py)
+
+so a file can be opened with `np.memmap` (`open_recording()`) and any ping is a
+constant-time lookup, even for hours of data. `index.json` lists the files with
+their sample count and first/last timestamp so `Recording` can find the file for
+a point in time without opening every file.
+
+`Recorder` is called from the acquisition thread or event loop. `write()` only
+puts the frame into a bounded queue; a background thread appends, rotates files
+by size or age and flushes/fsyncs in batches, so a slow disk never stalls
+acquisition (frames are dropped and counted instead).
+
+This module is shared by the Qt interface and the web backend and only depends on NumPy.
+"""
+
+from functools import lru_cache
+import json
+import os
+from pathlib import Path
+import queue
+import struct
+import threading
+import time
+
+import numpy as np
+
+from echo_frame import DEFAULT_NUM_SAMPLES, frame_dtype, packet_size
+
+MAGIC = b"OECHOREC"
+FORMAT_VERSION = 1
+FILE_HEADER = struct.Struct("<8sHHIId")  # magic, version, reserved, num_samples, record size, created
+FILE_HEADER_SIZE = 64  # header is zero padded so records start at a fixed offset
+FILE_SUFFIX = ".pings"
+INDEX_FILE = "index.json"
+
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+DEFAULT_MAX_SECONDS = 3600.0
+DEFAULT_FSYNC_INTERVAL = 1.0  # seconds between flush + fsync of the current file
+DEFAULT_QUEUE_SIZE = 4096  # frames buffered for the writer thread before dropping
+
+
+class RecordingError(ValueError):
+    """Raised when a file is not an Open Echo recording."""
+
+
+@lru_cache(maxsize=None)
+def record_dtype(num_samples: int = DEFAULT_NUM_SAMPLES) -> np.dtype:
+    """Structured dtype of one record: timestamp followed by the raw frame."""
+    return np.dtype([("timestamp", "<f8"), ("frame", frame_dtype(num_samples))])
+
+
+def frame_bytes(records: np.ndarray) -> np.ndarray:
+    """(n, packet size) uint8 view of the raw frames in `records`, e.g. for `decode_packet()`."""
+    timestamp_size = records.dtype["timestamp"].itemsize
+    return records.view(np.uint8).reshape(len(records), -1)[:, timestamp_size:]
+
+
+def read_header(path) -> tuple[int, float]:
+    """Return (num_samples, created) from the header of a recording file."""
+    with open(path, "rb") as f:
+        header = f.read(FILE_HEADER_SIZE)
+    if len(header) < FILE_HEADER_SIZE:
+        raise RecordingError(f"{path}: file too short")
+
+    magic, version, _, num_samples, record_size, created = FILE_HEADER.unpack_from(header)
+    if magic != MAGIC:
+        raise RecordingError(f"{path}: not an Open Echo recording")
+    if version != FORMAT_VERSION:
+        raise RecordingError(f"{path}: unsupported format version {version}")
+    if record_size != record_dtype(num_samples).itemsize:
+        raise RecordingError(f"{path}: record size {record_size} does not match {num_samples} samples")
+    return num_samples, created
+
+
+def open_recording(path) -> np.ndarray:
+    """Memory-map a recording file as an array of `record_dtype` records.
+
+    A trailing partial record (e.g. after a power loss) is ignored.
+    """
+    num_samples, _ = read_header(path)
+    dtype = record_dtype(num_samples)
+    count = (os.path.getsize(path) - FILE_HEADER_SIZE) // dtype.itemsize
+    if count == 0:
+        return np.empty(0, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode="r", offset=FILE_HEADER_SIZE, shape=(count,))
+
+
+def load_index(directory) -> list[dict]:
+    path = Path(directory) / INDEX_FILE
+    if not path.exists():
+        return []
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)["files"]
+
+
+def save_index(directory, files: list[dict]):
+    """Rewrite the index atomically, so readers never see a half-written file."""
+    path = Path(directory) / INDEX_FILE
+    tmp = path.with_suffix(".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({"version": FORMAT_VERSION, "files": files}, f, indent=2)
+    os.replace(tmp, path)
+
+
+class Recording:
+    """Read access to a recording directory, ordered by time."""
+
+    def __init__(self, directory):
+        self.directory = Path(directory)
+        self.files = load_index(self.directory)
+
+    def __len__(self):
+        return len(self.files)
+
+    def open(self, i: int) -> np.ndarray:
+        return open_recording(self.directory / self.files[i]["name"])
+
+    def records(self):
+        """Iterate over all files as memory-mapped record arrays."""
+        for i in range(len(self.files)):
+            yield self.open(i)
+
+    def find(self, timestamp: float) -> tuple[int, int]:
+        """(file index, record index) of the first ping at or after `timestamp`."""
+        starts = np.array([entry["start"] for entry in self.files])
+        i = max(int(np.searchsorted(starts, timestamp, side="right")) - 1, 0)
+        while i < len(self.files):
+            records = self.open(i)
+            row = int(np.searchsorted(records["timestamp"], timestamp))
+            if row < len(records):
+                return i, row
+            i += 1
+        raise IndexError(f"No ping at or after {timestamp}")
+
+
+class Recorder:
+    """Writes frames to a recording directory from a background thread."""
+
+    def __init__(
+        self,
+        directory,
+        num_samples: int = DEFAULT_NUM_SAMPLES,
+        max_bytes: int = DEFAULT_MAX_BYTES,
+        max_seconds: float = DEFAULT_MAX_SECONDS,
+        fsync_interval: float = DEFAULT_FSYNC_INTERVAL,
+        queue_size: int = DEFAULT_QUEUE_SIZE,
+    ):
+        self.directory = Path(directory)
+        self.num_samples = num_samples
+        self.max_bytes = max_bytes
+        self.max_seconds = max_seconds
+        self.fsync_interval = fsync_interval
+
+        self.frame_size = packet_size(num_samples)
+        self.record_size = record_dtype(num_samples).itemsize
+
+        self.recorded = 0
+        self.dropped = 0
+        self.invalid = 0
+        self.files_written = 0
+
+        self._queue: queue.Queue = queue.Queue(queue_size)
+        self._thread: threading.Thread | None = None
+        self._file = None
+        self._entry: dict | None = None
+        self._files: list[dict] = []
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    def start(self):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._files = load_index(self.directory)
+        self._thread = threading.Thread(target=self._run, name="Recorder", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Write everything still queued, close the current file and stop the thread."""
+        if self._thread is None:
+            return
+        self._queue.put(None)
+        self._thread.join()
+        self._thread = None
+
+    def write(self, packet, timestamp: float | None = None):
+        """Queue one raw frame; never blocks. The frame is copied, views may be reused afterwards."""
+        if len(packet) != self.frame_size:
+            self.invalid += 1
+            return
+        if timestamp is None:
+            timestamp = time.time()
+        try:
+            self._queue.put_nowait(struct.pack("<d", timestamp) + bytes(packet))
+        except queue.Full:
+            self.dropped += 1
+
+    def stats(self) -> dict:
+        return {
+            "directory": str(self.directory),
+            "file": self._entry["name"] if self._entry else None,
+            "recorded": self.recorded,
+            "queued": self._queue.qsize(),
+            "dropped": self.dropped,
+            "invalid": self.invalid,
+            "files": self.files_written,
+        }
+
+    def _run(self):
+        last_sync = time.monotonic()
+        try:
+            while True:
+                try:
+                    record = self._queue.get(timeout=self.fsync_interval)
+                except queue.Empty:
+                    record = b""
+
+                # Drain whatever else is queued so one wakeup writes a whole batch
+                batch = [record]
+                while record is not None:
+                    try:
+                        record = self._queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    batch.append(record)
+
+                for record in batch:
+                    if record:
+                        self._append(record)
+
+                if time.monotonic() - last_sync >= self.fsync_interval:
+                    self._sync()
+                    last_sync = time.monotonic()
+
+                if batch[-1] is None:
+                    break
+        finally:
+            self._close_file()
+
+    def _append(self, record: bytes):
+        timestamp = struct.unpack_from("<d", record)[0]
+        if self._file is None or self._should_rotate(timestamp):
+            self._close_file()
+            self._open_file(timestamp)
+
+        self._file.write(record)
+        self._entry["end"] = timestamp
+        self._entry["records"] += 1
+        self.recorded += 1
+
+    def _should_rotate(self, timestamp: float) -> bool:
+        size = FILE_HEADER_SIZE + self._entry["records"] * self.record_size
+        return size + self.record_size > self.max_bytes or timestamp - self._entry["start"] >= self.max_seconds
+
+    def _open_file(self, timestamp: float):
+        stem = time.strftime("%Y%m%d-%H%M%S", time.gmtime(timestamp))
+        path = self.directory / f"{stem}{FILE_SUFFIX}"
+        n = 1
+        while path.exists():
+            path = self.directory / f"{stem}-{n}{FILE_SUFFIX}"
+            n += 1
+
+        self._file = open(path, "wb")
+        header = FILE_HEADER.pack(MAGIC, FORMAT_VERSION, 0, self.num_samples, self.record_size, timestamp)
+        self._file.write(header.ljust(FILE_HEADER_SIZE, b"\0"))
+
+        self._entry = {
+            "name": path.name,
+            "num_samples": self.num_samples,
+            "start": timestamp,
+            "end": timestamp,
+            "records": 0,
+        }
+        self._files.append(self._entry)
+        self.files_written += 1
+        save_index(self.directory, self._files)
+
+    def _sync(self):
+        if self._file is None:
+            return
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        save_index(self.directory, self._files)
+
+    def _close_file(self):
+        if self._file is None:
+            return
+        self._sync()
+        self._file.close()
+        self._file = None
+        self._entry = None
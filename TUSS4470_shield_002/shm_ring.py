@@ -0,0 +1,214 @@
+"""Shared-memory ring buffer of fixed-size slots.
+
+One process writes, any number of processes read from the same block of
+`multiprocessing.shared_memory`:
+
+    header  64 bytes: magic | version | flags | slots | slot size | head (newest sequence, -1 if empty)
+    slot    sequence:int64 | timestamp:float64 | length:uint32 | reserved | payload[slot_size]
+
+Every write gets the next sequence number and goes into slot `sequence % slots`,
+overwriting the oldest entry; the writer never waits for readers. A slot is
+guarded like a seqlock: its sequence is set to -1 while it is written and to the
+new sequence once the payload is complete, so a reader that copies a slot and
+then finds the same sequence knows the copy is consistent. Readers that fall
+more than `slots` entries behind skip ahead and count what they lost.
+
+There is no cross-process notification; `RingReader.wait()` polls the head.
+The creator sets `FLAG_CLOSED` before it removes the block, so readers that
+are still attached can tell a finished writer from a quiet one.
+
+This module is shared by the frame bus (echo_bus.py) and the web backend's worker
+process (web/offload.py) and only depends on NumPy.
+"""
+
+from multiprocessing import resource_tracker, shared_memory
+import time
+
+import numpy as np
+
+MAGIC = 0x4F45524E  # "OERN"
+FORMAT_VERSION = 1
+HEADER_SIZE = 64
+DEFAULT_POLL_INTERVAL = 0.002  # seconds between head checks in RingReader.wait()
+FLAG_CLOSED = 1  # the writer is gone, nothing will be written anymore
+
+HEADER_DTYPE = np.dtype(
+    [
+        ("magic", "<u4"),
+        ("version", "<u2"),
+        ("flags", "<u2"),
+        ("slots", "<u4"),
+        ("slot_size", "<u4"),
+        ("head", "<i8"),
+    ]
+)
+
+
+def slot_dtype(slot_size: int) -> np.dtype:
+    # Payload starts 8-byte aligned so it can be viewed as any NumPy type
+    return np.dtype(
+        [
+            ("sequence", "<i8"),
+            ("timestamp", "<f8"),
+            ("length", "<u4"),
+            ("reserved", "<u4"),
+            ("payload", "u1", (slot_size,)),
+        ]
+    )
+
+
+class RingError(ValueError):
+    """Raised when a shared-memory block is not a ring buffer of this format."""
+
+
+class SharedRing:
+    """A ring in a named shared-memory block; use `create()` or `attach()`."""
+
+    def __init__(self, memory: shared_memory.SharedMemory, owner: bool):
+        self.memory = memory
+        self.owner = owner
+        self._header = np.ndarray((), dtype=HEADER_DTYPE, buffer=memory.buf)
+        if self._header["magic"] != MAGIC or self._header["version"] != FORMAT_VERSION:
+            raise RingError(f"Shared memory {memory.name} is not a ring buffer")
+        self.slots = int(self._header["slots"])
+        self.slot_size = int(self._header["slot_size"])
+        self._slots = np.ndarray(
+            (self.slots,), dtype=slot_dtype(self.slot_size), buffer=memory.buf, offset=HEADER_SIZE
+        )
+
+    @classmethod
+    def create(cls, slots: int, slot_size: int, name: str | None = None) -> "SharedRing":
+        size = HEADER_SIZE + slots * slot_dtype(slot_size).itemsize
+        memory = shared_memory.SharedMemory(name=name, create=True, size=size)
+        header = np.ndarray((), dtype=HEADER_DTYPE, buffer=memory.buf)
+        header[()] = (MAGIC, FORMAT_VERSION, 0, slots, slot_size, -1)
+        slots_view = np.ndarray((slots,), dtype=slot_dtype(slot_size), buffer=memory.buf, offset=HEADER_SIZE)
+        slots_view["sequence"] = -1
+        del header, slots_view  # Views must not outlive the block
+        return cls(memory, owner=True)
+
+    @classmethod
+    def attach(cls, name: str, child: bool = False) -> "SharedRing":
+        """Attach to an existing ring; `child` if this process was started by the ring's creator."""
+        try:
+            memory = shared_memory.SharedMemory(name=name, track=False)  # Python 3.13+
+        except TypeError:
+            memory = shared_memory.SharedMemory(name=name)
+            # Before 3.13 the resource tracker would unlink the block when this reader exits.
+            # Child processes share the creator's tracker, which has to keep tracking it.
+            if not child:
+                resource_tracker.unregister(memory._name, "shared_memory")
+        return cls(memory, owner=False)
+
+    @property
+    def name(self) -> str:
+        return self.memory.name
+
+    @property
+    def head(self) -> int:
+        """Sequence number of the newest complete entry, -1 if nothing was written yet."""
+        return int(self._header["head"])
+
+    @property
+    def closed(self) -> bool:
+        return bool(self._header["flags"] & FLAG_CLOSED)
+
+    def write(self, payload, timestamp: float = 0.0) -> int:
+        """Append `payload` (bytes-like or uint8 array) and return its sequence number."""
+        data = np.frombuffer(payload, dtype=np.uint8) if not isinstance(payload, np.ndarray) else payload
+        if len(data) > self.slot_size:
+            raise ValueError(f"Payload of {len(data)} bytes does not fit a {self.slot_size} byte slot")
+        sequence = self.head + 1
+        slot = self._slots[sequence % self.slots]
+        slot["sequence"] = -1  # Readers that see this retry or skip the slot
+        slot["timestamp"] = timestamp
+        slot["length"] = len(data)
+        slot["payload"][: len(data)] = data
+        slot["sequence"] = sequence
+        self._header["head"] = sequence
+        return sequence
+
+    def view(self, sequence: int) -> tuple[float, np.ndarray] | None:
+        """Timestamp and payload of `sequence` without copying, None if not available.
+
+        The view is overwritten once the writer wraps around; check `valid()` after
+        using it, or use `read()` to get a copy.
+        """
+        slot = self._slots[sequence % self.slots]
+        if slot["sequence"] != sequence:
+            return None
+        timestamp = float(slot["timestamp"])
+        payload = slot["payload"][: int(slot["length"])]
+        return (timestamp, payload) if slot["sequence"] == sequence else None
+
+    def valid(self, sequence: int) -> bool:
+        """True while the slot of `sequence` has not been reused."""
+        return self._slots[sequence % self.slots]["sequence"] == sequence
+
+    def read(self, sequence: int) -> tuple[float, np.ndarray] | None:
+        """Copy of the timestamp and payload of `sequence`, None if it was overwritten."""
+        entry = self.view(sequence)
+        if entry is None:
+            return None
+        timestamp, payload = entry
+        payload = payload.copy()
+        return (timestamp, payload) if self.valid(sequence) else None
+
+    def close(self):
+        if self.owner:
+            self._header["flags"] |= FLAG_CLOSED  # Readers keep their mapping after the unlink
+        self._header = self._slots = None
+        self.memory.close()
+        if self.owner:
+            self.memory.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class RingReader:
+    """Follows a ring from the entry after `start` (the newest entry by default)."""
+
+    def __init__(self, ring: SharedRing, start: int | None = None):
+        self.ring = ring
+        self.next = (ring.head if start is None else start) + 1
+        self.lost = 0  # entries overwritten before they were read
+
+    def pending(self) -> int:
+        return self.ring.head + 1 - self.next
+
+    def _skip_overwritten(self):
+        oldest = self.ring.head - self.ring.slots + 1
+        if self.next < oldest:
+            self.lost += oldest - self.next
+            self.next = oldest
+
+    def read(self, copy: bool = True) -> tuple[int, float, np.ndarray] | None:
+        """Next (sequence, timestamp, payload), None if there is nothing new.
+
+        With `copy=False` the payload is a view into the ring, see `SharedRing.view()`.
+        """
+        while self.next <= self.ring.head:
+            self._skip_overwritten()
+            sequence = self.next
+            entry = self.ring.read(sequence) if copy else self.ring.view(sequence)
+            self.next += 1
+            if entry is None:
+                self.lost += 1  # Overwritten while we were reading it
+                continue
+            return sequence, *entry
+        return None
+
+    def wait(self, timeout: float | None = None, interval: float = DEFAULT_POLL_INTERVAL) -> bool:
+        """Sleep until there is a new entry; False on timeout or once the writer closed the ring."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self.next > self.ring.head:
+            if self.ring.closed:
+                return False
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            time.sleep(interval)
+        return True
@@ -0,0 +1,194 @@
+"""Synthetic echo sounder for testing without hardware.
+
+Generates valid frames with the same layout as the firmware's `sendData` (see
+echo_frame.py): a transmit ring-down, a bottom echo that follows a configurable
+depth profile, its first multiple and a noise floor. Frames can be used in
+process (`EchoSimulator.frames()`), written to a pseudo terminal that the Qt
+interface or the web backend open like a serial port, or sent as UDP datagrams
+like the UART -> UDP relay does.
+
+    python simulator.py pty [--link /tmp/openecho] [--rate 10] [--profile sine] [--depth 2 8]
+    python simulator.py udp [--host 127.0.0.1] [--port 5005] [--rate 10] [--noise 8]
+"""
+
+import argparse
+import itertools
+import math
+import os
+import socket
+import time
+
+import numpy as np
+
+from echo_frame import DEFAULT_NUM_SAMPLES, encode_packet
+
+DEFAULT_RESOLUTION = 1480 * 13.2e-6 * 100 / 2  # cm per sample in water at 13.2 µs per sample
+PROFILES = ("constant", "sine", "ramp", "steps", "walk")
+
+
+class EchoSimulator:
+    """Deterministic (seeded) stream of synthetic pings.
+
+    `depth_range` is in meters, `period` is the length of one sine, ramp or step
+    cycle in seconds of simulated time and `noise` the standard deviation of the
+    noise floor in sample units.
+    """
+
+    def __init__(
+        self,
+        num_samples: int = DEFAULT_NUM_SAMPLES,
+        rate: float = 10.0,
+        profile: str = "sine",
+        depth_range: tuple[float, float] = (2.0, 8.0),
+        period: float = 30.0,
+        noise: float = 8.0,
+        resolution: float = DEFAULT_RESOLUTION,
+        temperature: float = 18.0,
+        drive_voltage: float = 12.0,
+        seed: int = 0,
+    ):
+        if profile not in PROFILES:
+            raise ValueError(f"Unknown depth profile {profile!r}, expected one of {PROFILES}")
+        self.num_samples = num_samples
+        self.rate = rate
+        self.profile = profile
+        self.depth_range = depth_range
+        self.period = period
+        self.noise = noise
+        self.resolution = resolution
+        self.temperature = temperature
+        self.drive_voltage = drive_voltage
+
+        self._rng = np.random.default_rng(seed)
+        self._index = np.arange(num_samples)
+        self._ringdown = 230.0 * np.exp(-self._index / 25.0)
+        self._walk = sum(depth_range) / 2
+
+    def depth_at(self, t: float) -> float:
+        """Bottom depth in meters at `t` seconds of simulated time."""
+        low, high = self.depth_range
+        phase = (t / self.period) % 1.0
+        if self.profile == "constant":
+            return low
+        if self.profile == "sine":
+            return low + (high - low) * (0.5 - 0.5 * math.cos(2 * math.pi * phase))
+        if self.profile == "ramp":
+            return low + (high - low) * phase
+        if self.profile == "steps":
+            step = int(t / self.period * 4) % 4
+            return low + (high - low) * step / 3
+        # walk: bounded random walk, about 5 cm per ping
+        self._walk = min(max(self._walk + self._rng.normal(0.0, 0.05), low), high)
+        return self._walk
+
+    def samples(self, depth_index: float) -> np.ndarray:
+        """One ping with the bottom at `depth_index` samples."""
+        k = self._index
+        strength = 200.0 * (1.0 - 0.5 * min(depth_index / self.num_samples, 1.0))
+        # Sharp rise and exponential tail, the shape of a real bottom return
+        distance = k - depth_index
+        echo = strength * np.where(distance < 0, np.exp(-0.5 * (distance / 3.0) ** 2), np.exp(-distance / 40.0))
+        multiple = 0.3 * strength * np.exp(-0.5 * ((k - 2 * depth_index) / 8.0) ** 2)
+        noise = self._rng.normal(12.0, self.noise, self.num_samples)
+        return np.clip(self._ringdown + echo + multiple + noise, 0, 255).astype(np.uint8)
+
+    def frame(self, i: int) -> bytes:
+        """Frame `i` of the stream, i.e. at `i / rate` seconds."""
+        depth = self.depth_at(i / self.rate)
+        depth_index = min(round(depth * 100 / self.resolution), self.num_samples - 1)
+        return encode_packet(
+            self.samples(depth_index),
+            depth_index,
+            self.temperature + self._rng.normal(0.0, 0.05),
+            self.drive_voltage + self._rng.normal(0.0, 0.02),
+        )
+
+    def frames(self, count: int | None = None):
+        """Yield `count` frames (forever if None) as fast as they can be generated."""
+        for i in itertools.count() if count is None else range(count):
+            yield self.frame(i)
+
+    def paced(self, count: int | None = None):
+        """Yield frames at the configured ping rate."""
+        start = time.monotonic()
+        for i, frame in enumerate(self.frames(count)):
+            delay = start + i / self.rate - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            yield frame
+
+
+def run_pty(simulator: EchoSimulator, count: int | None = None, link: str | None = None):
+    """Write frames to a new pseudo terminal, which behaves like the sounder's serial port."""
+    import tty
+
+    master, slave = os.openpty()
+    tty.setraw(slave)  # No newline translation or echo, bytes pass through unchanged
+    os.set_blocking(master, False)
+    name = os.ttyname(slave)
+    if link:
+        if os.path.islink(link):
+            os.unlink(link)
+        os.symlink(name, link)
+    print(f"🔌 Simulated sounder on {link or name} ({simulator.rate} pings/s)")
+
+    dropped = 0
+    try:
+        for frame in simulator.paced(count):
+            try:
+                os.write(master, frame)
+            except BlockingIOError:
+                dropped += 1  # Nobody reading, like a UART the frames are lost
+    finally:
+        if link and os.path.islink(link):
+            os.unlink(link)
+        os.close(master)
+        os.close(slave)
+        if dropped:
+            print(f"⚠️ {dropped} frames dropped while nobody was reading")
+
+
+def run_udp(simulator: EchoSimulator, host: str, port: int, count: int | None = None):
+    """Send one frame per datagram, like UART_UDP_relay.py."""
+    print(f"📡 Sending simulated pings to {host}:{port} ({simulator.rate} pings/s)")
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        for frame in simulator.paced(count):
+            sock.sendto(frame, (host, port))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Synthetic Open Echo sounder")
+    parser.add_argument("output", choices=["pty", "udp"], help="Where to send the frames")
+    parser.add_argument("-n", "--samples", type=int, default=DEFAULT_NUM_SAMPLES, help="Samples per ping (default: 1800)")
+    parser.add_argument("-r", "--rate", type=float, default=10.0, help="Pings per second (default: 10)")
+    parser.add_argument("--profile", choices=PROFILES, default="sine", help="Depth profile (default: sine)")
+    parser.add_argument("--depth", type=float, nargs=2, default=(2.0, 8.0), metavar=("MIN", "MAX"), help="Depth range in meters (default: 2 8)")
+    parser.add_argument("--period", type=float, default=30.0, help="Profile period in seconds (default: 30)")
+    parser.add_argument("--noise", type=float, default=8.0, help="Noise standard deviation (default: 8)")
+    parser.add_argument("--count", type=int, help="Stop after this many pings")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed (default: 0)")
+    parser.add_argument("--link", help="pty: also make the port available under this path")
+    parser.add_argument("--host", default="127.0.0.1", help="udp: target host (default: 127.0.0.1)")
+    parser.add_argument("--port", type=int, default=5005, help="udp: target port (default: 5005)")
+    args = parser.parse_args()
+
+    simulator = EchoSimulator(
+        num_samples=args.samples,
+        rate=args.rate,
+        profile=args.profile,
+        depth_range=tuple(args.depth),
+        period=args.period,
+        noise=args.noise,
+        seed=args.seed,
+    )
+    try:
+        if args.output == "pty":
+            run_pty(simulator, args.count, args.link)
+        else:
+            run_udp(simulator, args.host, args.port, args.count)
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,199 @@
+"""Sequence numbers and link quality of the UDP path.
+
+UDP may lose, duplicate or reorder datagrams without telling anyone, and a
+missing ping looks the same whether the network dropped it or the reader
+stalled. `UART_UDP_relay.py --sequence` puts a small header in front of every
+datagram:
+
+    0x5E | sequence:uint32 | send time:uint64 (µs, the relay's monotonic clock)
+
+little-endian, followed by the datagram as before (raw frames or envelopes,
+see frame_codec.py). The first byte tells sequenced datagrams from the others;
+all targets of the relay get the same sequence numbers.
+
+`LinkTracker` sits in front of the deframer of a reader. It hands datagrams on
+in sequence order, holding back at most `window` datagrams (and none longer than
+`max_delay`) while it waits for a missing one, and counts
+
+    received     sequenced datagrams that arrived
+    lost         sequence numbers skipped because they did not arrive in time
+    reordered    datagrams that arrived after a later one
+    duplicates   datagrams that arrived twice
+    late         datagrams that arrived after they were given up as lost
+    jitter       inter-arrival jitter, smoothed like RTP (RFC 3550, 1/16)
+
+in constant memory: a bit mask of the last 64 sequence numbers and the held
+datagrams. A jump back by more than the 64 remembered sequence numbers, more
+than `window` datagrams in a row from behind, or a jump ahead by more than
+`RESYNC_DISTANCE` mean the relay restarted: the tracker starts over and counts
+a resync. Datagrams without a header pass straight through.
+
+This module is shared by the relay, the Qt interface and the web backend and
+only depends on the standard library.
+"""
+
+import struct
+
+SEQUENCE_BYTE = 0x5E
+SEQUENCE_HEADER = struct.Struct("<BIQ")  # start, sequence, send time in µs
+DEFAULT_WINDOW = 4  # datagrams held back while waiting for a missing one
+DEFAULT_MAX_DELAY = 0.05  # seconds a datagram may be held back
+RESYNC_DISTANCE = 1000  # datagrams ahead; going back, anything past the history is a restart
+HISTORY_BITS = 64
+JITTER_GAIN = 1 / 16
+
+
+def sequence_header(sequence: int, timestamp_us: int) -> bytes:
+    return SEQUENCE_HEADER.pack(SEQUENCE_BYTE, sequence & 0xFFFFFFFF, timestamp_us & 0xFFFFFFFFFFFFFFFF)
+
+
+def strip_header(data):
+    """The datagram without its sequence header, if it has one."""
+    if data and data[0] == SEQUENCE_BYTE:
+        return memoryview(data)[SEQUENCE_HEADER.size :]
+    return data
+
+
+class LinkTracker:
+    """Reorders sequenced datagrams and keeps the link statistics of one reader."""
+
+    def __init__(self, window: int = DEFAULT_WINDOW, max_delay: float = DEFAULT_MAX_DELAY):
+        self.window = window
+        self.max_delay = max_delay
+        self.received = 0
+        self.lost = 0
+        self.reordered = 0
+        self.duplicates = 0
+        self.late = 0
+        self.resyncs = 0
+        self.invalid = 0
+        self.jitter = 0.0  # seconds
+        self._next: int | None = None  # next sequence to hand on, not wrapped at 32 bits
+        self._highest = 0
+        self._history = 0  # bit i: sequence _next - 1 - i arrived
+        self._behind = 0  # datagrams in a row from before _next
+        self._held: dict[int, tuple[memoryview, float]] = {}
+        self._transit: float | None = None
+
+    def receive(self, data, arrival: float) -> list[tuple[object, float]]:
+        """Datagrams (without header, with their arrival time) that are now due, in order."""
+        if not data or data[0] != SEQUENCE_BYTE:
+            return [(data, arrival)]
+        try:
+            _, sequence, timestamp = SEQUENCE_HEADER.unpack_from(data)
+        except struct.error:
+            self.invalid += 1
+            return []
+        payload = memoryview(data)[SEQUENCE_HEADER.size :]
+        self.received += 1
+
+        released = []
+        if self._next is None:
+            self._start(sequence)
+        offset = (sequence - self._next + 0x80000000) % 0x100000000 - 0x80000000
+        if offset > RESYNC_DISTANCE or (offset < 0 and (-offset > HISTORY_BITS or self._behind >= self.window)):
+            released = self._flush()
+            self.resyncs += 1
+            self._start(sequence)
+            offset = 0
+        self._update_jitter(timestamp / 1e6, arrival)
+        sequence = self._next + offset
+
+        if offset < 0:
+            self._behind += 1
+            bit = 1 << (-offset - 1)
+            if -offset <= HISTORY_BITS and self._history & bit:
+                self.duplicates += 1
+            else:
+                self.late += 1
+                self.reordered += 1
+                if -offset <= HISTORY_BITS:
+                    self._history |= bit
+            return released
+        self._behind = 0
+        if sequence in self._held:
+            self.duplicates += 1
+            return released
+        if sequence < self._highest:
+            self.reordered += 1
+        self._highest = max(self._highest, sequence)
+
+        if offset == 0 and not self._held:  # The usual case
+            self._advance(1, True)
+            released.append((payload, arrival))
+            return released
+        self._held[sequence] = (payload, arrival)
+        return released + self.poll(arrival)
+
+    def poll(self, now: float) -> list[tuple[object, float]]:
+        """Hand on what is due, giving up on missing datagrams that took too long."""
+        released = []
+        while self._held:
+            entry = self._held.pop(self._next, None)
+            if entry is not None:
+                released.append(entry)
+                self._advance(1, True)
+                continue
+            oldest = min(arrival for _, arrival in self._held.values())
+            if len(self._held) <= self.window and now - oldest < self.max_delay:
+                break
+            skipped = min(self._held) - self._next
+            self.lost += skipped
+            self._advance(skipped, False)
+        return released
+
+    @property
+    def deadline(self) -> float | None:
+        """When `poll()` has to be called to release held datagrams, None if nothing is held."""
+        if not self._held:
+            return None
+        return min(arrival for _, arrival in self._held.values()) + self.max_delay
+
+    @property
+    def loss(self) -> float:
+        """Fraction of the sequence numbers that never made it."""
+        delivered = self.received - self.duplicates - self.late
+        return self.lost / (self.lost + delivered) if self.lost + delivered else 0.0
+
+    def stats(self) -> dict:
+        return {
+            "received": self.received,
+            "lost": self.lost,
+            "loss": self.loss,
+            "reordered": self.reordered,
+            "duplicates": self.duplicates,
+            "late": self.late,
+            "resyncs": self.resyncs,
+            "invalid": self.invalid,
+            "jitter_ms": 1e3 * self.jitter,
+            "held": len(self._held),
+        }
+
+    def summary(self) -> str:
+        return (
+            f"loss {100 * self.loss:.1f}% ({self.lost})  reordered {self.reordered}"
+            f"  duplicates {self.duplicates}  jitter {1e3 * self.jitter:.1f} ms"
+        )
+
+    def _start(self, sequence: int):
+        self._next = self._highest = sequence
+        self._history = 0
+        self._behind = 0
+        self._transit = None
+
+    def _advance(self, count: int, arrived: bool):
+        self._next += count
+        self._history = (self._history << count) & ((1 << HISTORY_BITS) - 1)
+        if arrived:
+            self._history |= 1
+
+    def _flush(self) -> list[tuple[object, float]]:
+        released = [self._held[sequence] for sequence in sorted(self._held)]
+        self._held.clear()
+        return released
+
+    def _update_jitter(self, sent: float, arrival: float):
+        transit = arrival - sent  # Includes an unknown clock offset, which cancels out
+        if self._transit is not None:
+            self.jitter += (abs(transit - self._transit) - self.jitter) * JITTER_GAIN
+        self._transit = transit
@@ -0,0 +1,73 @@
+"""Ping history for the Qt waterfall, kept free of Qt so it can be benchmarked on its own."""
+
+import numpy as np
+
+
+class WaterfallHistory:
+    """Fixed number of pings stored as a uint8 ring buffer.
+
+    Appending a ping overwrites the oldest row in place, so it costs
+    O(num_samples) no matter how many rows are kept. `tiles()` returns the history
+    as two views, oldest part first, which together are the time-ordered history
+    without copying anything.
+    """
+
+    def __init__(self, rows: int, num_samples: int):
+        self.rows = rows
+        self.num_samples = num_samples
+        self.data = np.zeros((rows, num_samples), dtype=np.uint8)
+        self.index = 0  # next row to write, which is also the oldest row
+        self.levels = LevelEstimator(self.data)
+
+    def append(self, samples):
+        self.levels.replace(self.data[self.index], samples)
+        self.data[self.index] = samples
+        self.index = (self.index + 1) % self.rows
+
+    def tiles(self) -> tuple[np.ndarray, np.ndarray]:
+        """(older, newer) views; `newer` is empty right after the ring wrapped."""
+        return self.data[self.index:], self.data[:self.index]
+
+    def ordered(self) -> np.ndarray:
+        """Time-ordered copy of the history, oldest row first."""
+        return np.concatenate(self.tiles())
+
+
+class LevelEstimator:
+    """Streaming display levels for a block of uint8 samples.
+
+    A 256-bin histogram of all samples in the history is updated as rows enter
+    and leave, which costs two `bincount`s of one row per ping. Mean, standard
+    deviation and percentiles then follow from the histogram in constant time
+    (256 bins) instead of two passes over the whole history.
+    """
+
+    VALUES = np.arange(256, dtype=np.int64)
+    SQUARES = VALUES**2
+
+    def __init__(self, data: np.ndarray):
+        self.histogram = np.bincount(data.ravel(), minlength=256).astype(np.int64)
+        self.count = data.size
+
+    def replace(self, old_row, new_row):
+        self.histogram -= np.bincount(old_row, minlength=256)
+        self.histogram += np.bincount(np.asarray(new_row, dtype=np.uint8), minlength=256)
+
+    def mean_std(self) -> tuple[float, float]:
+        total = int(self.histogram @ self.VALUES)
+        total_sq = int(self.histogram @ self.SQUARES)
+        mean = total / self.count
+        variance = max(total_sq / self.count - mean * mean, 0.0)
+        return mean, variance**0.5
+
+    def sigma_levels(self, k: float = 2.0) -> tuple[float, float]:
+        """mean ± k·σ, the auto gain the waterfall has always used."""
+        mean, sigma = self.mean_std()
+        return mean - k * sigma, mean + k * sigma
+
+    def percentile_levels(self, low: float = 2.0, high: float = 98.0) -> tuple[float, float]:
+        """Sample values at the `low` and `high` percentiles of the history."""
+        cumulative = np.cumsum(self.histogram)
+        ranks = np.array([low, high]) / 100.0 * (self.count - 1)
+        lo, hi = np.searchsorted(cumulative, ranks, side="right")
+        return float(lo), float(max(hi, lo + 1))
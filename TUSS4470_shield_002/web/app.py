@@ -1,110 +1,239 @@
 from contextlib import asynccontextmanager
-from depth_output import OutputManager
+from devices import MAIN_DEVICE, Device, DeviceManager, check_name, default_settings
 from settings import Settings
-from echo import EchoReader, SerialReader
+from echo import SerialReader
+from protocol import MessageFormat, encode_history
+from history import MAX_COLUMNS
+from render import MAX_HEIGHT
+from metrics import CallbackMetric, registry
 import logging
-from fastapi import FastAPI, WebSocket, Request, Form
-from fastapi.responses import RedirectResponse
+from fastapi import FastAPI, HTTPException, WebSocket, Request, Form
+from fastapi.responses import PlainTextResponse, RedirectResponse, Response
 from fastapi.templating import Jinja2Templates
 from fastapi.staticfiles import StaticFiles
+from starlette.status import WS_1008_POLICY_VIOLATION
 
 log = logging.getLogger("uvicorn")
 
 
-class ConnectionManager:
-    def __init__(self):
-        self.active_connections: list[WebSocket] = []
-
-    async def connect(self, websocket: WebSocket):
-        await websocket.accept()
-        self.active_connections.append(websocket)
-        log.info(f"WebSocket connected: {websocket.client}")
-
-    async def disconnect(self, websocket: WebSocket):
-        if websocket in self.active_connections:
-            self.active_connections.remove(websocket)
-
-    async def broadcast_json(self, data):
-        for connection in self.active_connections:
-            await connection.send_json(data)
-
-
-connection_manager = ConnectionManager()
-output_manager = OutputManager()
-echo_reader = EchoReader(
-    data_callback=connection_manager.broadcast_json,
-    depth_callback=output_manager.update,
-)
+devices = DeviceManager()
+
+
+def dropped_pings():
+    samples = []
+    for device in devices:
+        stats = device.stats()
+        echo_stats, recorder = stats["echo_reader"], stats["echo_reader"]["recorder"]
+        samples += [
+            ({"device": device.name, "queue": "reader"}, echo_stats["reader_dropped"]),
+            ({"device": device.name, "queue": "offload"}, echo_stats["offload_dropped"] or 0),
+            ({"device": device.name, "queue": "broadcast"}, echo_stats["queues"]["broadcast"]["dropped"]),
+            ({"device": device.name, "queue": "depth"}, echo_stats["queues"]["depth"]["dropped"]),
+            ({"device": device.name, "queue": "websocket"}, stats["clients"]["dropped"]),
+            ({"device": device.name, "queue": "recorder"}, recorder["dropped"] if recorder else 0),
+        ]
+    return samples
+
+
+def udp_datagrams():
+    samples = []
+    for device in devices:
+        link = device.echo_reader.stats()["link"]
+        if link is None:
+            continue
+        for result in ("received", "lost", "reordered", "duplicates", "late"):
+            samples.append(({"device": device.name, "result": result}, link[result]))
+    return samples
+
+
+def udp_jitter():
+    samples = []
+    for device in devices:
+        link = device.echo_reader.stats()["link"]
+        if link is not None and link["received"]:
+            samples.append(({"device": device.name}, link["jitter_ms"] / 1e3))
+    return samples
+
+
+def per_device(func):
+    return lambda: [({"device": device.name}, func(device)) for device in devices]
+
+
+registry.register(CallbackMetric(
+    "openecho_pings_total", "Pings read from the sounder", "counter",
+    per_device(lambda device: device.echo_reader.stats()["pings"]),
+))
+registry.register(CallbackMetric(
+    "openecho_dropped_pings_total", "Pings discarded by a full queue", "counter", dropped_pings
+))
+registry.register(CallbackMetric(
+    "openecho_udp_datagrams_total", "Sequenced UDP datagrams by outcome (UART_UDP_relay.py --sequence)",
+    "counter", udp_datagrams,
+))
+registry.register(CallbackMetric(
+    "openecho_udp_jitter_seconds", "Smoothed inter-arrival jitter of the UDP link", "gauge", udp_jitter
+))
+registry.register(CallbackMetric(
+    "openecho_websocket_clients", "Connected WebSocket clients", "gauge",
+    per_device(lambda device: len(device.connection_manager.clients)),
+))
+registry.register(CallbackMetric(
+    "openecho_websocket_disconnected_lagging_total", "WebSocket clients disconnected for falling behind",
+    "counter", per_device(lambda device: device.connection_manager.disconnected_lagging),
+))
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    try:
-        await update_settings(Settings.load())
-    except Exception as e:
-        log.error(f"Failed to load settings: {e}")
-
-    with output_manager, echo_reader:
+    await devices.load()
+    with devices:
         yield
 
 
 app = FastAPI(lifespan=lifespan)
-app.state.settings = Settings()
 templates = Jinja2Templates(directory="templates")
 
 app.mount("/static", StaticFiles(directory="static"), name="static")
 
-async def update_settings(new_settings: Settings):
-    settings = Settings.model_validate(
-        {
-            **app.state.settings.model_dump(exclude_none=True, exclude_unset=True, exclude_defaults=True),
-            **new_settings.model_dump(exclude_none=True, exclude_unset=True, exclude_defaults=True),
-        }
-    )
-
-    echo_reader.update_settings(settings)
-    await output_manager.update_settings(settings)
-    app.state.settings = settings
+def get_device(name: str) -> Device:
+    try:
+        return devices[name]
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Unknown device {name!r}")
 
-    app.state.settings.save()
 
+async def update_settings(new_settings: Settings, device: str = MAIN_DEVICE):
+    """Apply and save the settings of a device, adding it if it doesn't exist yet."""
+    if device in devices:
+        await devices[device].update_settings(new_settings)
+    else:
+        await devices.add(device, new_settings)
 
 
 @app.websocket("/ws")
 async def websocket_endpoint(websocket: WebSocket):
-    await connection_manager.connect(websocket)
+    try:
+        message_format = MessageFormat(websocket.query_params.get("format", MessageFormat.BINARY))
+    except ValueError:
+        message_format = MessageFormat.BINARY
+
+    device = devices.devices.get(websocket.query_params.get("device", MAIN_DEVICE))
+    if device is None:
+        await websocket.close(code=WS_1008_POLICY_VIOLATION)
+        return
+
+    try:
+        # Recent pings for a new client to fill its canvas with, see ConnectionManager.connect
+        snapshot = int(websocket.query_params.get("snapshot", 0))
+        height = int(websocket.query_params.get("height", 0))
+    except ValueError:
+        snapshot = height = 0
+
+    connection_manager = device.connection_manager
+    await connection_manager.connect(websocket, message_format, device.history, snapshot, height)
     try:
         while True:
-            await websocket.receive_text()  # Just here to keep the connection alive
+            # Subscription options, e.g. {"render": "rgba", "height": 800, "samples": 505}
+            connection_manager.configure(websocket, await websocket.receive_text())
     except Exception as e:
         log.error(f"WebSocket closed: {e}")
     finally:
         await connection_manager.disconnect(websocket)
 
 
+@app.get("/stats")
+async def stats():
+    return {"devices": {device.name: device.stats() for device in devices}}
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Prometheus text exposition of the pipeline counters and latency histograms."""
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
+
+
+@app.get("/history")
+async def history_window(
+    width: int,
+    height: int,
+    start: float | None = None,
+    end: float | None = None,
+    samples: int | None = None,
+    device: str = MAIN_DEVICE,
+):
+    """Pings from `start` to `end` (UNIX seconds, default: everything kept) as one binary
+    block of `width` columns of at most `height` rows, see protocol.py.
+
+    `samples` limits the depth to the first samples of each ping (default: all).
+    """
+    ping_history = get_device(device).history
+    stats = ping_history.stats()
+    if not stats["pings"]:
+        raise HTTPException(status_code=404, detail="No pings in the history yet")
+    start = stats["oldest"] if start is None else start
+    end = stats["newest"] + 1e-3 if end is None else end  # The newest ping is included
+    if not (0 < width <= MAX_COLUMNS and 0 < height <= MAX_HEIGHT and end > start):
+        raise HTTPException(status_code=400, detail="Invalid history window")
+    window = ping_history.window(start, end, width, samples or 1 << 30, height)
+    return Response(encode_history(window), media_type="application/octet-stream")
+
+
+@app.post("/replay/seek")
+async def replay_seek(timestamp: float, device: str = MAIN_DEVICE):
+    """Continue a replay (connection type FILE) at a UNIX timestamp."""
+    try:
+        get_device(device).echo_reader.seek(timestamp)
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return {"timestamp": timestamp}
+
+
 @app.get("/")
-async def home(request: Request):
-    if app.state.settings.serial_port == "init":
-        return RedirectResponse("/config", status_code=303)
+async def home(request: Request, device: str = MAIN_DEVICE):
+    settings = get_device(device).settings
+    if settings.serial_port == "init":
+        return RedirectResponse(f"/config?device={device}", status_code=303)
 
     return templates.TemplateResponse(
-        "frontend.html", {"request": request, "settings": app.state.settings}
+        "frontend.html",
+        {"request": request, "settings": settings, "device": device, "devices": list(devices.devices)},
     )
 
 
 @app.get("/config")
-async def config(request: Request):
+async def config(request: Request, device: str = MAIN_DEVICE):
+    try:
+        # Unknown names show the defaults, saving the form adds the device
+        settings = devices[device].settings if device in devices else default_settings(check_name(device))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     return templates.TemplateResponse(
         "config.html",
         {
             "request": request,
-            "settings": app.state.settings,
+            "settings": settings,
+            "device": device,
+            "devices": list(devices.devices),
+            "main_device": MAIN_DEVICE,
             "ports": SerialReader.get_serial_ports(),
         },
     )
 
 
 @app.post("/config")
-async def config_post(request: Request, new_settings: Settings = Form(...)):
-    await update_settings(new_settings)
-    return RedirectResponse("/", status_code=303)
+async def config_post(request: Request, new_settings: Settings = Form(...), device: str = MAIN_DEVICE):
+    try:
+        await update_settings(new_settings, check_name(device))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return RedirectResponse(f"/?device={device}", status_code=303)
+
+
+@app.post("/devices/{name}/delete")
+async def delete_device(name: str):
+    get_device(name)
+    try:
+        await devices.remove(name)
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return RedirectResponse("/config", status_code=303)
@@ -0,0 +1,237 @@
+import asyncio
+import json
+import logging
+import math
+import time
+
+from fastapi import WebSocket
+from starlette.status import WS_1013_TRY_AGAIN_LATER
+
+from echo import DropOldestQueue, Ping
+from history import PingHistory, pool_depth
+from metrics import PING_LATENCY
+from protocol import MessageFormat, encode_column, encode_ping, encode_ping_json, encode_snapshot
+from render import MAX_HEIGHT, ColumnRenderer, RenderMode, RenderRequest, ViewRequest, pool_ping
+
+log = logging.getLogger("uvicorn")
+
+CLIENT_QUEUE_SIZE = 2  # pending messages per client, older ones are replaced by newer pings
+CLIENT_MAX_LAG = 100  # pings a client may miss in a row before it is disconnected
+SEND_TIMEOUT = 5.0  # seconds a single send may take before the client is disconnected
+SNAPSHOT_PINGS = 4096  # most pings in the snapshot of a new client, the widest canvas
+
+
+class Client:
+    """A WebSocket viewer with its own send queue and sender task.
+
+    `send()` never blocks: when the client can't keep up, the oldest pending message
+    is replaced by the newest one (latest frame wins). A client that hasn't completed
+    a send for `CLIENT_MAX_LAG` pings, or whose send takes longer than
+    `SEND_TIMEOUT`, is reported as lagging and gets disconnected by the manager.
+    A snapshot of the recent pings is sent before the first queued message.
+    """
+
+    def __init__(self, websocket: WebSocket, message_format: MessageFormat, snapshot: bytes | None = None):
+        self.websocket = websocket
+        self.message_format = message_format
+        self.snapshot = snapshot
+        self.render = RenderRequest(RenderMode.RAW, 0, 0)
+        self.view: ViewRequest | None = None  # all samples until the browser subscribes to a view
+        self.sent = 0
+        self.closed = False
+
+        self._queue = DropOldestQueue(CLIENT_QUEUE_SIZE)
+        self._lag = 0  # pings queued since the last completed send
+        self._task: asyncio.Task | None = None
+
+    @property
+    def lagging(self) -> bool:
+        return self.closed or self._lag > CLIENT_MAX_LAG
+
+    @property
+    def message_key(self) -> MessageFormat | RenderRequest | tuple[MessageFormat, ViewRequest]:
+        """Clients with the same key receive the same message bytes.
+
+        For a view the key still depends on the ping's resolution, see `ConnectionManager.broadcast`.
+        """
+        if self.message_format is MessageFormat.JSON or self.render.mode is RenderMode.RAW:
+            return self.message_format if self.view is None else (self.message_format, self.view)
+        return self.render
+
+    def configure(self, options: dict):
+        """Apply a subscription message sent by the browser."""
+        if "render" in options:
+            self.render = RenderRequest.from_options(options)
+        if "view" in options:
+            self.view = None if options["view"] is None else ViewRequest.from_options(options)
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    def send(self, message: bytes | str):
+        self._lag += 1
+        self._queue.put_nowait(message)
+
+    async def _run(self):
+        try:
+            if self.snapshot:
+                await asyncio.wait_for(self.websocket.send_bytes(self.snapshot), SEND_TIMEOUT)
+                self.snapshot = None
+            while True:
+                message = await self._queue.get()
+                start = time.perf_counter()
+                if isinstance(message, bytes):
+                    await asyncio.wait_for(self.websocket.send_bytes(message), SEND_TIMEOUT)
+                else:
+                    await asyncio.wait_for(self.websocket.send_text(message), SEND_TIMEOUT)
+                PING_LATENCY.observe("websocket_send", time.perf_counter() - start)
+                self.sent += 1
+                self._lag = 0
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            log.warning(f"WebSocket send to {self.websocket.client} failed: {e!r}")
+            self.closed = True
+
+    @property
+    def dropped(self) -> int:
+        """Messages replaced by newer ones before they could be sent."""
+        return self._queue.dropped
+
+    async def close(self):
+        self.closed = True
+        if self._task:
+            self._task.cancel()
+            self._task = None
+        try:
+            await asyncio.wait_for(self.websocket.close(code=WS_1013_TRY_AGAIN_LATER), SEND_TIMEOUT)
+        except Exception:
+            pass  # Already closed or unreachable
+
+    def stats(self) -> dict:
+        return {
+            "client": str(self.websocket.client),
+            "format": self.message_format,
+            "render": self.render.mode,
+            "view": None if self.view is None else {"range": self.view.range, "height": self.view.height},
+            "sent": self.sent,
+            "queued": self._queue.qsize(),
+            "dropped": self.dropped,
+        }
+
+
+class ConnectionManager:
+    def __init__(self):
+        self.clients: dict[WebSocket, Client] = {}
+        self.disconnected_lagging = 0
+        self.dropped_disconnected = 0  # pings dropped by clients that are gone
+        self.renderer = ColumnRenderer()
+        self._closing: set[asyncio.Task] = set()
+
+    def update_settings(self, settings):
+        self.renderer = ColumnRenderer(settings.colormap)
+
+    async def connect(
+        self,
+        websocket: WebSocket,
+        message_format: MessageFormat = MessageFormat.BINARY,
+        history: PingHistory | None = None,
+        snapshot: int = 0,
+        height: int = 0,
+    ):
+        """Accept a client; binary clients asking for a `snapshot` first get up to that many
+        pings from the end of `history` in one message, max-pooled in depth to about `height` rows."""
+        await websocket.accept()
+        # Built and registered without awaiting in between, so the live pings continue the snapshot
+        message = None
+        if history is not None and message_format is MessageFormat.BINARY:
+            message = self.snapshot(history, snapshot, height)
+        client = Client(websocket, message_format, message)
+        self.clients[websocket] = client
+        client.start()
+        log.info(f"WebSocket connected: {websocket.client} ({message_format})")
+
+    def snapshot(self, history: PingHistory, count: int, height: int = 0) -> bytes | None:
+        """The last `count` pings of `history` as a single message. The history starts over
+        when the number of samples or the resolution changes, so they all have the same shape."""
+        latest = history.latest(min(count, SNAPSHOT_PINGS))
+        if latest is None:
+            return None
+        samples, depths, sequence = latest
+        factor = math.ceil(samples.shape[1] / min(height, MAX_HEIGHT)) if height > 0 else 1
+        return encode_snapshot(pool_depth(samples, factor), depths, sequence, history.resolution * factor)
+
+    async def disconnect(self, websocket: WebSocket):
+        client = self._remove(websocket)
+        if client is not None:
+            await client.close()
+
+    def _remove(self, websocket: WebSocket) -> Client | None:
+        client = self.clients.pop(websocket, None)
+        if client is not None:
+            self.dropped_disconnected += client.dropped
+        return client
+
+    def configure(self, websocket: WebSocket, text: str):
+        client = self.clients.get(websocket)
+        if client is None:
+            return
+        try:
+            client.configure(json.loads(text))
+        except (ValueError, TypeError, AttributeError, KeyError) as e:
+            log.warning(f"Ignoring invalid WebSocket message from {websocket.client}: {e}")
+
+    def encode(self, ping: Ping, key) -> bytes | str:
+        if isinstance(key, tuple):
+            key = key[0]  # (format, window) of a ping that is already cropped and pooled
+        if key is MessageFormat.JSON:
+            return encode_ping_json(ping)
+        if key is MessageFormat.BINARY:
+            return encode_ping(ping)
+        return encode_column(ping, self.renderer.column(ping, key))
+
+    async def broadcast(self, ping: Ping):
+        # Encode each format and render request at most once, no matter how many clients use it
+        messages: dict = {}
+        views: dict[tuple[int, int], Ping] = {}  # (samples, factor) -> cropped and pooled ping
+        gain_updated = False
+        lagging = []
+        for client in list(self.clients.values()):
+            if client.lagging:
+                lagging.append(client)
+                continue
+
+            key = client.message_key
+            client_ping = ping
+            if isinstance(key, tuple):
+                # Views of different clients often come down to the same window, pool each only once
+                message_format, view = key
+                window = view.window(ping.resolution, len(ping.samples))
+                if window not in views:
+                    views[window] = pool_ping(ping, *window)
+                key, client_ping = (message_format, window), views[window]
+
+            message = messages.get(key)
+            if message is None:
+                if isinstance(key, RenderRequest) and not gain_updated:
+                    self.renderer.update(ping)
+                    gain_updated = True
+                message = messages[key] = self.encode(client_ping, key)
+            client.send(message)
+
+        for client in lagging:
+            log.warning(f"Disconnecting WebSocket client that fell behind: {client.websocket.client}")
+            self.disconnected_lagging += 1
+            # Closing waits up to SEND_TIMEOUT for the client, which must not hold up the others
+            self._remove(client.websocket)
+            task = asyncio.create_task(client.close())
+            self._closing.add(task)
+            task.add_done_callback(self._closing.discard)
+
+    def stats(self) -> dict:
+        return {
+            "connected": len(self.clients),
+            "disconnected_lagging": self.disconnected_lagging,
+            "dropped": self.dropped_disconnected + sum(c.dropped for c in self.clients.values()),
+            "clients": [client.stats() for client in self.clients.values()],
+        }
@@ -4,30 +4,42 @@ import logging
 from httpx import AsyncClient
 import websockets
 import json
+import time
 from typing import Any
 
+from metrics import PING_LATENCY
 from settings import NMEAOffset, Settings
 
 log = logging.getLogger("uvicorn")
 
 
+OUTPUT_KEEPALIVE = 1.0  # seconds, the last depth is repeated at least this often
+DEFAULT_MAX_RATE = 5.0  # sends per second
+
+
 class OutputManager:
+    """Hands every new depth to the enabled output methods.
+
+    Each method sends from its own task, so a slow SignalK server can't delay NMEA
+    sentences (and vice versa).
+    """
+
     def __init__(self, settings: Settings | None = None):
-        self._task: asyncio.Task | None = None
         self.settings = settings
+        self._running = False
 
         self._output_classes: list[OutputMethod] = []
 
-    def update(self, value: Any):
-        """Update the current value."""
+    def update(self, value: Any, received: float | None = None):
+        """Update the current value, `received` is the perf_counter() stamp of its ping."""
         for output_class in self._output_classes:
-            output_class.update(value)
+            output_class.update(value, received)
 
     async def update_settings(self, new_settings: Settings):
         self.settings = new_settings
 
         for output_class in self._output_classes:
-            await output_class.stop()
+            await output_class.shutdown()
 
         new_output_classes = [
             output_methods[method]
@@ -37,37 +49,33 @@ class OutputManager:
         self._output_classes = [cls(self.settings) for cls in new_output_classes]
         log.info(f"Output classes: {self._output_classes}")
 
-        for output_class in self._output_classes:
-            await output_class.start()
-
-    async def output(self):
-        """Override this in subclasses to define output behavior."""
-        for output_class in self._output_classes:
-            if output_class._current_value is not None:
-                await output_class.output()
-
-    async def _run(self):
-        while True:
-            if self.settings is None:
-                await asyncio.sleep(1.0)
-                continue
-
-            await self.output()
-            await asyncio.sleep(1.0)
+        if self._running:
+            for output_class in self._output_classes:
+                output_class.launch()
 
     def __enter__(self):
-        self._task = asyncio.create_task(self._run())
+        self._running = True
+        for output_class in self._output_classes:
+            output_class.launch()
 
     def __exit__(self, exc_type, exc_value, traceback):
-        if self._task:
-            self._task.cancel()
-            self._task = None
+        self._running = False
+        for output_class in self._output_classes:
+            output_class.cancel()
 
 
 class OutputMethod(ABC):
+    settings_prefix = ""  # reads `<prefix>_max_rate` and `<prefix>_min_change` from the settings
+
     def __init__(self, settings: Settings):
         self.settings = settings
         self._current_value = None
+        self._current_received = None
+        self._changed = asyncio.Event()
+        self._task: asyncio.Task | None = None
+
+        self.max_rate = getattr(settings, f"{self.settings_prefix}_max_rate", DEFAULT_MAX_RATE)
+        self.min_change = getattr(settings, f"{self.settings_prefix}_min_change", 0.0)
 
     @abstractmethod
     async def start(self):
@@ -79,17 +87,82 @@ class OutputMethod(ABC):
         """Stop the output method."""
         pass
 
-    def update(self, value: Any):
-        """Update the current value."""
+    def update(self, value: Any, received: float | None = None):
+        """Update the current value and wake up the sender."""
         self._current_value = value
+        self._current_received = received
+        self._changed.set()
 
     @abstractmethod
     async def output(self):
         """Override this in subclasses to define output behavior."""
         pass
 
+    def launch(self):
+        self._task = asyncio.create_task(self._run())
+
+    def cancel(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
+
+    async def shutdown(self):
+        self.cancel()
+        await self.stop()
+
+    async def _run(self):
+        """Send each new depth as it arrives, limited to `max_rate` sends per second.
+
+        Changes smaller than `min_change` are skipped, but the last depth is repeated
+        every OUTPUT_KEEPALIVE seconds so receivers don't time out.
+        """
+        try:
+            await self.start()
+        except Exception as e:
+            log.error(f"{type(self).__name__} connection error: {e}")  # output() reconnects
+
+        interval = 1.0 / self.max_rate
+        last_sent = time.monotonic()  # for the keepalive
+        next_send = 0.0  # earliest start of the next send allowed by max_rate
+        last_value = None
+        while True:
+            try:
+                timeout = max(last_sent + OUTPUT_KEEPALIVE - time.monotonic(), 0.0)
+                await asyncio.wait_for(self._changed.wait(), timeout)
+                if (
+                    last_value is not None
+                    and abs(self._current_value - last_value) < self.min_change
+                    and time.monotonic() - last_sent < OUTPUT_KEEPALIVE
+                ):
+                    self._changed.clear()
+                    continue
+            except asyncio.TimeoutError:
+                if self._current_value is None:
+                    last_sent = time.monotonic()
+                    continue
+
+            # Values arriving while we wait for the rate limit replace the pending one
+            delay = next_send - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            self._changed.clear()
+
+            received, self._current_received = self._current_received, None
+            last_value = self._current_value
+            last_sent = time.monotonic()
+            next_send = last_sent + interval
+            try:
+                await self.output()
+            except Exception as e:
+                log.error(f"{type(self).__name__} output error: {e}")
+
+            if received is not None:
+                PING_LATENCY.observe("depth_output", time.perf_counter() - received)
+
 
 class SignalKOutput(OutputMethod):
+    settings_prefix = "signalk"
+
     def __init__(self, settings: Settings):
         super().__init__(settings)
         self._ws = None
@@ -211,6 +284,8 @@ class SignalKOutput(OutputMethod):
 
 
 class NMEA0183Output(OutputMethod):
+    settings_prefix = "nmea"
+
     def __init__(self, settings: Settings):
         super().__init__(settings)
         self._writer = None
@@ -0,0 +1,179 @@
+"""Several sounders in one backend.
+
+Every device has its own settings, reader, WebSocket clients and depth outputs.
+The main device keeps its settings in `.settings.json` as before, every other
+device in `.settings.<name>.json`; all of them are started again on the next
+launch.
+
+The readers of different devices share nothing but the event loop. Each one
+only awaits its own serial port, UDP socket or recording, so a stalled port
+delays neither the other devices' pings nor their WebSocket clients.
+"""
+
+import logging
+import os
+from pathlib import Path
+import re
+
+from connections import ConnectionManager
+from depth_output import OutputManager
+from echo import EchoReader, Ping
+from history import PingHistory
+from settings import Settings
+
+log = logging.getLogger("uvicorn")
+
+MAIN_DEVICE = "main"
+DEVICE_NAME = re.compile(r"^[A-Za-z0-9_-]{1,32}$")
+
+
+def settings_file(name: str) -> str:
+    return ".settings.json" if name == MAIN_DEVICE else f".settings.{name}.json"
+
+
+def check_name(name: str) -> str:
+    if not DEVICE_NAME.match(name):
+        raise ValueError(f"Invalid device name {name!r}, use up to 32 letters, digits, '-' or '_'")
+    return name
+
+
+def default_settings(name: str) -> Settings:
+    """Defaults for a new device; recordings of different devices must not share a directory."""
+    if name == MAIN_DEVICE:
+        return Settings()
+    return Settings(recording_directory=f"recordings/{name}", replay_path=f"recordings/{name}")
+
+
+class Device:
+    def __init__(self, name: str):
+        self.name = check_name(name)
+        self.settings = default_settings(name)
+        self.connection_manager = ConnectionManager()
+        self.output_manager = OutputManager()
+        self.history = PingHistory(self.settings.history_pings)
+        self.echo_reader = EchoReader(
+            data_callback=self.on_ping,
+            depth_callback=self.output_manager.update,
+        )
+
+    @property
+    def settings_file(self) -> str:
+        return settings_file(self.name)
+
+    async def on_ping(self, ping: Ping):
+        self.history.append(ping)
+        await self.connection_manager.broadcast(ping)
+
+    async def update_settings(self, new_settings: Settings, save: bool = True):
+        settings = Settings.model_validate(
+            {
+                **self.settings.model_dump(exclude_none=True, exclude_unset=True, exclude_defaults=True),
+                **new_settings.model_dump(exclude_none=True, exclude_unset=True, exclude_defaults=True),
+            }
+        )
+
+        self.echo_reader.update_settings(settings)
+        self.connection_manager.update_settings(settings)
+        await self.output_manager.update_settings(settings)
+        if settings.history_pings != self.history.capacity:
+            self.history = PingHistory(settings.history_pings)
+        self.settings = settings
+
+        if save:
+            self.settings.save(self.settings_file)
+
+    async def load(self):
+        await self.update_settings(Settings.load(self.settings_file), save=False)
+
+    async def close(self):
+        for websocket in list(self.connection_manager.clients):
+            await self.connection_manager.disconnect(websocket)
+
+    def __enter__(self):
+        self.output_manager.__enter__()
+        self.echo_reader.__enter__()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.echo_reader.__exit__(exc_type, exc_value, traceback)
+        self.output_manager.__exit__(exc_type, exc_value, traceback)
+
+    def stats(self) -> dict:
+        return {
+            "echo_reader": self.echo_reader.stats(),
+            "clients": self.connection_manager.stats(),
+            "history": self.history.stats(),
+        }
+
+
+class DeviceManager:
+    """The configured devices; the main device always exists."""
+
+    def __init__(self):
+        self.devices: dict[str, Device] = {MAIN_DEVICE: Device(MAIN_DEVICE)}
+        self._running = False
+
+    def __getitem__(self, name: str) -> Device:
+        return self.devices[name]
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.devices
+
+    def __iter__(self):
+        return iter(list(self.devices.values()))
+
+    @property
+    def main(self) -> Device:
+        return self.devices[MAIN_DEVICE]
+
+    @staticmethod
+    def saved_names() -> list[str]:
+        names = []
+        for path in sorted(Path(".").glob(".settings.*.json")):
+            name = path.name[len(".settings."):-len(".json")]
+            if DEVICE_NAME.match(name):
+                names.append(name)
+        return names
+
+    async def load(self):
+        """Load the main device's settings and every other saved device."""
+        for name in [MAIN_DEVICE, *self.saved_names()]:
+            device = self.devices.get(name) or Device(name)
+            try:
+                await device.load()
+            except Exception as e:
+                log.error(f"Failed to load settings of device {name}: {e}")
+                if name != MAIN_DEVICE:
+                    continue
+            self.devices[name] = device
+
+    async def add(self, name: str, settings: Settings) -> Device:
+        device = Device(name)
+        await device.update_settings(settings)
+        self.devices[name] = device
+        if self._running:
+            device.__enter__()
+        log.info(f"Added device {name}")
+        return device
+
+    async def remove(self, name: str):
+        if name == MAIN_DEVICE:
+            raise ValueError("The main device can't be removed")
+        device = self.devices.pop(name)
+        if self._running:
+            device.__exit__(None, None, None)
+        await device.close()
+        if os.path.exists(device.settings_file):
+            os.remove(device.settings_file)
+        log.info(f"Removed device {name}")
+
+    def __enter__(self):
+        self._running = True
+        for device in self:
+            device.__enter__()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._running = False
+        for device in self:
+            device.__exit__(exc_type, exc_value, traceback)
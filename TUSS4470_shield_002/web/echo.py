@@ -1,20 +1,72 @@
 from abc import ABC, abstractmethod
 import asyncio
+from dataclasses import dataclass
 from enum import Enum
+from pathlib import Path
+import socket
+import sys
+import time
 from typing import Callable, Coroutine
 import numpy as np
 import serial.tools.list_ports
-import struct
 import logging
 import serial_asyncio_fast as aserial
 
+# echo_frame.py is shared with the Qt interface and the UART relay one directory up
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+from echo_bus import DEFAULT_BUS, BusSubscriber  # noqa: E402
+from echo_frame import ChecksumError, Deframer, Frame, decode_packet  # noqa: E402
+from frame_codec import datagram_frames  # noqa: E402
+from recording import Recorder, Recording, frame_bytes, open_recording  # noqa: E402
+from bottom import BottomDetector  # noqa: E402
+from metrics import CHECKSUM_ERRORS, PING_LATENCY  # noqa: E402
+from processing import ProcessingChain  # noqa: E402
+from offload import Offloader  # noqa: E402
+from shm_ring import DEFAULT_POLL_INTERVAL  # noqa: E402
+from udp_link import LinkTracker  # noqa: E402
+
 
 log = logging.getLogger("uvicorn")
 
+READ_CHUNK_SIZE = 64 * 1024
+PING_QUEUE_SIZE = 8  # pings buffered per consumer before the oldest are dropped
+
+
+class DropOldestQueue(asyncio.Queue):
+    """Bounded queue that discards its oldest item instead of blocking when full."""
+
+    def __init__(self, maxsize: int = PING_QUEUE_SIZE):
+        super().__init__(maxsize)
+        self.dropped = 0
+
+    def put_nowait(self, item):
+        if self.full():
+            self.get_nowait()
+            self.dropped += 1
+        super().put_nowait(item)
+
+    def stats(self) -> dict:
+        return {"depth": self.qsize(), "maxsize": self.maxsize, "dropped": self.dropped}
+
+
+@dataclass(slots=True)
+class Ping:
+    samples: np.ndarray | None  # None only on the depth queue, for pings held back by block stacking
+    depth: float  # meters
+    temperature: float
+    drive_voltage: float
+    resolution: float  # cm per sample
+    sequence: int
+    received: float = 0.0  # time.perf_counter() when the frame was received
+
 
 class Reader(ABC):
     def __init__(self, settings):
         self.settings = settings
+        self.recorder: Recorder | None = None  # set by EchoReader when recording is enabled
+        self.received = 0.0  # time.perf_counter() at which the last frame returned by read() arrived
+        self.passthrough = False  # return raw frames for the offload worker instead of decoding them
+        self.link: LinkTracker | None = None  # sequence and jitter accounting of UDP readers
 
     @abstractmethod
     async def open(self):
@@ -28,34 +80,51 @@ class Reader(ABC):
     async def read(self):
         pass
 
-    def unpack(self, payload: bytes, checksum: bytes) -> tuple[np.ndarray, float, float, float]:
-        if len(payload) != 6 + self.settings.num_samples or len(checksum) != 1:
-            raise ValueError("Invalid payload or checksum length")
-
-        # Verify checksum
-        calc_checksum = 0
-        for byte in payload:
-            calc_checksum ^= byte
-        if calc_checksum != checksum[0]:
+    @property
+    def dropped(self) -> int:
+        """Frames the reader had to discard because nobody picked them up in time."""
+        return 0
+
+    def unpack(self, packet, verify: bool = True) -> Frame:
+        """Decode a complete frame.
+
+        Samples backed by a mutable buffer (the deframer's) are copied so the buffer
+        can be reused; frames inside an immutable `bytes` object are referenced as-is.
+        With `passthrough` the frame is returned undecoded, as bytes.
+        """
+        if self.passthrough:
+            # Every reader has verified the checksum already, the worker only decodes
+            if self.recorder is not None:
+                self.recorder.write(packet)
+            return packet if isinstance(packet, bytes) else bytes(packet)
+
+        start = time.perf_counter()
+        try:
+            samples, depth, temperature, drive_voltage = decode_packet(
+                packet, self.settings.num_samples, verify=verify
+            )
+        except ChecksumError:
+            CHECKSUM_ERRORS.inc()
             log.warning("⚠️ Checksum mismatch")
-            # raise ValueError("Checksum mismatch")
-
-        # Unpack payload
-        depth, temp_scaled, vDrv_scaled = struct.unpack("<HhH", payload[:6])
-        depth = min(depth, self.settings.num_samples)
+            raise
 
-        samples = np.frombuffer(payload[6:], dtype=np.uint8, count=self.settings.num_samples)
+        if self.recorder is not None:
+            self.recorder.write(packet)
 
-        temperature = temp_scaled / 100.0
-        drive_voltage = vDrv_scaled / 100.0
-        values = np.array(samples)
+        if samples.flags.writeable:
+            samples = samples.copy()
 
-        return values, depth, temperature, drive_voltage
+        PING_LATENCY.observe("unpack", time.perf_counter() - start)
+        return Frame(samples, depth, temperature, drive_voltage)
 
 
 class SerialReader(Reader):
     def __init__(self, settings):
         super().__init__(settings)
+        self.reader = None
+        self.writer = None
+        self._deframer = Deframer(settings.num_samples)
+        self._chunk_received = 0.0
 
     @staticmethod
     def get_serial_ports():
@@ -79,19 +148,22 @@ class SerialReader(Reader):
             raise RuntimeError("Serial port not opened")
         
         while True:
-            header = await self.reader.readexactly(1)
-            if header != b"\xaa":
-                continue  # Wait for the start byte
+            checksum_errors = self._deframer.checksum_errors
+            packet = self._deframer.next_frame()
+            if self._deframer.checksum_errors != checksum_errors:
+                CHECKSUM_ERRORS.inc(self._deframer.checksum_errors - checksum_errors)
+                log.warning("⚠️ Checksum mismatch, resynchronizing")
 
-            payload = await self.reader.readexactly(
-                6 + self.settings.num_samples
-            )  # Read payload
-            checksum = await self.reader.readexactly(1)
+            if packet is not None:
+                # Frames are taken out before the next read, so this chunk completed it
+                self.received = self._chunk_received
+                return self.unpack(packet, verify=False)  # Checksum already verified
 
-            try:
-                return self.unpack(payload, checksum)
-            except ValueError:
-                continue  # Invalid packet, try again
+            chunk = await self.reader.read(READ_CHUNK_SIZE)
+            self._chunk_received = time.perf_counter()
+            if not chunk:
+                raise EOFError("Serial port closed")
+            self._deframer.feed(chunk)
 
 
 class UDPReader(Reader):
@@ -100,35 +172,44 @@ class UDPReader(Reader):
             self.outer = outer
 
         def datagram_received(self, data: bytes, addr):
-            for b in data:
-                if not self.outer._buf:
-                    if b == 0xAA:
-                        self.outer._buf.append(b)
-                    else:
-                        continue
-                else:
-                    self.outer._buf.append(b)
-
-                if len(self.outer._buf) >= self.outer.packet_size:
-                    # Full packet
-                    payload = self.outer._buf[1:1 + 6 + self.outer.settings.num_samples]
-                    checksum = self.outer._buf[-1:]
-                    try:
-                        result = self.outer.unpack(payload, checksum)
-                        self.outer._queue.put_nowait(result)
-                    except ValueError:
-                        pass
-                    finally:
-                        self.outer._buf.clear()
+            outer = self.outer
+            for payload, received in outer.link.receive(data, time.perf_counter()):
+                outer._deframe(payload, received)
+            outer._schedule_release()
 
     def __init__(self, settings):
         super().__init__(settings)
         self._transport = None
-        self._queue: asyncio.Queue = asyncio.Queue()
-        self._buf = bytearray()
-        self.packet_size = 1 + 6 + self.settings.num_samples + 1
+        self._queue = DropOldestQueue()
+        self._deframer = Deframer(self.settings.num_samples)
+        self._release_handle: asyncio.TimerHandle | None = None
+        self.link = LinkTracker()
         self.host = getattr(settings, "udp_host", "0.0.0.0")
         self.port = getattr(settings, "udp_port", 9999)
+        self.multicast_group = getattr(settings, "udp_multicast_group", None)
+
+    def _deframe(self, data, received: float):
+        deframer = self._deframer
+        checksum_errors = deframer.checksum_errors
+        for packet in datagram_frames(deframer, data):  # Raw or compressed (frame_codec.py)
+            # Checksum already verified by the deframer
+            self._queue.put_nowait((received, self.unpack(packet, verify=False)))
+        if deframer.checksum_errors != checksum_errors:
+            CHECKSUM_ERRORS.inc(deframer.checksum_errors - checksum_errors)
+
+    def _schedule_release(self):
+        """Wake up when datagrams held back for reordering are due (udp_link.py)."""
+        deadline = self.link.deadline
+        if deadline is None or self._release_handle is not None:
+            return
+        delay = max(deadline - time.perf_counter(), 0)
+        self._release_handle = asyncio.get_running_loop().call_later(delay, self._release)
+
+    def _release(self):
+        self._release_handle = None
+        for payload, received in self.link.poll(time.perf_counter()):
+            self._deframe(payload, received)
+        self._schedule_release()
 
     async def open(self):
         log.info("Starting UDP listener...")
@@ -136,76 +217,364 @@ class UDPReader(Reader):
         transport, protocol = await loop.create_datagram_endpoint(
             lambda: UDPReader._PacketProtocol(self),
             local_addr=(self.host, self.port),
+            # Several programs on this host may join the group
+            reuse_port=bool(self.multicast_group) and hasattr(socket, "SO_REUSEPORT"),
         )
         self._transport = transport
         log.info(f"📡 UDP listener bound to {self.host}:{self.port}")
+        if self.multicast_group:
+            membership = socket.inet_aton(self.multicast_group) + socket.inet_aton(self.host)
+            transport.get_extra_info("socket").setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, membership)
+            log.info(f"📡 Joined multicast group {self.multicast_group}")
 
     async def close(self):
+        if self._release_handle is not None:
+            self._release_handle.cancel()
+            self._release_handle = None
         if self._transport:
             self._transport.close()
             self._transport = None
 
+    @property
+    def dropped(self) -> int:
+        return self._queue.dropped
+
     async def read(self):
         # Wait for next valid parsed packet
-        return await self._queue.get()
+        self.received, frame = await self._queue.get()
+        return frame
+
+
+class FileReader(Reader):
+    """Plays back a recording (see recording.py) as if it came from the sounder.
+
+    `replay_path` is a recording directory or a single `.pings` file. Pings are
+    paced by their recorded timestamps divided by `replay_speed`; a speed of 0
+    replays as fast as the pipeline can consume them.
+    """
+
+    def __init__(self, settings):
+        super().__init__(settings)
+        self.speed = getattr(settings, "replay_speed", 1.0)
+        self.loop = getattr(settings, "replay_loop", False)
+        self._files: list[Path] = []
+        self._file_index = 0
+        self._timestamps = None
+        self._frames = None
+        self._row = 0
+        self._anchor: tuple[float, float] | None = None  # (monotonic time, recorded timestamp)
+
+    async def open(self):
+        path = Path(self.settings.replay_path)
+        if path.is_dir():
+            recording = Recording(path)
+            self._files = [path / entry["name"] for entry in recording.files]
+        else:
+            self._files = [path]
+        if not self._files:
+            raise FileNotFoundError(f"No recording found in {path}")
+
+        self._open_file(0)
+        start = getattr(self.settings, "replay_start", None)
+        if start is not None:
+            self.seek(start)
+        log.info(f"▶️ Replaying {len(self._files)} file(s) from {path} at {self.speed or 'max'}x")
+
+    async def close(self):
+        self._timestamps = self._frames = None
+
+    def _open_file(self, index: int):
+        records = open_recording(self._files[index])
+        num_samples = records.dtype["frame"]["samples"].shape[0]
+        if num_samples != self.settings.num_samples:
+            raise ValueError(
+                f"{self._files[index].name} was recorded with {num_samples} samples, "
+                f"settings expect {self.settings.num_samples}"
+            )
+        self._file_index = index
+        self._timestamps = records["timestamp"]
+        self._frames = frame_bytes(records)
+        self._row = 0
+
+    def seek(self, timestamp: float):
+        """Continue playback at the first ping recorded at or after `timestamp` (UNIX seconds)."""
+        for index in range(len(self._files)):
+            records = open_recording(self._files[index])
+            row = int(records["timestamp"].searchsorted(timestamp))
+            if row < len(records):
+                self._open_file(index)
+                self._row = row
+                self._anchor = None
+                return
+        raise ValueError(f"No ping recorded at or after {timestamp}")
+
+    def _next_record(self):
+        while self._row >= len(self._frames):
+            if self._file_index + 1 < len(self._files):
+                self._open_file(self._file_index + 1)
+            elif self.loop:
+                self._open_file(0)
+                self._anchor = None
+            else:
+                raise EOFError("Replay finished")
+
+        row = self._row
+        self._row += 1
+        return float(self._timestamps[row]), self._frames[row]
+
+    async def read(self):
+        if self._frames is None:
+            raise RuntimeError("Recording not opened")
+
+        timestamp, packet = self._next_record()
+        if self.speed > 0:
+            if self._anchor is None:
+                self._anchor = (time.monotonic(), timestamp)
+            started, first = self._anchor
+            delay = started + (timestamp - first) / self.speed - time.monotonic()
+            await asyncio.sleep(max(delay, 0))
+        else:
+            await asyncio.sleep(0)  # Let the consumers run between pings
+
+        self.received = time.perf_counter()
+        return self.unpack(packet, verify=False)  # Verified when it was recorded
+
+
+class BusReader(Reader):
+    """Reads the frames that `echo_bus.py serve` publishes in shared memory.
+
+    The daemon owns the serial port, so the Qt interface, a recorder or another
+    backend can use the same sounder at the same time.
+    """
+
+    def __init__(self, settings):
+        super().__init__(settings)
+        self.name = getattr(settings, "bus_name", DEFAULT_BUS)
+        self._bus: BusSubscriber | None = None
+
+    async def open(self):
+        self._bus = BusSubscriber(self.name)
+        if self._bus.num_samples != self.settings.num_samples:
+            raise ValueError(
+                f"Bus {self.name} carries {self._bus.num_samples} samples, settings expect {self.settings.num_samples}"
+            )
+        log.info(f"🚌 Reading pings from shared memory bus {self.name}")
+
+    async def close(self):
+        if self._bus is not None:
+            self._bus.close()
+            self._bus = None
+
+    @property
+    def dropped(self) -> int:
+        return self._bus.lost if self._bus else 0
+
+    async def read(self):
+        if self._bus is None:
+            raise RuntimeError("Bus not opened")
+
+        while True:
+            entry = self._bus.read(copy=True)  # Checked to be complete before it is recorded
+            if entry is None:
+                if self._bus.closed:
+                    raise EOFError(f"Acquisition daemon of bus {self.name} stopped")
+                await asyncio.sleep(DEFAULT_POLL_INTERVAL)
+                continue
+            _, timestamp, packet = entry
+            frame = self.unpack(packet, verify=False)  # Verified by the daemon
+            # Latency metrics start when the daemon received the frame
+            self.received = time.perf_counter() - (time.time() - timestamp)
+            return frame
 
 
 class EchoReader:
+    """Reads pings from the configured connection and hands them to the consumers.
+
+    The reader task never waits for the consumers: every ping is put into one
+    bounded queue per consumer (broadcast and depth output), and a consumer that
+    falls behind loses its oldest pings instead of delaying acquisition.
+    """
+
     def __init__(
         self,
-        data_callback: Callable[[dict], Coroutine],
-        depth_callback: Callable[[dict], Coroutine],
+        data_callback: Callable[[Ping], Coroutine],
+        depth_callback: Callable[[float, float], None],
         settings = None,
     ):
         self.settings = settings
         self._restart_event = asyncio.Event()
         self.data_callback = data_callback
         self.depth_callback = depth_callback
-        self._task: asyncio.Task | None = None
+        self._tasks: list[asyncio.Task] = []
+        self._sequence = 0
+        self._recorder: Recorder | None = None
+        self._reader: Reader | None = None
+        self._detector: BottomDetector | None = None
+        self._processing: ProcessingChain | None = None
+        self._offloader: Offloader | None = None
+
+        self._data_queue = DropOldestQueue()
+        self._depth_queue = DropOldestQueue()
 
     def update_settings(self, new_settings):
         log.info("EchoReader updating settings...")
         self.settings = new_settings
         self._restart_event.set()  # Signal restart
 
+    def stats(self) -> dict:
+        return {
+            "pings": self._sequence,
+            "reader_dropped": self._reader.dropped if self._reader else 0,
+            "offload_dropped": self._offloader.dropped if self._offloader else None,
+            "link": self._reader.link.stats() if self._reader and self._reader.link else None,
+            "queues": {
+                "broadcast": self._data_queue.stats(),
+                "depth": self._depth_queue.stats(),
+            },
+            "recorder": self._recorder.stats() if self._recorder else None,
+        }
+
+    def seek(self, timestamp: float):
+        """Jump to `timestamp` (UNIX seconds) when replaying a recording."""
+        if not isinstance(self._reader, FileReader):
+            raise ValueError("Seeking is only possible when replaying a recording")
+        self._reader.seek(timestamp)
+
+    def _start_recorder(self) -> Recorder | None:
+        if not self.settings.recording_enable:
+            return None
+        if isinstance(self._reader, FileReader):
+            replayed = Path(self.settings.replay_path).resolve()
+            if replayed.is_file():
+                replayed = replayed.parent
+            if replayed == Path(self.settings.recording_directory).resolve():
+                # The replay would read the files being written and play its own output back
+                log.warning(f"⚠️ Not recording while replaying from the same directory {replayed}")
+                return None
+        recorder = Recorder(
+            self.settings.recording_directory,
+            self.settings.num_samples,
+            max_bytes=self.settings.recording_max_megabytes * 1024 * 1024,
+            max_seconds=self.settings.recording_max_minutes * 60,
+        )
+        recorder.start()
+        log.info(f"⏺️ Recording pings to {recorder.directory}")
+        return recorder
+
+    def _start_detector(self) -> BottomDetector | None:
+        if getattr(self.settings, "depth_source", "firmware") != "host":
+            return None
+        return BottomDetector(self.settings.num_samples, blind_zone=self.settings.blind_zone)
+
+    def _start_processing(self) -> ProcessingChain | None:
+        return ProcessingChain.from_settings(self.settings)
+
+    def _start_offload(self) -> Offloader | None:
+        if not getattr(self.settings, "offload_enable", False):
+            return None
+        offloader = Offloader(self.settings, self._publish)
+        offloader.start()
+        return offloader
+
+    def _stop_offload(self):
+        offloader, self._offloader = self._offloader, None
+        if offloader is not None:
+            offloader.stop()
+
+    def _stop_offload_after_failure(self, reader: Reader):
+        """The worker process died, decode and process the pings in this process from now on."""
+        self._stop_offload()
+        reader.passthrough = False
+        self._detector = self._start_detector()
+        self._processing = self._start_processing()
+
     def __enter__(self):
-        self._task = asyncio.create_task(self.run_forever())
+        self._tasks = [
+            asyncio.create_task(self.run_forever()),
+            asyncio.create_task(self._send_data()),
+            asyncio.create_task(self._send_depth()),
+        ]
         return self
 
     def __exit__(self, exc_type, exc_value, traceback):
-        if self._task:
-            self._task.cancel()
-            self._task = None
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = []
+
+        # The cancelled reader task won't get to close the recording, finish it here
+        recorder, self._recorder = self._recorder, None
+        if recorder is not None:
+            recorder.stop()
+        self._stop_offload()
 
         if exc_type is not None:
             log.error(f"Error in EchoReader: {exc_value}")
 
     async def aread_echo(self, reader: Reader):
         result = await reader.read()
+        if self._offloader is not None:
+            if not self._offloader.failed and self._offloader.submit(result, reader.received):
+                return  # Comes back through _publish()
+            self._stop_offload_after_failure(reader)
+        if isinstance(result, bytes):
+            # Read for the worker before it died, the checksum is verified already
+            result = decode_packet(result, self.settings.num_samples, verify=False)
         if result:
             values, depth_index, temperature, drive_voltage = result
+            if self._detector is not None:
+                # Keep the firmware depth until the detector has found the bottom
+                tracked = self._detector.update(values)
+                if tracked is not None:
+                    depth_index = tracked
 
             resolution = self.settings.resolution
-            depth = depth_index * (resolution / 100)  # Convert to meters
+            if self._processing is not None:
+                # After the bottom detector, which wants the raw samples
+                start = time.perf_counter()
+                values = self._processing.process(values)
+                PING_LATENCY.observe("processing", time.perf_counter() - start)
+                resolution = self._processing.resolution
+
+            self._publish(values, depth_index, temperature, drive_voltage, resolution, reader.received)
+
+    def _publish(self, values, depth_index, temperature, drive_voltage, resolution, received):
+        """Hand a ping to the broadcast and depth queues. `values` is None while a block
+        stack is still filling; the depth of such pings is still sent, only the broadcast waits."""
+        if values is not None:
+            self._sequence += 1
+        ping = Ping(
+            samples=values,
+            depth=depth_index * (self.settings.resolution / 100),  # Convert to meters
+            temperature=temperature,
+            drive_voltage=drive_voltage,
+            resolution=resolution,
+            sequence=self._sequence,
+            received=received,
+        )
+        if values is not None:
+            self._data_queue.put_nowait(ping)
+        self._depth_queue.put_nowait(ping)
+
+    async def _send_data(self):
+        while True:
+            ping = await self._data_queue.get()
+            start = time.perf_counter()
+            PING_LATENCY.observe("broadcast_queue", start - ping.received)
             try:
-                data = {
-                    "spectrogram": values.tolist(),
-                    "measured_depth": depth,
-                    "temperature": temperature,
-                    "drive_voltage": drive_voltage,
-                    "resolution": resolution,
-                }
-                await self.data_callback(data)
+                await self.data_callback(ping)
             except Exception as e:
                 log.error(f"❌ Error sending data: {e}", exc_info=e)
+            PING_LATENCY.observe("broadcast", time.perf_counter() - start)
 
+    async def _send_depth(self):
+        while True:
+            ping = await self._depth_queue.get()
+            PING_LATENCY.observe("depth_queue", time.perf_counter() - ping.received)
             try:
-                self.depth_callback(depth)
+                self.depth_callback(ping.depth, ping.received)
             except Exception as e:
                 log.error(f"❌ Error sending depth: {e}", exc_info=e)
 
-        await asyncio.sleep(0.1)  # Allow time for other tasks
-
     async def run_forever(self):
         """Continuously read serial data and emit processed arrays. Supports live settings update and restart."""
         while True:
@@ -216,16 +585,32 @@ class EchoReader:
 
             log.info("EchoReader starting...")
             self._restart_event.clear()
+            reader = None
             try:
-                reader = self.settings.connection_type.value(self.settings)
+                reader = self._reader = self.settings.connection_type.value(self.settings)
+                self._recorder = reader.recorder = self._start_recorder()
+                self._offloader = self._start_offload()
+                reader.passthrough = self._offloader is not None
+                # The worker process runs its own detector and processing chain
+                self._detector = None if reader.passthrough else self._start_detector()
+                self._processing = None if reader.passthrough else self._start_processing()
                 await reader.open()
                 log.info(f"Opening connection: {self.settings.connection_type.name}")
                 while not self._restart_event.is_set():
                     await self.aread_echo(reader)
+            except EOFError as e:
+                log.warning(f"⏹️ {e}")  # End of a replay or the serial port went away
             except Exception as e:
                 log.error(f"❌ Error in EchoReader: {e}", exc_info=e)
             finally:
-                await reader.close()
+                if reader is not None:
+                    await reader.close()
+                    self._reader = None
+                self._stop_offload()
+                recorder, self._recorder = self._recorder, None
+                if recorder is not None:
+                    # Writes out what is still queued and fsyncs, keep it off the event loop
+                    await asyncio.to_thread(recorder.stop)
 
             await self._restart_event.wait()
 
@@ -233,3 +618,5 @@ class EchoReader:
 class ConnectionTypeEnum(Enum):
     SERIAL = SerialReader
     UDP = UDPReader
+    FILE = FileReader
+    BUS = BusReader
@@ -0,0 +1,190 @@
+"""Rolling ping history with a max-pooled overview pyramid.
+
+Every ping that is broadcast is also kept in a ring of `history_pings` rows
+(level 0). Level k of the pyramid holds the maximum of every 2^k consecutive
+pings, in half as many rows as level k - 1, so all levels span the same time
+and together take twice the memory of level 0. Each new ping costs one row
+maximum per level it completes, two on average.
+
+`PingHistory.latest()` hands out the newest level 0 rows for the snapshot that
+new WebSocket clients get (connections.py).
+
+`PingHistory.window()` picks the coarsest level that still has at least one
+row per requested column. It copies only the rows within the time window, fewer
+than two per column, max-pools them into the exact number of columns and then
+max-pools the depth down to the requested height. A window of hours costs as
+much as one of a minute. Columns without a ping are zero and have a NaN depth.
+
+The levels keep every sample: canvases are about as tall as a ping has
+samples, so levels pooled in depth as well would rarely be fine enough, and
+pooling the depth of at most `columns` rows per request is cheap.
+"""
+
+from bisect import bisect_left
+from dataclasses import dataclass
+import math
+import time
+
+import numpy as np
+
+from echo import Ping
+
+MAX_COLUMNS = 8192
+MIN_LEVEL_ROWS = 64  # no levels with fewer rows than this
+
+
+@dataclass(slots=True)
+class HistoryWindow:
+    start: float  # UNIX time of the left edge of the first column
+    end: float  # UNIX time of the right edge of the last column
+    level: int  # pyramid level the columns were pooled from
+    resolution: float  # cm per row
+    samples: np.ndarray  # (columns, rows) uint8, one contiguous column per time step
+    depths: np.ndarray  # (columns,) float32 meters, NaN where there was no ping
+
+
+def pool_depth(rows: np.ndarray, factor: int) -> np.ndarray:
+    """Maximum of every `factor` samples along the last axis."""
+    if factor == 1:
+        return rows
+    pooled = rows[..., ::factor].copy()
+    for offset in range(1, factor):
+        part = rows[..., offset::factor]
+        np.maximum(pooled[..., : part.shape[-1]], part, out=pooled[..., : part.shape[-1]])
+    return pooled
+
+
+class _Level:
+    """One ring of the pyramid; row i (counted from the start) is stored at i % rows."""
+
+    def __init__(self, rows: int, samples: int, time_factor: int):
+        self.rows = rows
+        self.time_factor = time_factor
+        self.data = np.zeros((rows, samples), dtype=np.uint8)
+        self.timestamps = np.zeros(rows, dtype=np.float64)
+        self.depths = np.zeros(rows, dtype=np.float32)
+        self.sequences = np.zeros(rows, dtype=np.int64)
+        self.count = 0
+
+    @property
+    def first(self) -> int:
+        return max(self.count - self.rows, 0)
+
+    def append(self, samples, timestamp: float, depth: float, sequence: int):
+        index = self.count % self.rows
+        self.data[index] = samples
+        self.timestamps[index] = timestamp
+        self.depths[index] = depth
+        self.sequences[index] = sequence
+        self.count += 1
+
+    def search(self, timestamp: float) -> int:
+        """First row (counted from the start) at or after `timestamp`."""
+        return bisect_left(
+            range(self.first, self.count), timestamp, key=lambda i: self.timestamps[i % self.rows]
+        ) + self.first
+
+
+class PingHistory:
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.levels: list[_Level] = []
+        self.resolution = 0.0
+
+    @property
+    def pings(self) -> int:
+        return self.levels[0].count - self.levels[0].first if self.levels else 0
+
+    def append(self, ping: Ping, timestamp: float | None = None):
+        if self.capacity <= 0:
+            return
+        timestamp = time.time() if timestamp is None else timestamp
+        if not self.levels or self.levels[0].data.shape[1] != len(ping.samples) or self.resolution != ping.resolution:
+            self._reset(len(ping.samples), ping.resolution)  # Settings changed, older pings don't fit
+
+        self.levels[0].append(ping.samples, timestamp, ping.depth, ping.sequence)
+        for level, coarser in zip(self.levels, self.levels[1:]):
+            if level.count % 2:
+                break  # Pair not complete yet
+            a, b = (level.count - 2) % level.rows, (level.count - 1) % level.rows
+            coarser.append(
+                np.maximum(level.data[a], level.data[b]),
+                level.timestamps[a],
+                max(level.depths[a], level.depths[b]),
+                level.sequences[a],
+            )
+
+    def window(self, start: float, end: float, columns: int, samples: int, height: int) -> HistoryWindow | None:
+        """Pings from `start` to `end` as `columns` columns of the first `samples`
+        samples, max-pooled to at most `height` rows; None if the history is empty."""
+        if not self.pings:
+            return None
+        base = self.levels[0]
+        samples = max(1, min(samples, base.data.shape[1]))
+        in_window = base.search(end) - base.search(start)
+
+        # Coarsest level that still has a row for every column
+        level_index = min(max(int(math.log2(max(in_window / columns, 1))), 0), len(self.levels) - 1)
+        level = self.levels[level_index]
+
+        factor = math.ceil(samples / height)
+        rows = math.ceil(samples / factor)
+        result = np.zeros((columns, rows), dtype=np.uint8)
+        depths = np.full(columns, np.nan, dtype=np.float32)
+
+        indices = np.arange(level.search(start), level.search(end)) % level.rows
+        if len(indices):
+            timestamps = level.timestamps[indices]
+            column = ((timestamps - start) * (columns / (end - start))).astype(np.int64)
+            np.clip(column, 0, columns - 1, out=column)
+            firsts = np.flatnonzero(np.concatenate(([True], column[1:] != column[:-1])))
+            counts = np.diff(np.append(firsts, len(indices)))
+            # Pool in time first, which leaves at most `columns` rows to pool in depth. Columns
+            # rarely get more than two rows; a loop over those beats np.maximum.reduceat by far.
+            data = level.data[indices, :samples]
+            pooled = data[firsts]
+            for offset in range(1, counts.max()):
+                more = np.flatnonzero(counts > offset)
+                pooled[more] = np.maximum(pooled[more], data[firsts[more] + offset])
+            result[column[firsts]] = pool_depth(pooled, factor)
+            depths[column[firsts]] = np.maximum.reduceat(level.depths[indices], firsts)
+
+        return HistoryWindow(
+            start=start,
+            end=end,
+            level=level_index,
+            resolution=self.resolution * factor,
+            samples=result,
+            depths=depths,
+        )
+
+    def latest(self, count: int) -> tuple[np.ndarray, np.ndarray, int] | None:
+        """The last `count` pings, oldest first: (samples, depths, sequence of the first);
+        None if the history is empty."""
+        if not self.pings or count <= 0:
+            return None
+        base = self.levels[0]
+        indices = np.arange(base.count - min(count, self.pings), base.count) % base.rows
+        return base.data[indices], base.depths[indices], int(base.sequences[indices[0]])
+
+    def stats(self) -> dict:
+        if not self.pings:
+            return {"pings": 0, "oldest": None, "newest": None, "levels": len(self.levels)}
+        base = self.levels[0]
+        return {
+            "pings": self.pings,
+            "oldest": float(base.timestamps[base.first % base.rows]),
+            "newest": float(base.timestamps[(base.count - 1) % base.rows]),
+            "levels": len(self.levels),
+        }
+
+    def _reset(self, num_samples: int, resolution: float):
+        self.resolution = resolution
+        self.levels = []
+        rows, time_factor = self.capacity, 1
+        while True:
+            self.levels.append(_Level(rows, num_samples, time_factor))
+            rows //= 2
+            time_factor *= 2
+            if rows < MIN_LEVEL_ROWS:
+                break
@@ -0,0 +1,132 @@
+"""Prometheus-style metrics for the acquisition pipeline.
+
+Every ping is stamped with `time.perf_counter()` when its last byte was received
+(`Ping.received`) and timed through the pipeline into `PING_LATENCY`, one
+histogram per stage:
+
+    unpack            decoding the frame
+    processing        the processing chain (processing.py), if enabled
+    broadcast_queue   receive -> picked up by the WebSocket broadcast
+    broadcast         encoding and queueing for all WebSocket clients
+    websocket_send    one send to one client
+    depth_queue       receive -> picked up by the depth output
+    depth_output      receive -> depth written to SignalK / NMEA0183
+
+Histograms use fixed buckets, so an observation is a bisect and two additions.
+`/metrics` in app.py renders everything in the Prometheus text format.
+"""
+
+from bisect import bisect_left
+from typing import Callable, Iterable
+
+LATENCY_BUCKETS = (
+    1e-5, 2.5e-5, 5e-5,
+    1e-4, 2.5e-4, 5e-4,
+    1e-3, 2.5e-3, 5e-3,
+    0.01, 0.025, 0.05,
+    0.1, 0.25, 0.5,
+    1.0, 2.5, 5.0, 10.0,
+)
+
+
+def format_labels(labels: dict) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{value}"' for key, value in labels.items()) + "}"
+
+
+class Counter:
+    def __init__(self, name: str, help: str):
+        self.name = name
+        self.help = help
+        self.value = 0
+
+    def inc(self, amount: int = 1):
+        self.value += amount
+
+    def collect(self) -> Iterable[str]:
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} counter"
+        yield f"{self.name} {self.value}"
+
+
+class CallbackMetric:
+    """Counter or gauge whose samples are read from the running objects at scrape time.
+
+    `func` returns a number or a list of (labels, value) pairs.
+    """
+
+    def __init__(self, name: str, help: str, type: str, func: Callable):
+        self.name = name
+        self.help = help
+        self.type = type
+        self.func = func
+
+    def collect(self) -> Iterable[str]:
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} {self.type}"
+        samples = self.func()
+        if isinstance(samples, (int, float)):
+            samples = [({}, samples)]
+        for labels, value in samples:
+            yield f"{self.name}{format_labels(labels)} {value}"
+
+
+class Histogram:
+    """Fixed-bucket histogram with one series per value of a single label."""
+
+    def __init__(self, name: str, help: str, label: str, buckets: tuple[float, ...] = LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.label = label
+        self.buckets = buckets
+        self._series: dict[str, list] = {}  # label value -> [bucket counts..., sum, count]
+
+    def observe(self, label_value: str, value: float):
+        series = self._series.get(label_value)
+        if series is None:
+            series = self._series[label_value] = [0] * (len(self.buckets) + 1) + [0.0, 0]
+        series[bisect_left(self.buckets, value)] += 1
+        series[-2] += value
+        series[-1] += 1
+
+    def collect(self) -> Iterable[str]:
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} histogram"
+        for label_value, series in self._series.items():
+            labels = {self.label: label_value}
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), series):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                yield f"{self.name}_bucket{format_labels({**labels, 'le': le})} {cumulative}"
+            yield f"{self.name}_sum{format_labels(labels)} {series[-2]}"
+            yield f"{self.name}_count{format_labels(labels)} {series[-1]}"
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics:
+            try:
+                lines.extend(metric.collect())
+            except Exception as e:  # A scrape must never fail because one source is gone
+                lines.append(f"# {metric.name} unavailable: {e}")
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+PING_LATENCY = registry.register(
+    Histogram("openecho_ping_latency_seconds", "Time spent per pipeline stage", "stage")
+)
+CHECKSUM_ERRORS = registry.register(
+    Counter("openecho_checksum_errors_total", "Frames rejected because of a checksum mismatch")
+)
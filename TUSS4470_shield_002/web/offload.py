@@ -0,0 +1,217 @@
+"""Decoding and processing of pings in a worker process.
+
+With `offload_enable` the event loop only does I/O. Readers hand the raw frames
+to an `Offloader`, which copies them into a shared-memory ring (see shm_ring.py)
+and wakes the worker process. The worker decodes each frame, runs the host
+bottom detector and the processing chain, and writes the result into a second
+ring:
+
+    depth index:float64 | temperature:float64 | drive voltage:float64 | resolution:float64
+    | input sequence:int64 | unpack seconds:float64 | processing seconds:float64 | samples:uint8[]
+
+An entry without samples means the processing chain held the ping back (block
+stacking). The worker and the event loop wake each other with single bytes on a
+pair of non-blocking pipes. If either side falls behind, the ring overwrites the
+oldest pings instead of blocking, and the loss is counted in `dropped`. If the
+worker dies, `failed` is set and EchoReader goes back to decoding in-process.
+"""
+
+import asyncio
+import logging
+import multiprocessing
+import os
+from pathlib import Path
+import struct
+import sys
+import time
+from types import SimpleNamespace
+from typing import Callable
+
+import numpy as np
+
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+from bottom import BottomDetector  # noqa: E402
+from echo_frame import decode_packet, packet_size  # noqa: E402
+from shm_ring import RingReader, SharedRing  # noqa: E402
+from metrics import PING_LATENCY  # noqa: E402
+from processing import ProcessingChain  # noqa: E402
+
+log = logging.getLogger("uvicorn")
+
+RING_SLOTS = 64
+RESULT_HEADER = struct.Struct("<ddddqdd")
+STOP_TIMEOUT = 2.0  # seconds the worker gets to exit before it is terminated
+WORKER_SETTINGS = (
+    "num_samples", "resolution", "depth_source", "blind_zone",
+    "processing_tvg_spreading", "processing_tvg_absorption", "processing_smoothing",
+    "processing_stack", "processing_stack_mode", "processing_decimation",
+)
+
+
+def notify(fd: int):
+    try:
+        os.write(fd, b"\x01")
+    except BlockingIOError:
+        pass  # The pipe is full of wake-ups already, the other side will see this entry too
+
+
+def _worker(settings, frames_name: str, results_name: str, wakeup, done):
+    frames = SharedRing.attach(frames_name, child=True)
+    results = SharedRing.attach(results_name, child=True)
+    reader = RingReader(frames, start=-1)  # Frames submitted while this process started count too
+    detector = None
+    if getattr(settings, "depth_source", "firmware") == "host":
+        detector = BottomDetector(settings.num_samples, blind_zone=settings.blind_zone)
+    processing = ProcessingChain.from_settings(settings)
+    resolution = processing.resolution if processing is not None else settings.resolution
+    os.set_blocking(done.fileno(), False)
+
+    try:
+        while True:
+            if not os.read(wakeup.fileno(), 4096):
+                break  # The event loop closed its end
+            while (entry := reader.read(copy=False)) is not None:
+                sequence, received, packet = entry
+                start = time.perf_counter()
+                values, depth_index, temperature, drive_voltage = decode_packet(
+                    packet, settings.num_samples, verify=False
+                )
+                if detector is not None:
+                    tracked = detector.update(values)
+                    if tracked is not None:
+                        depth_index = tracked
+                decoded = time.perf_counter()
+                if processing is not None:
+                    values = processing.process(values)
+                processed = time.perf_counter()
+                if not frames.valid(sequence):
+                    continue  # Overwritten while we were working on it, the gap counts as dropped
+
+                header = RESULT_HEADER.pack(
+                    depth_index, temperature, drive_voltage, resolution,
+                    sequence, decoded - start, processed - decoded,
+                )
+                payload = np.empty(RESULT_HEADER.size + (0 if values is None else len(values)), dtype=np.uint8)
+                payload[: RESULT_HEADER.size] = np.frombuffer(header, dtype=np.uint8)
+                if values is not None:
+                    payload[RESULT_HEADER.size :] = values
+                results.write(payload, received)
+                notify(done.fileno())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        frames.close()
+        results.close()
+
+
+class Offloader:
+    """Runs `_worker` in a separate process and hands its results to `callback` on the event loop.
+
+    `callback(samples, depth_index, temperature, drive_voltage, resolution, received)`
+    is called for every ping that comes out of the processing chain, with `samples`
+    None for pings held back by block stacking.
+    """
+
+    def __init__(self, settings, callback: Callable, slots: int = RING_SLOTS):
+        self.settings = settings
+        self.callback = callback
+        self.slots = slots
+        self.submitted = 0
+        self._frames: SharedRing | None = None
+        self._results: SharedRing | None = None
+        self._reader: RingReader | None = None
+        self._process = None
+        self._next_input = 0
+        self._input_lost = 0
+        self.failed = False  # the worker exited on its own
+
+    @property
+    def dropped(self) -> int:
+        """Pings lost because the worker or the event loop fell behind.
+
+        Counted from the gaps in the input sequence of the results alone: a result
+        overwritten in the results ring leaves such a gap too (`RingReader.lost`).
+        """
+        return self._input_lost
+
+    def start(self):
+        context = multiprocessing.get_context("spawn")  # Forking a running event loop is not safe
+        self._frames = SharedRing.create(self.slots, packet_size(self.settings.num_samples))
+        self._results = SharedRing.create(self.slots, RESULT_HEADER.size + self.settings.num_samples)
+        self._reader = RingReader(self._results)
+        wakeup_read, self._wakeup = context.Pipe(duplex=False)
+        self._done, done_write = context.Pipe(duplex=False)
+        # Only plain values cross the process boundary, the settings object may not pickle
+        settings = SimpleNamespace(
+            **{name: getattr(self.settings, name) for name in WORKER_SETTINGS if hasattr(self.settings, name)}
+        )
+        self._process = context.Process(
+            target=_worker,
+            args=(settings, self._frames.name, self._results.name, wakeup_read, done_write),
+            name="openecho-offload",
+            daemon=True,
+        )
+        self._process.start()
+        wakeup_read.close()
+        done_write.close()
+        os.set_blocking(self._wakeup.fileno(), False)
+        os.set_blocking(self._done.fileno(), False)
+        asyncio.get_running_loop().add_reader(self._done.fileno(), self._collect)
+        log.info(f"⚙️ Decoding and processing in worker process {self._process.pid}")
+
+    def submit(self, packet, received: float) -> bool:
+        """Queue a raw frame for the worker. Never blocks; False if the worker is gone."""
+        self._frames.write(packet, received)
+        try:
+            notify(self._wakeup.fileno())
+        except OSError:
+            # Died before _collect() saw the end of its pipe, the caller decodes this frame itself
+            self._worker_exited()
+            return False
+        self.submitted += 1
+        return True
+
+    def _collect(self):
+        try:
+            if not os.read(self._done.fileno(), 4096):
+                self._worker_exited()
+        except BlockingIOError:
+            pass
+        except OSError:
+            return  # Worker gone, stop() cleans up
+        while (entry := self._reader.read()) is not None:
+            _, received, payload = entry
+            depth_index, temperature, drive_voltage, resolution, sequence, unpack, processing = (
+                RESULT_HEADER.unpack_from(payload)
+            )
+            self._input_lost += sequence - self._next_input
+            self._next_input = sequence + 1
+            PING_LATENCY.observe("unpack", unpack)
+            PING_LATENCY.observe("processing", processing)
+            # No samples while a block stack is filling, the depth still goes out
+            samples = payload[RESULT_HEADER.size :] if len(payload) > RESULT_HEADER.size else None
+            self.callback(samples, depth_index, temperature, drive_voltage, resolution, received)
+
+    def _worker_exited(self):
+        # The pipe stays readable at end of file, without this the loop would call us forever
+        asyncio.get_running_loop().remove_reader(self._done.fileno())
+        self._process.join(0.1)
+        log.error(f"❌ Offload worker exited with code {self._process.exitcode}, decoding in-process again")
+        self.failed = True
+
+    def stop(self):
+        if self._process is None:
+            return
+        try:
+            asyncio.get_running_loop().remove_reader(self._done.fileno())
+        except RuntimeError:
+            pass  # No running loop (shutdown)
+        self._wakeup.close()  # The worker sees end of file and exits
+        self._process.join(STOP_TIMEOUT)
+        if self._process.is_alive():
+            self._process.terminate()
+            self._process.join()
+        self._done.close()
+        self._frames.close()
+        self._results.close()
+        self._process = self._frames = self._results = None
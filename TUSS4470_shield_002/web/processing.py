@@ -0,0 +1,147 @@
+"""Signal processing between the reader and the consumers.
+
+The raw uint8 samples of every ping can be run through a chain of optional
+stages before they are broadcast:
+
+    tvg         time-varying gain, spreading * log10(r) + 2 * absorption * r dB
+                relative to 1 m, to even out the echo strength over depth
+    smoothing   centered moving average over `smoothing` samples (envelope)
+    stack       average over the last `stack` pings; RUNNING sends every ping,
+                BLOCK sends one averaged ping per `stack` pings
+    decimation  maximum over every `decimation` samples, so peaks like the
+                bottom echo survive; the resolution grows accordingly
+
+All stages work in place on float32 buffers allocated once per chain. The only
+per-ping allocation is the final uint8 array, which the consumers keep.
+"""
+
+from enum import StrEnum
+
+import numpy as np
+
+
+class StackMode(StrEnum):
+    RUNNING = "running"  # moving average, one output per ping
+    BLOCK = "block"  # one output per `stack` pings
+
+
+class ProcessingChain:
+    def __init__(
+        self,
+        num_samples: int,
+        resolution: float,
+        tvg_spreading: float = 0.0,
+        tvg_absorption: float = 0.0,
+        smoothing: int = 1,
+        stack: int = 1,
+        stack_mode: StackMode = StackMode.RUNNING,
+        decimation: int = 1,
+    ):
+        if smoothing < 1 or stack < 1 or not 1 <= decimation <= num_samples:
+            raise ValueError(
+                f"Invalid processing: smoothing={smoothing}, stack={stack}, decimation={decimation}"
+            )
+        self.num_samples = num_samples
+        self.stack = stack
+        self.stack_mode = StackMode(stack_mode)
+        self.decimation = decimation
+        self.resolution = resolution * decimation  # cm per output sample
+
+        self._work = np.empty(num_samples, dtype=np.float32)
+
+        self._gain = None
+        if tvg_spreading or tvg_absorption:
+            r = np.maximum(np.arange(num_samples) * (resolution / 100), resolution / 100)  # meters
+            gain_db = tvg_spreading * np.log10(r) + 2 * tvg_absorption * r
+            self._gain = (10 ** (gain_db / 20)).astype(np.float32)
+
+        self._smoothing = smoothing > 1
+        if self._smoothing:
+            k = np.arange(num_samples)
+            self._hi = np.minimum(k + smoothing // 2 + 1, num_samples)
+            self._lo = np.maximum(k - (smoothing - 1) // 2, 0)
+            self._scale = (1.0 / (self._hi - self._lo)).astype(np.float32)  # shorter at the ends
+            self._cumulative = np.zeros(num_samples + 1, dtype=np.float32)
+            self._upper = np.empty(num_samples, dtype=np.float32)
+
+        # Sum of the pings in the stack, in float64 so adding and removing doesn't drift
+        self._sum = np.zeros(num_samples, dtype=np.float64)
+        self._ring = np.zeros((stack, num_samples), dtype=np.float32) if self.stack_mode is StackMode.RUNNING else None
+        self._count = 0
+        self._next = 0
+
+        # Strided views, one per position inside a block; a few np.maximum calls are
+        # much faster than np.max over a short last axis
+        length = num_samples // decimation
+        self._phases = [self._work[j : length * decimation : decimation] for j in range(decimation)]
+        self._decimated = np.empty(length, dtype=np.float32)
+
+    @classmethod
+    def from_settings(cls, settings) -> "ProcessingChain | None":
+        """Chain for the processing settings, or None if every stage is off."""
+        chain = cls(
+            settings.num_samples,
+            settings.resolution,
+            tvg_spreading=getattr(settings, "processing_tvg_spreading", 0.0),
+            tvg_absorption=getattr(settings, "processing_tvg_absorption", 0.0),
+            smoothing=getattr(settings, "processing_smoothing", 1),
+            stack=getattr(settings, "processing_stack", 1),
+            stack_mode=getattr(settings, "processing_stack_mode", StackMode.RUNNING),
+            decimation=getattr(settings, "processing_decimation", 1),
+        )
+        return chain if chain.enabled else None
+
+    @property
+    def enabled(self) -> bool:
+        return self._gain is not None or self._smoothing or self.stack > 1 or self.decimation > 1
+
+    def reset(self):
+        self._sum.fill(0.0)
+        if self._ring is not None:
+            self._ring.fill(0.0)
+        self._count = 0
+        self._next = 0
+
+    def process(self, samples: np.ndarray) -> np.ndarray | None:
+        """Run one ping through the chain; None while a BLOCK stack is still filling."""
+        work = self._work
+        np.copyto(work, samples, casting="unsafe")
+
+        if self._gain is not None:
+            np.multiply(work, self._gain, out=work)
+
+        if self._smoothing:
+            np.cumsum(work, out=self._cumulative[1:])
+            np.take(self._cumulative, self._hi, out=self._upper)
+            np.take(self._cumulative, self._lo, out=work)
+            np.subtract(self._upper, work, out=work)
+            np.multiply(work, self._scale, out=work)
+
+        if self.stack > 1 and not self._stack(work):
+            return None
+
+        np.copyto(self._decimated, self._phases[0])
+        for phase in self._phases[1:]:
+            np.maximum(self._decimated, phase, out=self._decimated)
+        np.clip(self._decimated, 0, 255, out=self._decimated)
+        np.rint(self._decimated, out=self._decimated)
+        return self._decimated.astype(np.uint8)
+
+    def _stack(self, work: np.ndarray) -> bool:
+        """Replace `work` with the stack average; False if there is nothing to send yet."""
+        if self._ring is not None:
+            row = self._ring[self._next]
+            self._sum -= row
+            row[:] = work
+            self._next = (self._next + 1) % self.stack
+            self._count = min(self._count + 1, self.stack)
+        else:
+            self._count += 1
+        self._sum += work
+
+        if self._ring is None and self._count < self.stack:
+            return False
+        np.multiply(self._sum, 1.0 / self._count, out=work, casting="same_kind")
+        if self._ring is None:
+            self.reset()
+        return True
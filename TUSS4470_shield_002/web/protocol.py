@@ -0,0 +1,132 @@
+"""WebSocket message encoding for the spectrogram stream.
+
+Binary messages (the default) start with a fixed little-endian header followed by
+the raw uint8 samples:
+
+    offset  type     field
+    0       uint8    message type (MESSAGE_PING)
+    1       uint8    protocol version
+    2       uint16   number of samples
+    4       uint32   sequence number
+    8       float32  measured depth (m)
+    12      float32  temperature (°C)
+    16      float32  drive voltage (V)
+    20      float32  resolution (cm per sample)
+    24      uint8[]  samples
+
+Clients that asked for server-side rendering (see render.py) get column messages
+instead: the same header with MESSAGE_COLUMN_RGBA or MESSAGE_COLUMN_INDEX as type
+and the column height in pixels instead of the number of samples, followed by
+4 bytes (RGBA) or 1 byte (colormap index) per pixel.
+
+Clients that connect with `?format=json` get the previous JSON objects instead.
+
+Right after connecting, binary clients that pass `?snapshot=<columns>` get the
+most recent pings first, in one MESSAGE_SNAPSHOT block (see connections.py):
+
+    offset  type     field
+    0       uint8    message type (MESSAGE_SNAPSHOT)
+    1       uint8    protocol version
+    2       uint16   number of pings, oldest first
+    4       uint16   samples per ping
+    6       uint16   reserved
+    8       uint32   sequence number of the first ping
+    12      float32  resolution (cm per sample)
+    16      float32[pings]          measured depth of each ping (m)
+    ...     uint8[pings][samples]   samples, one ping after the other
+
+`GET /history` (see history.py) answers with one MESSAGE_HISTORY block:
+
+    offset  type     field
+    0       uint8    message type (MESSAGE_HISTORY)
+    1       uint8    protocol version
+    2       uint16   number of columns
+    4       uint16   rows per column
+    6       uint8    pyramid level the columns were pooled from
+    7       uint8    reserved
+    8       float64  start (UNIX seconds, left edge of the first column)
+    16      float64  end (UNIX seconds, right edge of the last column)
+    24      float32  resolution (cm per row)
+    28      float32[columns]        depth of each column (m), NaN without a ping
+    ...     uint8[columns][rows]    samples, one column after the other
+"""
+
+from enum import StrEnum
+import json
+import struct
+
+import numpy as np
+
+from echo import Ping
+from history import HistoryWindow
+
+PROTOCOL_VERSION = 1
+MESSAGE_PING = 1
+MESSAGE_COLUMN_RGBA = 2
+MESSAGE_COLUMN_INDEX = 3
+MESSAGE_HISTORY = 4
+MESSAGE_SNAPSHOT = 5
+
+PING_HEADER = struct.Struct("<BBHIffff")
+HISTORY_HEADER = struct.Struct("<BBHHBxddf")
+SNAPSHOT_HEADER = struct.Struct("<BBHHxxIf")
+
+
+class MessageFormat(StrEnum):
+    BINARY = "binary"
+    JSON = "json"
+
+
+def encode_header(message_type: int, count: int, ping: Ping) -> bytes:
+    return PING_HEADER.pack(
+        message_type,
+        PROTOCOL_VERSION,
+        count,
+        ping.sequence & 0xFFFFFFFF,
+        ping.depth,
+        ping.temperature,
+        ping.drive_voltage,
+        ping.resolution,
+    )
+
+
+def encode_ping(ping: Ping) -> bytes:
+    return encode_header(MESSAGE_PING, len(ping.samples), ping) + ping.samples.tobytes()
+
+
+def encode_column(ping: Ping, column: np.ndarray) -> bytes:
+    """Encode a rendered column, (height,) colormap indices or (height, 4) RGBA."""
+    message_type = MESSAGE_COLUMN_RGBA if column.ndim == 2 else MESSAGE_COLUMN_INDEX
+    return encode_header(message_type, len(column), ping) + column.tobytes()
+
+
+def encode_history(window: HistoryWindow) -> bytes:
+    columns, rows = window.samples.shape
+    header = HISTORY_HEADER.pack(
+        MESSAGE_HISTORY, PROTOCOL_VERSION, columns, rows, window.level, window.start, window.end, window.resolution
+    )
+    return header + window.depths.tobytes() + window.samples.tobytes()
+
+
+def encode_snapshot(samples: np.ndarray, depths: np.ndarray, sequence: int, resolution: float) -> bytes:
+    """`samples` holds one (possibly pooled) row per ping, `sequence` is that of the first."""
+    header = SNAPSHOT_HEADER.pack(
+        MESSAGE_SNAPSHOT,
+        PROTOCOL_VERSION,
+        samples.shape[0],
+        samples.shape[1],
+        sequence & 0xFFFFFFFF,
+        resolution,
+    )
+    return header + depths.astype(np.float32).tobytes() + np.ascontiguousarray(samples).tobytes()
+
+
+def encode_ping_json(ping: Ping) -> str:
+    return json.dumps({
+        "spectrogram": ping.samples.tolist(),
+        "measured_depth": ping.depth,
+        "temperature": ping.temperature,
+        "drive_voltage": ping.drive_voltage,
+        "resolution": ping.resolution,
+        "sequence": ping.sequence,
+    })
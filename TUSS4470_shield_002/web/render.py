@@ -0,0 +1,145 @@
+"""Server-side rendering of waterfall columns.
+
+Weak clients can ask the server to do the per-pixel work: every ping is resampled
+to the client's canvas height, auto-gained and either colored with the
+configured colormap (RGBA) or sent as gain-scaled uint8 indices into the
+client's colormap. The browser then only has to blit one column per ping.
+
+Clients that render themselves can still subscribe to a view: the depth range
+they show and their canvas height. They then get only the samples within that
+range, max-pooled down to about one sample per pixel row, instead of all of them.
+"""
+
+from dataclasses import dataclass, replace
+from enum import StrEnum
+from functools import lru_cache
+import json
+import math
+from pathlib import Path
+
+import numpy as np
+
+from echo import Ping
+
+COLORMAP_FILE = Path(__file__).parent / "static" / "js-colormaps.js"
+GAIN_ALPHA = 0.05  # weight of the newest ping in the running mean/variance
+MAX_HEIGHT = 4096
+
+
+class RenderMode(StrEnum):
+    RAW = "raw"  # raw samples, rendered by the browser
+    RGBA = "rgba"  # colored column, 4 bytes per pixel
+    INDEX = "index"  # gain-scaled colormap index, 1 byte per pixel
+
+
+@dataclass(frozen=True, slots=True)
+class RenderRequest:
+    mode: RenderMode
+    height: int  # canvas height in pixels
+    samples: int  # number of samples visible over that height
+
+    @classmethod
+    def from_options(cls, options: dict) -> "RenderRequest":
+        """Validate a subscription message sent by the browser."""
+        mode = RenderMode(options.get("render", RenderMode.RAW))
+        height = int(options.get("height", 0))
+        samples = int(options.get("samples", 0))
+        if mode is not RenderMode.RAW and not (0 < height <= MAX_HEIGHT and samples > 0):
+            raise ValueError(f"Invalid render request: {options}")
+        return cls(mode, height, samples)
+
+
+@dataclass(frozen=True, slots=True)
+class ViewRequest:
+    range: float  # meters shown from the top of the canvas
+    height: int  # canvas height in pixels
+
+    @classmethod
+    def from_options(cls, options: dict) -> "ViewRequest":
+        """Validate a view subscription sent by the browser."""
+        view = options["view"]
+        request = cls(float(view["range"]), int(view["height"]))
+        if not (0 < request.range < math.inf and 0 < request.height <= MAX_HEIGHT):
+            raise ValueError(f"Invalid view request: {options}")
+        return request
+
+    def window(self, resolution: float, num_samples: int) -> tuple[int, int]:
+        """Number of samples within the range and the max-pooling factor for this ping."""
+        samples = max(1, min(math.ceil(self.range * 100 / resolution), num_samples))
+        return samples, max(1, math.ceil(samples / self.height))
+
+
+def pool_ping(ping: Ping, samples: int, factor: int) -> Ping:
+    """The first `samples` samples of `ping`, reduced to the maximum of every `factor`."""
+    if factor == 1:
+        return ping if samples == len(ping.samples) else replace(ping, samples=ping.samples[:samples])
+    # One np.maximum per position in a block; np.max over a short last axis is much slower
+    pooled = ping.samples[0:samples:factor].copy()
+    for offset in range(1, factor):
+        part = ping.samples[offset:samples:factor]
+        np.maximum(pooled[: len(part)], part, out=pooled[: len(part)])
+    return replace(ping, samples=pooled, resolution=ping.resolution * factor)
+
+
+@lru_cache(maxsize=None)
+def colormap_lut(name: str) -> np.ndarray:
+    """256 x RGBA lookup table for `name`, using the same data and interpolation as js-colormaps.js."""
+    source = COLORMAP_FILE.read_text(encoding="utf-8")
+    start = source.index("{", source.index("const data"))
+    end = source.index("\n", start)
+    colors = np.array(json.loads(source[start:end].rstrip().rstrip(";"))[name]["colors"])
+
+    x = np.linspace(0.0, 1.0, 256) * (len(colors) - 1)
+    lo = np.floor(x).astype(int)
+    hi = np.ceil(x).astype(int)
+    rgb = np.round((colors[lo] + colors[hi]) / 2 * 255)
+
+    lut = np.full((256, 4), 255, dtype=np.uint8)
+    lut[:, :3] = rgb
+    return lut
+
+
+@lru_cache(maxsize=64)
+def row_indices(height: int, samples: int) -> np.ndarray:
+    """Sample index shown in each pixel row, matching `yPixelToSampleIdx` in spectrogram.js."""
+    y = np.arange(height)
+    return np.clip((y * samples) // max(height - 1, 1), 0, samples - 1)
+
+
+class ColumnRenderer:
+    def __init__(self, colormap: str = "viridis"):
+        self.lut = colormap_lut(colormap)
+        self._mean = None
+        self._mean_sq = None
+        self._gain_table = np.arange(256, dtype=np.uint8)
+
+    def update(self, ping: Ping):
+        """Update the auto gain with a new ping. Call once per ping before `column()`."""
+        samples = ping.samples
+        mean = float(samples.mean())
+        mean_sq = float(np.dot(samples, samples.astype(np.float64))) / len(samples)  # uint8 products would wrap
+        if self._mean is None:
+            self._mean, self._mean_sq = mean, mean_sq
+        else:
+            self._mean += GAIN_ALPHA * (mean - self._mean)
+            self._mean_sq += GAIN_ALPHA * (mean_sq - self._mean_sq)
+
+        # Same scaling as the browser: mean ± 2σ mapped to the full colormap
+        sigma = max(self._mean_sq - self._mean**2, 0.0) ** 0.5
+        low = self._mean - 2 * sigma
+        high = self._mean + 2 * sigma
+        scaled = (np.arange(256) - low) / max(high - low, 1e-6)
+        self._gain_table = np.clip(np.round(scaled * 255), 0, 255).astype(np.uint8)
+
+    def column(self, ping: Ping, request: RenderRequest) -> np.ndarray:
+        """Render one ping as an (height,) index or (height, 4) RGBA column."""
+        samples = ping.samples
+        indices = row_indices(request.height, request.samples)
+        values = np.zeros(request.height, dtype=np.uint8)
+        visible = indices < len(samples)
+        values[visible] = samples[indices[visible]]
+
+        scaled = self._gain_table[values]
+        if request.mode is RenderMode.INDEX:
+            return scaled
+        return self.lut[scaled]
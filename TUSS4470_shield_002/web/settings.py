@@ -1,7 +1,9 @@
 from enum import StrEnum
 from typing import Annotated
 from echo import ConnectionTypeEnum
-from pydantic import BaseModel, Field, field_validator, PlainSerializer
+from bottom import DEFAULT_PULSE_SAMPLES
+from processing import StackMode
+from pydantic import BaseModel, Field, field_validator, model_validator, PlainSerializer
 
 
 class Medium(StrEnum):
@@ -15,6 +17,11 @@ class NMEAOffset(StrEnum):
     ToTransducer = "to_transducer"
 
 
+class DepthSource(StrEnum):
+    FIRMWARE = "firmware"  # depth index reported by the sounder
+    HOST = "host"  # bottom.py BottomDetector on the samples
+
+
 speed_of_sound_map = {
     Medium.WATER: 1480,  # meters per second in water
     Medium.AIR: 330,  # meters per second in air
@@ -24,20 +31,44 @@ speed_of_sound_map = {
 class Settings(BaseModel):
     connection_type: Annotated[ConnectionTypeEnum, PlainSerializer(lambda v: v.name, return_type=str)] | None = None
     udp_port: int = 9999
+    udp_multicast_group: str | None = None  # e.g. 239.255.0.1 with `UART_UDP_relay.py --multicast`
+    bus_name: str = "openecho"  # shared memory bus of `echo_bus.py serve`
     serial_port: str = "init"
     baud_rate: int = 250000
     num_samples: int = 1800
     colormap: str = "viridis"
+    history_pings: int = Field(default=12000, ge=0)  # pings kept for /history, 0 = off
     transducer_depth: float = Field(default=0.0, ge=0)
     draft: float = Field(default=0.0, ge=0)
     depth_output_enable: bool = False
     medium: Medium = Medium.WATER
+    depth_source: DepthSource = DepthSource.FIRMWARE
+    blind_zone: int = Field(default=450, ge=0)  # samples ignored by the host bottom detector
+    processing_tvg_spreading: float = Field(default=0.0, ge=0)  # dB per decade of range, e.g. 20 or 40
+    processing_tvg_absorption: float = Field(default=0.0, ge=0)  # dB per meter
+    processing_smoothing: int = Field(default=1, ge=1)  # samples
+    processing_stack: int = Field(default=1, ge=1)  # pings
+    processing_stack_mode: StackMode = StackMode.RUNNING
+    processing_decimation: int = Field(default=1, ge=1)  # samples combined into one
+    offload_enable: bool = False  # decode and process pings in a worker process
     signalk_enable: bool = False
     signalk_address: str = "localhost:3000"
     nmea_enable: bool = False
     nmea_address: str = "localhost:10110"
     nmea_offset: NMEAOffset | None = None
     signalk_token: str | None = None
+    signalk_max_rate: float = Field(default=5.0, gt=0)  # sends per second
+    signalk_min_change: float = Field(default=0.0, ge=0)  # meters
+    nmea_max_rate: float = Field(default=5.0, gt=0)
+    nmea_min_change: float = Field(default=0.0, ge=0)
+    replay_path: str = "recordings"
+    replay_speed: float = Field(default=1.0, ge=0)  # 0 replays as fast as possible
+    replay_start: float | None = None  # UNIX time to start the replay at
+    replay_loop: bool = False
+    recording_enable: bool = False
+    recording_directory: str = "recordings"
+    recording_max_megabytes: int = Field(default=256, gt=0)
+    recording_max_minutes: int = Field(default=60, gt=0)
 
     @field_validator("connection_type", mode="before")
     def parse_connection_type(cls, v):
@@ -63,6 +94,16 @@ class Settings(BaseModel):
             raise ValueError(f"Colormap must be one of {allowed}")
         return v
 
+    @model_validator(mode="after")
+    def validate_blind_zone(self):
+        # BottomDetector needs at least a pulse length of samples past the blind zone
+        if self.depth_source == DepthSource.HOST and self.blind_zone >= self.num_samples - DEFAULT_PULSE_SAMPLES:
+            raise ValueError(
+                f"Blind zone must be smaller than {self.num_samples - DEFAULT_PULSE_SAMPLES} samples "
+                f"with {self.num_samples} samples per ping"
+            )
+        return self
+
     @property
     def resolution(self):
         """Calculate resolution based on medium and dynamic resolution setting."""
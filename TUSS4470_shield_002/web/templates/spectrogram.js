@@ -17,7 +17,17 @@ let ySamples = Math.max(1, Math.floor(yRange / metersPerRow));
 let measuredDepth = 0;
 let maxMeasuredDepth = 0;
 let maxValue = 0;
-let ctx, imageData;
+let ctx, columnImage;
+
+// Binary frames by default, `?format=json` on the page URL selects the JSON fallback
+const pageParams = new URLSearchParams(window.location.search);
+const wsFormat = pageParams.get('format') === 'json' ? 'json' : 'binary';
+// `?render=rgba` or `?render=index` lets the server resample, gain and color each column
+const renderMode = wsFormat === 'binary' && ['rgba', 'index'].includes(pageParams.get('render')) ? pageParams.get('render') : 'raw';
+// Which sounder to show when several are connected, see devices.py
+const device = pageParams.get('device') || '{{ device }}';
+let ws = null;
+let lastViewRequest = null; // last view subscription sent, see sendRenderRequest()
 
 class RunningStats {
   constructor() {
@@ -56,7 +66,9 @@ function resizeCanvases() {
     width = canvas.width;
     height = canvas.height;
     ctx = canvas.getContext('2d');
-    imageData = ctx.createImageData(width, height);
+    // Only the newest column is written per ping, the rest of the canvas is scrolled
+    columnImage = ctx.createImageData(1, height);
+    sendRenderRequest();
 }
 window.addEventListener('resize', resizeCanvases);
 resizeCanvases();
@@ -68,7 +80,7 @@ resizeCanvases();
 function updateSampleResolution(newResolution) {
     sample_resolution = newResolution;
     metersPerRow = sample_resolution / 100;
-    ySamples = Math.max(1, Math.floor(yRange / metersPerRow));
+    setYSamples(Math.max(1, Math.floor(yRange / metersPerRow)));
 }
 
 /**
@@ -78,7 +90,18 @@ function updateSampleResolution(newResolution) {
 function updateVisualRange(newYRangeIndex) {
     yRangeIndex = newYRangeIndex;
     yRange = yRanges[yRangeIndex];
-    ySamples = Math.max(1, Math.floor(yRange / metersPerRow));
+    setYSamples(Math.max(1, Math.floor(yRange / metersPerRow)));
+    sendRenderRequest();
+}
+
+/**
+ * Update the number of visible samples, server-rendered columns have to follow.
+ * @param {number} newYSamples
+ */
+function setYSamples(newYSamples) {
+    if (newYSamples === ySamples) return;
+    ySamples = newYSamples;
+    sendRenderRequest();
 }
 
 // --- Mapping utilities ---
@@ -156,71 +179,221 @@ canvas.addEventListener('mouseleave', function () {
 });
 
 // --- Spectrogram rendering ---
+// Colormap evaluated once into a 256-entry RGBA lookup table
+const colormapLut = new Uint8ClampedArray(256 * 4);
+for (let i = 0; i < 256; i++) {
+    const [r, g, b] = evaluate_cmap(i / 255, "{{ settings.colormap }}");
+    colormapLut.set([r, g, b, 255], i * 4);
+}
+
+function copyLutColor(data, i, index) {
+    const c = index * 4;
+    data[i] = colormapLut[c];
+    data[i + 1] = colormapLut[c + 1];
+    data[i + 2] = colormapLut[c + 2];
+    data[i + 3] = 255;
+}
+
 /**
- * Automatic gain adjustment: scale value using mean and std of most recent column.
+ * Automatic gain adjustment: scale value using the running mean and std.
  * @param {number} value
- * @returns {Array} RGB color
+ * @returns {number} colormap index
  */
-function getColor(value) {
+function getColorIndex(value) {
     // Center and scale value
     let high = runningStats.meanValue() + 2 * runningStats.stdValue();
     let low = runningStats.meanValue() - 2 * runningStats.stdValue();
     let scaled = (value - low) / (high - low);
     // Clamp to [0,1]
     scaled = Math.max(0, Math.min(1, scaled));
-    return evaluate_cmap(scaled, "{{ settings.colormap }}");
+    return Math.round(scaled * 255);
 }
 
-function shiftLeft(imageData) {
-    const { data, width, height } = imageData;
+/**
+ * Scroll the canvas one pixel left, draw the prepared column at the right edge
+ * and mark the measured depth on it.
+ * @param {number} depth
+ */
+function drawColumn(depth) {
+    const data = columnImage.data;
     for (let y = 0; y < height; y++) {
-        for (let x = 0; x < width - 1; x++) {
-            const i = (y * width + x) * 4;
-            const j = (y * width + (x + 1)) * 4;
-            data[i] = data[j];
-            data[i + 1] = data[j + 1];
-            data[i + 2] = data[j + 2];
-            data[i + 3] = data[j + 3];
+        const sampleDepth = sampleIdxToDepth(yPixelToSampleIdx(y));
+        if (Math.abs(depth - sampleDepth) < metersPerRow * 1.5) {
+            data.set([255, 0, 0, 255], y * 4);
         }
     }
+    ctx.drawImage(canvas, -1, 0);
+    ctx.putImageData(columnImage, width - 1, 0);
+    updateAxisLabels(depth);
 }
 
-let sum = 0;
-let count = 0;
-let diff_squared = 0;
-
 function insertColumn(values, depth) {
     // Compute mean and std for automatic gain adjustment
-    const valid = values.filter(v => typeof v === 'number');
-    if (valid.length > 0) {
-        runningStats.pushArray(valid);
-    }
-    shiftLeft(imageData);
-    const x = width - 1;
+    runningStats.pushArray(values);
+    const data = columnImage.data;
     for (let y = 0; y < height; y++) {
-        const sampleIdx = yPixelToSampleIdx(y);
-        const value = values[sampleIdx] ?? 0;
-        const [r, g, b] = getColor(value);
-        const i = (y * width + x) * 4;
-        const sampleDepth = sampleIdxToDepth(sampleIdx);
-        if (Math.abs(depth - sampleDepth) < metersPerRow * 1.5) {
-            imageData.data[i] = 255;
-            imageData.data[i + 1] = 0;
-            imageData.data[i + 2] = 0;
-            imageData.data[i + 3] = 255;
-        } else {
-            imageData.data[i] = r;
-            imageData.data[i + 1] = g;
-            imageData.data[i + 2] = b;
-            imageData.data[i + 3] = 255;
+        const value = values[yPixelToSampleIdx(y)] ?? 0;
+        copyLutColor(data, y * 4, getColorIndex(value));
+    }
+    drawColumn(depth);
+}
+
+/**
+ * Insert a column rendered by the server, see render.py.
+ * @param {Uint8Array} pixels RGBA bytes or colormap indices, one entry per pixel row
+ * @param {boolean} indexed
+ * @param {number} depth
+ */
+function insertRenderedColumn(pixels, indexed, depth) {
+    const data = columnImage.data;
+    data.fill(0);
+    if (indexed) {
+        const rows = Math.min(height, pixels.length);
+        for (let y = 0; y < rows; y++) {
+            copyLutColor(data, y * 4, pixels[y]);
         }
+    } else {
+        data.set(pixels.subarray(0, Math.min(data.length, pixels.length)));
     }
-    ctx.putImageData(imageData, 0, 0);
-    updateAxisLabels(depth);
+    drawColumn(depth);
 }
 
 // --- WebSocket connection and events ---
-const ws = new WebSocket('ws://' + window.location.host + '/ws');
+const RECONNECT_MIN_DELAY = 500; // ms, doubled after every failed attempt
+const RECONNECT_MAX_DELAY = 10000;
+let reconnectDelay = RECONNECT_MIN_DELAY;
+
+function connect() {
+    // Binary clients ask for the recent pings of a full canvas, so the waterfall is filled at once
+    const snapshotParams = wsFormat === 'binary' ? '&snapshot=' + width + '&height=' + height : '';
+    ws = new WebSocket('ws://' + window.location.host + '/ws?format=' + wsFormat + '&device=' + encodeURIComponent(device) + snapshotParams);
+    ws.binaryType = 'arraybuffer';
+    ws.onopen = () => {
+        reconnectDelay = RECONNECT_MIN_DELAY;
+        lastViewRequest = null; // The new connection has no view subscription yet
+        sendRenderRequest();
+    };
+    ws.onmessage = handleMessage;
+    ws.onerror = (e) => console.error('WebSocket error:', e);
+    ws.onclose = () => {
+        console.warn('WebSocket closed, reconnecting in ' + reconnectDelay + ' ms');
+        setTimeout(connect, reconnectDelay);
+        reconnectDelay = Math.min(2 * reconnectDelay, RECONNECT_MAX_DELAY);
+    };
+}
+
+/**
+ * Tell the server the canvas height and visible samples to render columns for.
+ * Raw clients subscribe to their visible depth range instead, the server then
+ * only sends the samples within it, max-pooled to about one per pixel row.
+ */
+function sendRenderRequest() {
+    if (!ws || ws.readyState !== WebSocket.OPEN) return;
+    if (renderMode === 'raw') {
+        const request = JSON.stringify({ view: { range: yRange, height: height } });
+        if (request === lastViewRequest) return;
+        lastViewRequest = request;
+        ws.send(request);
+        return;
+    }
+    ws.send(JSON.stringify({ render: renderMode, height: height, samples: ySamples }));
+}
+
+// Binary message layout, see protocol.py
+const MESSAGE_PING = 1;
+const MESSAGE_COLUMN_RGBA = 2;
+const MESSAGE_COLUMN_INDEX = 3;
+const MESSAGE_SNAPSHOT = 5;
+const PING_HEADER_SIZE = 24;
+const SNAPSHOT_HEADER_SIZE = 16;
+
+/**
+ * Decode a binary message into the same shape as the JSON messages. Column
+ * messages carry `column` and `indexed` instead of `spectrogram`.
+ * @param {ArrayBuffer} buffer
+ * @returns {Object|null}
+ */
+function decodePing(buffer) {
+    const view = new DataView(buffer);
+    const type = view.getUint8(0);
+    const count = view.getUint16(2, true);
+    const data = {
+        sequence: view.getUint32(4, true),
+        measured_depth: view.getFloat32(8, true),
+        temperature: view.getFloat32(12, true),
+        drive_voltage: view.getFloat32(16, true),
+        resolution: view.getFloat32(20, true),
+    };
+    if (type === MESSAGE_PING) {
+        data.spectrogram = new Uint8Array(buffer, PING_HEADER_SIZE, count);
+    } else if (type === MESSAGE_COLUMN_RGBA) {
+        data.column = new Uint8Array(buffer, PING_HEADER_SIZE, count * 4);
+        data.indexed = false;
+    } else if (type === MESSAGE_COLUMN_INDEX) {
+        data.column = new Uint8Array(buffer, PING_HEADER_SIZE, count);
+        data.indexed = true;
+    } else {
+        return null;
+    }
+    return data;
+}
+
+/**
+ * Decode the snapshot of recent pings sent right after connecting.
+ * @param {ArrayBuffer} buffer
+ * @returns {Object}
+ */
+function decodeSnapshot(buffer) {
+    const view = new DataView(buffer);
+    const count = view.getUint16(2, true);
+    const rows = view.getUint16(4, true);
+    return {
+        count: count,
+        rows: rows,
+        resolution: view.getFloat32(12, true),
+        depths: new Float32Array(buffer, SNAPSHOT_HEADER_SIZE, count),
+        samples: new Uint8Array(buffer, SNAPSHOT_HEADER_SIZE + 4 * count, count * rows),
+    };
+}
+
+/**
+ * Draw all pings of a snapshot with a single scroll of the canvas.
+ * @param {Object} snapshot
+ */
+function insertSnapshot(snapshot) {
+    if (!snapshot.count) return;
+    for (const depth of snapshot.depths) {
+        if (depth > maxMeasuredDepth) maxMeasuredDepth = depth;
+    }
+    updateSampleResolution(snapshot.resolution);
+    updateYRange();
+    runningStats.pushArray(snapshot.samples);
+
+    const columns = Math.min(snapshot.count, width);
+    const first = snapshot.count - columns;
+    const image = ctx.createImageData(columns, height);
+    const data = image.data;
+    const rowSamples = new Int32Array(height);
+    for (let y = 0; y < height; y++) {
+        rowSamples[y] = yPixelToSampleIdx(y);
+    }
+    for (let x = 0; x < columns; x++) {
+        const offset = (first + x) * snapshot.rows;
+        const depth = snapshot.depths[first + x];
+        for (let y = 0; y < height; y++) {
+            const i = (y * columns + x) * 4;
+            if (Math.abs(depth - sampleIdxToDepth(rowSamples[y])) < metersPerRow * 1.5) {
+                data.set([255, 0, 0, 255], i);
+            } else {
+                const value = rowSamples[y] < snapshot.rows ? snapshot.samples[offset + rowSamples[y]] : 0;
+                copyLutColor(data, i, getColorIndex(value));
+            }
+        }
+    }
+    ctx.drawImage(canvas, -columns, 0);
+    ctx.putImageData(image, width - columns, 0);
+    updateAxisLabels(snapshot.depths[snapshot.count - 1]);
+}
 
 // let lastSampleTime = null;
 // let sampleIntervalMs = 100; // Default to 10Hz
@@ -241,18 +414,26 @@ const ws = new WebSocket('ws://' + window.location.host + '/ws');
 //     }
 // }
 
-ws.onmessage = (event) => {
+function handleMessage(event) {
     // updateSampleRate();
-    const data = JSON.parse(event.data);
+    if (event.data instanceof ArrayBuffer && new DataView(event.data).getUint8(0) === MESSAGE_SNAPSHOT) {
+        insertSnapshot(decodeSnapshot(event.data));
+        return;
+    }
+    const data = event.data instanceof ArrayBuffer ? decodePing(event.data) : JSON.parse(event.data);
+    if (!data) return;
     if (data.measured_depth > maxMeasuredDepth) {
         maxMeasuredDepth = data.measured_depth;
     }
     updateSampleResolution(data.resolution);
     updateYRange();
-    insertColumn(data.spectrogram, data.measured_depth);
-};
-ws.onerror = (e) => console.error('WebSocket error:', e);
-ws.onclose = () => console.warn('WebSocket closed');
+    if (data.column) {
+        insertRenderedColumn(data.column, data.indexed, data.measured_depth);
+    } else {
+        insertColumn(data.spectrogram, data.measured_depth);
+    }
+}
+connect();
 
 // --- Y-axis range logic ---
 function updateYRange() {
@@ -322,4 +503,26 @@ document.getElementById('zoom-out').addEventListener('click', function () {
         updateYRangeLabel();
         updateAxisLabels();
     }
-});
\ No newline at end of file
+});
+
+// --- UDP link quality, only shown when the relay sends sequence numbers ---
+const LINK_POLL_INTERVAL = 2000; // ms
+const linkLabel = document.getElementById('link-label');
+
+async function updateLinkLabel() {
+    try {
+        const response = await fetch('/stats');
+        const stats = (await response.json()).devices[device];
+        const link = stats && stats.echo_reader.link;
+        if (!link || !link.received) {
+            linkLabel.hidden = true;
+            return;
+        }
+        linkLabel.textContent = `Link: loss ${(link.loss * 100).toFixed(1)}%` +
+            `, reordered ${link.reordered}, dup ${link.duplicates}, jitter ${link.jitter_ms.toFixed(1)} ms`;
+        linkLabel.hidden = false;
+    } catch (e) {
+        linkLabel.hidden = true;
+    }
+}
+setInterval(updateLinkLabel, LINK_POLL_INTERVAL);